@@ -1,25 +1,3991 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-# Function: 用于处理 COM3D2 MOD 文件的 GUI 工具
+# Function: 用于处理 COM3D2 MOD 文件的 GUI 工具（带参数运行时为命令行模式）
 # Author: Claude Sonnet 4.5 & 90135
 # Creation date: 2025-05-30
-# Version: 2025-11-21
+# Version: 2026-10-18
 # License: BSD-3
 
 import os
+import re
 import sys
+import csv
+import json
+import mmap
+import time
+import queue
+import select
+import struct
+import hashlib
+import unicodedata
+import fnmatch
+import logging
 import threading
-import tkinter as tk
-from tkinter import filedialog, ttk, messagebox, scrolledtext
+import shutil
+import tempfile
+import contextlib
+import itertools
 import subprocess
+from array import array
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict, deque
+from decimal import Decimal
+from logging.handlers import RotatingFileHandler
 
+# tkinter 只在启动图形界面时导入，命令行模式不需要图形环境
+tk = ttk = filedialog = messagebox = scrolledtext = None
 
-class COM3D2ToolGUI(tk.Tk):
+
+def _load_tkinter():
+    """导入 tkinter（启动图形界面前调用）"""
+    global tk, ttk, filedialog, messagebox, scrolledtext
+    import tkinter
+    from tkinter import filedialog as _filedialog, ttk as _ttk, messagebox as _messagebox, scrolledtext as _scrolledtext
+    tk, ttk, filedialog, messagebox, scrolledtext = tkinter, _ttk, _filedialog, _messagebox, _scrolledtext
+
+
+def _default_cache_dir():
+    """本工具的缓存目录（Windows 下位于 %LOCALAPPDATA%，其他系统位于 ~/.cache）"""
+    base = (os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME")
+            or os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(base, "COM3D2_Tools_901")
+
+
+def _file_digest(path):
+    """文件内容的 BLAKE2b 哈希"""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ContentCache:
+    """以内容哈希为键的磁盘缓存，按总大小做 LRU 淘汰
+    
+    每个条目是缓存目录下的一个文件，索引记录在 index.json 中。
+    另外记录 (路径, 大小, 修改时间) -> 内容哈希，文件未变化时无需重新读取计算哈希。
+    """
+    INDEX_NAME = "index.json"
+    MAX_STAT_ENTRIES = 200000
+    
+    def __init__(self, root, max_bytes=1024 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._entries = OrderedDict()  # 键 -> 大小，按最近使用排序（最旧的在前）
+        self._file_hashes = OrderedDict()  # 绝对路径 -> [大小, 修改时间, 哈希]
+        self._total_bytes = 0
+        self._load()
+    
+    def _load(self):
+        """读取索引，索引损坏时视为空缓存"""
+        try:
+            with open(os.path.join(self.root, self.INDEX_NAME), 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            for key, size in index.get("entries", []):
+                self._entries[key] = size
+                self._total_bytes += size
+            for path, size, mtime, digest in index.get("files", []):
+                self._file_hashes[path] = [size, mtime, digest]
+        except (OSError, ValueError, TypeError):
+            self._entries.clear()
+            self._file_hashes.clear()
+            self._total_bytes = 0
+    
+    def save(self):
+        """写入索引（先写临时文件再替换）
+        
+        并行的任务共用同一个缓存时可能同时保存，整个保存过程加锁，先取的快照不会覆盖后取的。
+        """
+        with self._save_lock:
+            with self._lock:
+                index = {
+                    "entries": list(self._entries.items()),
+                    "files": [[path] + info for path, info in self._file_hashes.items()],
+                }
+            os.makedirs(self.root, exist_ok=True)
+            _atomic_write_bytes(os.path.join(self.root, self.INDEX_NAME),
+                                json.dumps(index, ensure_ascii=False).encode('utf-8'))
+    
+    def clear(self):
+        """删除所有缓存内容"""
+        with self._lock:
+            self._entries.clear()
+            self._file_hashes.clear()
+            self._total_bytes = 0
+            self.hits = 0
+            self.misses = 0
+            shutil.rmtree(self.root, ignore_errors=True)
+    
+    @property
+    def total_bytes(self):
+        return self._total_bytes
+    
+    def file_hash(self, path):
+        """返回文件内容哈希，(路径, 大小, 修改时间) 未变化时直接使用记录的哈希"""
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        with self._lock:
+            info = self._file_hashes.get(path)
+            if info and info[0] == st.st_size and info[1] == st.st_mtime_ns:
+                self._file_hashes.move_to_end(path)
+                return info[2]
+        
+        digest = _file_digest(path)
+        
+        with self._lock:
+            self._file_hashes[path] = [st.st_size, st.st_mtime_ns, digest]
+            self._file_hashes.move_to_end(path)
+            while len(self._file_hashes) > self.MAX_STAT_ENTRIES:
+                self._file_hashes.popitem(last=False)
+        return digest
+    
+    def _blob_path(self, key):
+        return os.path.join(self.root, key[:2], key)
+    
+    def lookup(self, key):
+        """检查键是否已缓存，未命中时计入统计"""
+        with self._lock:
+            if key in self._entries:
+                return True
+            self.misses += 1
+            return False
+    
+    def fetch(self, key, dest_path):
+        """命中时把缓存内容复制到 dest_path 并返回 True"""
+        with self._lock:
+            hit = key in self._entries
+            if hit:
+                self._entries.move_to_end(key)
+        if hit:
+            try:
+                shutil.copyfile(self._blob_path(key), dest_path)
+                with self._lock:
+                    self.hits += 1
+                return True
+            except OSError:
+                # 条目已被其他线程淘汰或文件被手动删除
+                with self._lock:
+                    size = self._entries.pop(key, None)
+                    if size is not None:
+                        self._total_bytes -= size
+        with self._lock:
+            self.misses += 1
+        return False
+    
+    def get_bytes(self, key):
+        """命中时返回缓存内容，否则返回 None"""
+        with self._lock:
+            hit = key in self._entries
+            if hit:
+                self._entries.move_to_end(key)
+        if hit:
+            try:
+                with open(self._blob_path(key), 'rb') as f:
+                    data = f.read()
+                with self._lock:
+                    self.hits += 1
+                return data
+            except OSError:
+                with self._lock:
+                    size = self._entries.pop(key, None)
+                    if size is not None:
+                        self._total_bytes -= size
+        with self._lock:
+            self.misses += 1
+        return None
+    
+    def put(self, key, src_path):
+        """把 src_path 的内容存入缓存"""
+        self._store(key, lambda tmp_path: shutil.copyfile(src_path, tmp_path))
+    
+    def put_bytes(self, key, data):
+        """把 data 存入缓存"""
+        def write(tmp_path):
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+        self._store(key, write)
+    
+    def _store(self, key, write):
+        blob_path = self._blob_path(key)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        tmp_path = f"{blob_path}.{threading.get_ident()}.tmp"
+        write(tmp_path)
+        os.replace(tmp_path, blob_path)
+        size = os.path.getsize(blob_path)
+        
+        with self._lock:
+            old_size = self._entries.pop(key, None)
+            if old_size is not None:
+                self._total_bytes -= old_size
+            self._entries[key] = size
+            self._total_bytes += size
+            evicted = []
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                old_key, old_size = self._entries.popitem(last=False)
+                self._total_bytes -= old_size
+                evicted.append(old_key)
+        
+        for old_key in evicted:
+            try:
+                os.remove(self._blob_path(old_key))
+            except OSError:
+                pass
+
+
+class ContentCacheView:
+    """共用同一个 ContentCache 的任务各自的视图: 读写都交给共用的缓存，命中统计单独记录
+    
+    并行运行的任务不会互相清零或混入对方的命中次数，也不会改动共用缓存的大小上限。
+    """
+    
+    def __init__(self, cache):
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+    
+    def __getattr__(self, name):
+        return getattr(self.cache, name)
+    
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return hit
+    
+    def lookup(self, key):
+        return self.cache.lookup(key) or self._count(False)
+    
+    def fetch(self, key, dest_path):
+        return self._count(self.cache.fetch(key, dest_path))
+    
+    def get_bytes(self, key):
+        data = self.cache.get_bytes(key)
+        self._count(data is not None)
+        return data
+
+
+class NativeCodecError(Exception):
+    """内置编解码器无法处理该文件（格式不支持或无法逐字节还原）"""
+
+
+class _BinaryReader:
+    """按 C# BinaryReader 的规则读取小端二进制数据"""
+    
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+    
+    def _take(self, size):
+        end = self.pos + size
+        if end > len(self.data):
+            raise NativeCodecError("文件意外结束")
+        chunk = self.data[self.pos:end]
+        self.pos = end
+        return chunk
+    
+    def byte(self):
+        return self._take(1)[0]
+    
+    def bool(self):
+        value = self.byte()
+        if value > 1:
+            raise NativeCodecError(f"无效的布尔值: {value}")
+        return value == 1
+    
+    def int32(self):
+        return struct.unpack('<i', self._take(4))[0]
+    
+    def float32(self, count=1):
+        values = struct.unpack(f'<{count}f', self._take(4 * count))
+        for value in values:
+            if value != value or value in (float('inf'), float('-inf')):
+                raise NativeCodecError("浮点数为 NaN 或无穷大")
+        return values[0] if count == 1 else list(values)
+    
+    def string(self):
+        # 长度为 7-bit 变长整数，内容为 UTF-8
+        length = 0
+        shift = 0
+        while True:
+            b = self.byte()
+            length |= (b & 0x7F) << shift
+            shift += 7
+            if not b & 0x80:
+                break
+            if shift > 28:
+                raise NativeCodecError("字符串长度无效")
+        try:
+            return self._take(length).decode('utf-8')
+        except UnicodeDecodeError as e:
+            raise NativeCodecError(f"字符串不是有效的 UTF-8: {e}")
+    
+    def at_end(self):
+        return self.pos == len(self.data)
+
+
+class _BinaryWriter:
+    """按 C# BinaryWriter 的规则写入小端二进制数据"""
+    
+    def __init__(self):
+        self.parts = []
+    
+    def byte(self, value):
+        self.parts.append(struct.pack('<B', value))
+    
+    def bool(self, value):
+        self.byte(1 if value else 0)
+    
+    def int32(self, value):
+        self.parts.append(struct.pack('<i', value))
+    
+    def float32(self, *values):
+        self.parts.append(struct.pack(f'<{len(values)}f', *values))
+    
+    def string(self, value):
+        encoded = value.encode('utf-8')
+        length = len(encoded)
+        prefix = bytearray()
+        while length >= 0x80:
+            prefix.append((length & 0x7F) | 0x80)
+            length >>= 7
+        prefix.append(length)
+        self.parts.append(bytes(prefix))
+        self.parts.append(encoded)
+    
+    def getvalue(self):
+        return b''.join(self.parts)
+
+
+_GO_JSON_ESCAPES = {
+    '"': '\\"', '\\': '\\\\', '\n': '\\n', '\r': '\\r', '\t': '\\t', '\b': '\\b', '\f': '\\f',
+    '<': '\\u003c', '>': '\\u003e', '&': '\\u0026', '\u2028': '\\u2028', '\u2029': '\\u2029',
+}
+_GO_JSON_ESCAPE_RE = re.compile('[\x00-\x1f"\\\\<>&\u2028\u2029]')
+
+
+def _go_json_float32(value):
+    """按 Go encoding/json 的规则输出 float32 的最短十进制表示"""
+    if value == 0:
+        return "-0" if struct.pack('<f', value) != b'\x00\x00\x00\x00' else "0"
+    for precision in range(1, 10):
+        text = f"{value:.{precision}g}"
+        try:
+            if struct.unpack('<f', struct.pack('<f', float(text)))[0] == value:
+                break
+        except OverflowError:
+            # 接近 float32 上限时低精度的近似值会溢出
+            continue
+    number = Decimal(text)
+    if 1e-6 <= abs(value) < 1e21:
+        return format(number, 'f')
+    sign, digits, exponent = number.normalize().as_tuple()
+    mantissa = str(digits[0]) + ('.' + ''.join(map(str, digits[1:])) if len(digits) > 1 else '')
+    exponent += len(digits) - 1
+    # Go 会把 e-07 简化为 e-7，正指数保留两位
+    exponent_text = f"-{-exponent}" if exponent < 0 else f"+{exponent:02d}"
+    return f"{'-' if sign else ''}{mantissa}e{exponent_text}"
+
+
+def _go_json_dumps(obj):
+    """输出与 MeidoSerialization (Go json.Marshal) 相同的紧凑 JSON
+    
+    结构中的浮点数全部来自 float32 字段，按 float32 最短表示输出。
+    """
+    if isinstance(obj, dict):
+        return '{' + ','.join(f"{_go_json_dumps(k)}:{_go_json_dumps(v)}" for k, v in obj.items()) + '}'
+    if isinstance(obj, list):
+        return '[' + ','.join(_go_json_dumps(v) for v in obj) + ']'
+    if isinstance(obj, str):
+        return '"' + _GO_JSON_ESCAPE_RE.sub(
+            lambda m: _GO_JSON_ESCAPES.get(m.group(), f"\\u{ord(m.group()):04x}"), obj) + '"'
+    if isinstance(obj, bool):
+        return 'true' if obj else 'false'
+    if isinstance(obj, int):
+        return str(obj)
+    if isinstance(obj, float):
+        return _go_json_float32(obj)
+    if obj is None:
+        return 'null'
+    raise NativeCodecError(f"无法序列化的类型: {type(obj).__name__}")
+
+
+class NativeCodec:
+    """.mate / .menu 的内置读写，JSON 结构与 MeidoSerialization 一致
+    
+    解码时会把结果重新编码并与原始数据逐字节比较，不一致（例如遇到未知的
+    属性类型或非标准写法）时抛出 NativeCodecError，调用方应改用 MeidoSerialization。
+    """
+    FILE_TYPES = ('mate', 'menu')
+    
+    @classmethod
+    def supports(cls, file_path):
+        return os.path.splitext(file_path)[1].lstrip('.').lower() in cls.FILE_TYPES
+    
+    @classmethod
+    def decode(cls, file_type, data):
+        """二进制 -> 与 MeidoSerialization JSON 相同结构的对象"""
+        reader = _BinaryReader(data)
+        try:
+            obj = cls._read_mate(reader) if file_type == 'mate' else cls._read_menu(reader)
+        except struct.error as e:
+            raise NativeCodecError(str(e))
+        if not reader.at_end():
+            raise NativeCodecError("文件末尾存在多余数据")
+        if cls.encode(file_type, obj) != data:
+            raise NativeCodecError("无法逐字节还原")
+        return obj
+    
+    @classmethod
+    def encode(cls, file_type, obj):
+        """对象 -> 二进制"""
+        writer = _BinaryWriter()
+        try:
+            if file_type == 'mate':
+                cls._write_mate(writer, obj)
+            else:
+                cls._write_menu(writer, obj)
+        except (KeyError, TypeError, ValueError, IndexError, AttributeError,
+                OverflowError, struct.error) as e:
+            raise NativeCodecError(f"JSON 结构无效: {e!r}")
+        return writer.getvalue()
+    
+    @classmethod
+    def to_json(cls, file_type, data):
+        return _go_json_dumps(cls.decode(file_type, data))
+    
+    @classmethod
+    def from_json(cls, file_type, text):
+        try:
+            # "-0" 需要保留为负零，否则无法逐字节还原
+            obj = json.loads(text, parse_int=lambda t: -0.0 if t == "-0" else int(t))
+        except ValueError as e:
+            raise NativeCodecError(f"JSON 解析失败: {e}")
+        return cls.encode(file_type, obj)
+    
+    # .mate
+    
+    @staticmethod
+    def _read_mate(reader):
+        mate = {"Signature": reader.string(), "Version": reader.int32(), "Name": reader.string()}
+        if mate["Signature"] != "CM3D2_MATERIAL":
+            raise NativeCodecError(f"不是 .mate 文件: {mate['Signature']!r}")
+        material = {
+            "Name": reader.string(),
+            "ShaderName": reader.string(),
+            "ShaderFilename": reader.string(),
+            "Properties": [],
+        }
+        mate["Material"] = material
+        
+        while True:
+            type_name = reader.string()
+            if type_name == "end":
+                break
+            prop = {"TypeName": type_name}
+            if type_name == "keyword":
+                count = reader.int32()
+                prop["Count"] = count
+                prop["Keywords"] = [{"Key": reader.string(), "Value": reader.bool()} for _ in range(count)]
+            else:
+                prop["PropName"] = reader.string()
+                if type_name == "tex":
+                    sub_tag = reader.string()
+                    prop["SubTag"] = sub_tag
+                    if sub_tag in ("tex2d", "cube"):
+                        prop["Tex2D"] = {
+                            "Name": reader.string(),
+                            "Path": reader.string(),
+                            "Offset": reader.float32(2),
+                            "Scale": reader.float32(2),
+                        }
+                    elif sub_tag == "texRT":
+                        prop["TexRT"] = {"DiscardedStr1": reader.string(), "DiscardedStr2": reader.string()}
+                    elif sub_tag != "null":
+                        raise NativeCodecError(f"未知的 tex 子类型: {sub_tag!r}")
+                elif type_name == "col":
+                    prop["Color"] = reader.float32(4)
+                elif type_name == "vec":
+                    prop["Vector"] = reader.float32(4)
+                elif type_name in ("f", "range"):
+                    prop["Number"] = reader.float32()
+                elif type_name == "tex_offset":
+                    prop["OffsetX"], prop["OffsetY"] = reader.float32(2)
+                elif type_name == "tex_scale":
+                    prop["ScaleX"], prop["ScaleY"] = reader.float32(2)
+                else:
+                    raise NativeCodecError(f"未知的属性类型: {type_name!r}")
+            material["Properties"].append(prop)
+        return mate
+    
+    @staticmethod
+    def _write_mate(writer, mate):
+        writer.string(mate["Signature"])
+        writer.int32(mate["Version"])
+        writer.string(mate["Name"])
+        material = mate["Material"]
+        writer.string(material["Name"])
+        writer.string(material["ShaderName"])
+        writer.string(material["ShaderFilename"])
+        
+        for prop in material["Properties"]:
+            type_name = prop["TypeName"]
+            writer.string(type_name)
+            if type_name == "keyword":
+                writer.int32(len(prop["Keywords"]))
+                for keyword in prop["Keywords"]:
+                    writer.string(keyword["Key"])
+                    writer.bool(keyword["Value"])
+                continue
+            writer.string(prop["PropName"])
+            if type_name == "tex":
+                sub_tag = prop["SubTag"]
+                writer.string(sub_tag)
+                if sub_tag in ("tex2d", "cube"):
+                    tex = prop["Tex2D"]
+                    writer.string(tex["Name"])
+                    writer.string(tex["Path"])
+                    writer.float32(*tex["Offset"][:2], *tex["Scale"][:2])
+                elif sub_tag == "texRT":
+                    writer.string(prop["TexRT"]["DiscardedStr1"])
+                    writer.string(prop["TexRT"]["DiscardedStr2"])
+            elif type_name == "col":
+                writer.float32(*prop["Color"][:4])
+            elif type_name == "vec":
+                writer.float32(*prop["Vector"][:4])
+            elif type_name in ("f", "range"):
+                writer.float32(prop["Number"])
+            elif type_name == "tex_offset":
+                writer.float32(prop["OffsetX"], prop["OffsetY"])
+            elif type_name == "tex_scale":
+                writer.float32(prop["ScaleX"], prop["ScaleY"])
+            else:
+                raise NativeCodecError(f"未知的属性类型: {type_name!r}")
+        writer.string("end")
+    
+    # .menu
+    
+    @staticmethod
+    def _read_menu(reader):
+        menu = {"Signature": reader.string()}
+        if menu["Signature"] != "CM3D2_MENU":
+            raise NativeCodecError(f"不是 .menu 文件: {menu['Signature']!r}")
+        menu["Version"] = reader.int32()
+        menu["SrcFileName"] = reader.string()
+        menu["ItemName"] = reader.string()
+        menu["Category"] = reader.string()
+        menu["InfoText"] = reader.string()
+        menu["BodySize"] = reader.int32()
+        
+        commands = []
+        while True:
+            arg_count = reader.byte()
+            if arg_count == 0:
+                break
+            commands.append({"ArgCount": arg_count, "Args": [reader.string() for _ in range(arg_count)]})
+        menu["Commands"] = commands
+        return menu
+    
+    @staticmethod
+    def _write_menu(writer, menu):
+        # 命令部分先单独写出，以便计算 BodySize
+        body = _BinaryWriter()
+        for command in menu["Commands"]:
+            args = command["Args"]
+            body.byte(len(args))
+            for arg in args:
+                body.string(arg)
+        body.byte(0)
+        body = body.getvalue()
+        
+        writer.string(menu["Signature"])
+        writer.int32(menu["Version"])
+        writer.string(menu["SrcFileName"])
+        writer.string(menu["ItemName"])
+        writer.string(menu["Category"])
+        writer.string(menu["InfoText"])
+        writer.int32(len(body))
+        writer.parts.append(body)
+
+
+class KeywordReplacer:
+    """多条 查找->替换 规则，一次扫描完成全部替换
+    
+    所有查找内容编译为一个前缀树形式的正则表达式，同一位置取最长的匹配
+    （最左最长）。替换是同时进行的，不会连锁：同时有 a->b、b->c 时，
+    原文中的 a 只会变成 b。查找内容重复的规则只有第一条生效。
+    """
+    _END = ''
+    
+    def __init__(self, rules):
+        self.rules = [(search, replace) for search, replace in rules]
+        self.duplicates = []
+        self._index = {}
+        for index, (search, _) in enumerate(self.rules):
+            if not search:
+                raise ValueError(f"第 {index + 1} 条规则的查找内容为空")
+            if search in self._index:
+                self.duplicates.append(index)
+            else:
+                self._index[search] = index
+        
+        trie = {}
+        for search in self._index:
+            node = trie
+            for char in search:
+                node = node.setdefault(char, {})
+            node[self._END] = True
+        self._pattern = re.compile(self._trie_regex(trie)) if trie else None
+    
+    @classmethod
+    def _trie_regex(cls, node):
+        """前缀树 -> 正则。可选的后续部分使用贪婪匹配，因此同一位置优先匹配更长的规则"""
+        branches = []
+        for char in sorted(key for key in node if key != cls._END):
+            # 合并只有一个分支的链，减少嵌套
+            prefix = char
+            child = node[char]
+            while cls._END not in child and len(child) == 1:
+                (next_char, child), = child.items()
+                prefix += next_char
+            branches.append(re.escape(prefix) + cls._trie_regex(child))
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if cls._END in node:
+            body = f"(?:{body})?"
+        return body
+    
+    def replace(self, text):
+        """返回 (替换后的文本, 每条规则的命中次数列表)"""
+        hits = [0] * len(self.rules)
+        if self._pattern is None:
+            return text, hits
+        
+        def substitute(match):
+            index = self._index[match.group()]
+            hits[index] += 1
+            return self.rules[index][1]
+        
+        return self._pattern.sub(substitute, text), hits
+
+
+def load_replacement_rules(path):
+    """读取规则文件
+    
+    .json 文件为 [[查找, 替换], ...] 或 [{"search": ..., "replace": ...}, ...]；
+    其他文件每行一条 "查找<Tab>替换为"，空行和 # 开头的行会被忽略。
+    """
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        content = f.read()
+    
+    rules = []
+    if path.lower().endswith('.json'):
+        for item in json.loads(content):
+            if isinstance(item, dict):
+                rules.append((str(item["search"]), str(item.get("replace", ""))))
+            else:
+                rules.append((str(item[0]), str(item[1])))
+        return rules
+    
+    for line_no, line in enumerate(content.splitlines(), 1):
+        if not line.strip() or line.startswith('#'):
+            continue
+        if '\t' not in line:
+            raise ValueError(f"第 {line_no} 行缺少 Tab 分隔符: {line}")
+        search, replace = line.split('\t', 1)
+        rules.append((search, replace))
+    return rules
+
+
+def save_replacement_rules(path, rules):
+    """保存规则文件，格式同 load_replacement_rules"""
+    with open(path, 'w', encoding='utf-8') as f:
+        if path.lower().endswith('.json'):
+            json.dump([list(rule) for rule in rules], f, ensure_ascii=False, indent=2)
+            return
+        for search, replace in rules:
+            if '\t' in search or '\n' in search or '\t' in replace or '\n' in replace:
+                raise ValueError(f"规则中包含 Tab 或换行，请保存为 .json: {search}")
+            f.write(f"{search}\t{replace}\n")
+
+
+def _split_outside_quotes(text, separator):
+    """按分隔符拆分文本，双引号内的分隔符不拆分"""
+    parts = []
+    current = []
+    in_quotes = False
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char == '\\' and in_quotes and i + 1 < len(text):
+            current.append(text[i:i + 2])
+            i += 2
+            continue
+        if char == '"':
+            in_quotes = not in_quotes
+        if not in_quotes and text.startswith(separator, i):
+            parts.append(''.join(current))
+            current = []
+            i += len(separator)
+            continue
+        current.append(char)
+        i += 1
+    parts.append(''.join(current))
+    return parts
+
+
+def _parse_rule_value(text):
+    """规则中的值: 能按 JSON 解析的（数字、"字符串"、true 等）按 JSON，否则视为普通字符串"""
+    text = text.strip()
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class StructuredRule:
+    """一条结构化规则: 条件 -> 操作
+    
+    例如 "PropName == _MatcapValue -> Number = 0.7"、
+    "TypeName == col && PropName == _Color -> Color *= 0.9"。
+    条件和操作中的键相对于 JSON 中的同一个对象，可用 "." 访问子对象（如 Tex2D.Name）；
+    条件写 * 表示匹配所有对象。
+    """
+    ARROWS = ('->', '→')
+    CONDITION_RE = re.compile(r'^\s*([A-Za-z_][\w.]*)\s*(==|!=|>=|<=|~=|>|<)\s*(.*?)\s*$')
+    ACTION_RE = re.compile(r'^\s*([A-Za-z_][\w.]*)\s*(\+=|-=|\*=|/=|=)\s*(.*?)\s*$')
+    
+    def __init__(self, text):
+        self.text = text.strip()
+        for arrow in self.ARROWS:
+            if arrow in self.text:
+                condition_text, action_text = self.text.split(arrow, 1)
+                break
+        else:
+            raise ValueError(f"缺少 '->': {self.text}")
+        self.condition_text = condition_text.strip()
+        self.action_text = action_text.strip()
+        
+        self.conditions = []
+        if self.condition_text != '*':
+            for part in _split_outside_quotes(self.condition_text, '&&'):
+                match = self.CONDITION_RE.match(part)
+                if not match:
+                    raise ValueError(f"无法解析条件 '{part.strip()}': {self.text}")
+                path, op, value = match.groups()
+                self.conditions.append((path.split('.'), op, _parse_rule_value(value)))
+        
+        self.actions = []
+        for part in _split_outside_quotes(self.action_text, ';'):
+            if not part.strip():
+                continue
+            match = self.ACTION_RE.match(part)
+            if not match:
+                raise ValueError(f"无法解析操作 '{part.strip()}': {self.text}")
+            path, op, value = match.groups()
+            value = _parse_rule_value(value)
+            if op != '=' and not _is_number(value) and not (op == '+=' and isinstance(value, str)):
+                raise ValueError(f"'{op}' 需要数值: {self.text}")
+            if op == '/=' and value == 0:
+                raise ValueError(f"除数不能为 0: {self.text}")
+            self.actions.append((path.split('.'), op, value))
+        if not self.actions:
+            raise ValueError(f"缺少操作: {self.text}")
+    
+    @staticmethod
+    def _resolve(node, path):
+        """按路径找到 (所在对象, 键)，路径不存在时返回 None"""
+        for key in path[:-1]:
+            node = node.get(key) if isinstance(node, dict) else None
+            if node is None:
+                return None
+        if isinstance(node, dict) and path[-1] in node:
+            return node, path[-1]
+        return None
+    
+    def matches(self, node):
+        for path, op, expected in self.conditions:
+            found = self._resolve(node, path)
+            if found is None:
+                return False
+            value = found[0][found[1]]
+            if op == '==':
+                ok = value == expected and _is_number(value) == _is_number(expected)
+            elif op == '!=':
+                ok = not (value == expected and _is_number(value) == _is_number(expected))
+            elif op == '~=':
+                ok = isinstance(value, str) and str(expected) in value
+            elif _is_number(value) and _is_number(expected):
+                ok = {'>': value > expected, '>=': value >= expected,
+                      '<': value < expected, '<=': value <= expected}[op]
+            else:
+                ok = False
+            if not ok:
+                return False
+        return True
+    
+    @staticmethod
+    def _compute(current, op, operand):
+        """计算操作结果；数值列表（如 Color）逐个计算"""
+        if op == '=':
+            return operand
+        if isinstance(current, list):
+            return [StructuredRule._compute(item, op, operand) for item in current]
+        if op == '+=' and isinstance(current, str):
+            return current + str(operand)
+        if not _is_number(current):
+            return current
+        result = {'+=': lambda: current + operand, '-=': lambda: current - operand,
+                  '*=': lambda: current * operand, '/=': lambda: current / operand}[op]()
+        if isinstance(result, float):
+            if isinstance(current, int) and float(result).is_integer() and op != '/=':
+                return int(result)
+            # MOD 文件中的小数基本都是 float32，按 float32 的最短表示取整，避免 0.8399999999999999 这种写法。
+            # JSON 中的 0.1 读出来不是精确的 float32，只要它就是某个 float32 的最短表示就取整
+            try:
+                as_f32 = struct.unpack('<f', struct.pack('<f', result))[0]
+                if isinstance(current, int) or float(
+                        _go_json_float32(struct.unpack('<f', struct.pack('<f', current))[0])) == current:
+                    return float(_go_json_float32(as_f32))
+            except OverflowError:
+                pass
+        return result
+    
+    def apply(self, node):
+        """对已匹配的对象执行操作，返回是否有值发生变化"""
+        changed = False
+        for path, op, operand in self.actions:
+            found = self._resolve(node, path)
+            if found is None:
+                continue
+            container, key = found
+            current = container[key]
+            result = self._compute(current, op, operand)
+            if result != current or type(result) != type(current):
+                container[key] = result
+                changed = True
+        return changed
+
+
+class StructuredEditor:
+    """一组结构化规则: 每个 JSON 只解析一次，一次遍历中对每个对象依次尝试所有规则
+    
+    只有值确实改变时才重新生成 JSON。命中次数统计的是发生修改的对象数。
+    """
+    
+    def __init__(self, rules):
+        self.structured_rules = list(rules)
+        self.rules = [(rule.condition_text, rule.action_text) for rule in self.structured_rules]
+        self.duplicates = []
+    
+    @classmethod
+    def parse(cls, text):
+        """解析多行规则文本，空行和 # 开头的行会被忽略"""
+        rules = []
+        for line_no, line in enumerate(text.splitlines(), 1):
+            if not line.strip() or line.lstrip().startswith('#'):
+                continue
+            try:
+                rules.append(StructuredRule(line))
+            except ValueError as e:
+                raise ValueError(f"第 {line_no} 行: {str(e)}")
+        return cls(rules)
+    
+    def replace(self, text):
+        """返回 (新的 JSON 文本, 每条规则的命中次数)"""
+        hits = [0] * len(self.structured_rules)
+        # "-0" 按负零读取，重新生成 JSON 时不丢失符号
+        document = json.loads(text, parse_int=lambda t: -0.0 if t == "-0" else int(t))
+        stack = [document]
+        changed = False
+        while stack:
+            node = stack.pop()
+            if isinstance(node, dict):
+                for index, rule in enumerate(self.structured_rules):
+                    if rule.matches(node) and rule.apply(node):
+                        hits[index] += 1
+                        changed = True
+                stack.extend(value for value in node.values() if isinstance(value, (dict, list)))
+            elif isinstance(node, list):
+                stack.extend(value for value in node if isinstance(value, (dict, list)))
+        if not changed:
+            return text, hits
+        # 与内置转换的输出格式保持一致
+        return _go_json_dumps(document), hits
+
+
+class ContentRules:
+    """文本规则 + 结构化规则，先做文本替换再做结构化修改，接口与 KeywordReplacer 相同"""
+    
+    def __init__(self, replacer=None, editor=None):
+        self.parts = [part for part in (replacer, editor) if part is not None]
+        self.rules = []
+        self.duplicates = []
+        for part in self.parts:
+            self.duplicates.extend(len(self.rules) + index for index in part.duplicates)
+            self.rules.extend(part.rules)
+        self.has_structured = editor is not None
+    
+    def replace(self, text):
+        hits = []
+        for part in self.parts:
+            text, part_hits = part.replace(text)
+            hits.extend(part_hits)
+        return text, hits
+
+
+class KeywordPrefilter:
+    """转换前的快速筛选: 用 mmap 在文件的原始字节中搜索关键词，跳过不可能命中任何规则的文件
+    
+    这些 MOD 格式中的字符串以 UTF-8 原样保存，因此只要某条规则能命中转换后的 JSON，
+    它对应的"必然出现的字符串"（needle）就一定在原文件中。只有能确定这一点的规则才会
+    生成 needle；任何一条规则无法生成 needle 时不做筛选，保证不会漏掉文件。
+    """
+    # 字符串以 UTF-8 原样保存的二进制格式；其他格式（nei 加密、csv 等）始终正常处理
+    FILE_TYPES = ('menu', 'mate', 'pmat', 'col', 'phy', 'psk', 'anm', 'model', 'tex', 'preset')
+    
+    # 可能出现在 JSON 结构、键名、数字、true/false/null 或 Base64 数据中的字符
+    _STRUCTURAL = set('{}[],:"\\')
+    _KEY_CHARS = set('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789')
+    _NUMBER_CHARS = set('0123456789+-.eE')
+    _BASE64_CHARS = _KEY_CHARS | set('+/=')
+    # Go 的 json.Marshal 会转义这些字符，它们在 JSON 中的写法与原文件不同
+    _ESCAPED_BY_GO = set('<>&\u2028\u2029\ufffd')
+    
+    def __init__(self, needles):
+        self.needles = sorted(set(needles), key=len, reverse=True)
+        self._pattern = re.compile(b'|'.join(re.escape(needle) for needle in self.needles))
+    
+    @classmethod
+    def from_rules(cls, rules):
+        """根据 ContentRules 生成筛选器；有规则无法生成 needle 时返回 None"""
+        needles = []
+        for part in rules.parts:
+            if isinstance(part, StructuredEditor):
+                for rule in part.structured_rules:
+                    needle = cls._condition_needle(rule)
+                    if needle is None:
+                        return None
+                    needles.append(needle)
+            else:
+                for search, _ in part.rules:
+                    needle = cls._literal_needle(search)
+                    if needle is None:
+                        return None
+                    needles.append(needle)
+        return cls(needles) if needles else None
+    
+    @classmethod
+    def _usable(cls, value, quoted):
+        """值在原文件中是否一定以 UTF-8 原样出现"""
+        if not value or any(char < ' ' or char in cls._ESCAPED_BY_GO for char in value):
+            return False
+        # 整个值都由 Base64 字符组成时可能是 JSON 中编码后的二进制数据
+        if set(value) <= cls._BASE64_CHARS and (not quoted or len(value) % 4 == 0):
+            return False
+        return True
+    
+    @classmethod
+    def _literal_needle(cls, search):
+        """文本规则: 查找内容中完整的 JSON 字符串值，或者只可能出现在字符串值内部的关键词"""
+        if '"' not in search:
+            if any(char in cls._STRUCTURAL for char in search):
+                return None
+            # 只含字母数字的可能是键名，只含数字字符的可能在数字中
+            if set(search) <= cls._KEY_CHARS or set(search) <= cls._NUMBER_CHARS:
+                return None
+            return search.encode('utf-8') if cls._usable(search, False) else None
+        
+        best = None
+        # 从每个引号开始尝试（允许重叠），例如 Name":"hair_01" 中第二个引号才是值的开头
+        for match in re.finditer(r'(?=("((?:[^"\\]|\\.)*)"))', search):
+            token, content = match.group(1), match.group(2)
+            # 引号后紧跟结构字符时，这个引号可能是前一个字符串的结束引号
+            if not content or content[0] in ',:]}':
+                continue
+            start, end = match.start(), match.start() + len(token)
+            before = search[start - 1] if start else ''
+            after = search[end] if end < len(search) else ''
+            # 只有确定是值（而不是键名）时才使用
+            if before not in (':', '[') and after not in (',', ']', '}'):
+                continue
+            try:
+                value = json.loads(token)
+            except ValueError:
+                continue
+            if cls._usable(value, True) and (best is None or len(value) > len(best)):
+                best = value
+        return best.encode('utf-8') if best is not None else None
+    
+    @classmethod
+    def _condition_needle(cls, rule):
+        """结构化规则: 条件中 == 比较的字符串值必须出现在文件中"""
+        best = None
+        for _, op, expected in rule.conditions:
+            if op == '==' and isinstance(expected, str) and cls._usable(expected, True):
+                if best is None or len(expected) > len(best):
+                    best = expected
+        return best.encode('utf-8') if best is not None else None
+    
+    def may_match(self, path):
+        """文件可能包含任一 needle 时返回 True；无法判断时也返回 True"""
+        if os.path.splitext(path)[1].lstrip('.').lower() not in self.FILE_TYPES:
+            return True
+        try:
+            with open(path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return True
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    return self._pattern.search(data) is not None
+        except (OSError, ValueError):
+            return True
+
+
+def _split_patterns(text):
+    """把 "*.menu, *.mate; backup" 这样的输入拆分为模式列表"""
+    return [part.strip() for part in re.split(r'[,;]', text or '') if part.strip()]
+
+
+class FileFilter:
+    """预编译的文件筛选条件
+    
+    extensions 为允许的扩展名（不含点，不区分大小写），include 为文件名通配符，
+    exclude 为排除的通配符（同时作用于文件名和文件夹名，匹配的文件夹整个跳过）。
+    通配符与 fnmatch 一致，在 Windows 下不区分大小写。
+    """
+    
+    def __init__(self, extensions=None, include=None, exclude=None, skip_json=False):
+        self.extensions = {e.lower() for e in extensions} if extensions else None
+        self.skip_json = skip_json
+        self._include = self._compile(include)
+        self._exclude = self._compile(exclude)
+    
+    @staticmethod
+    def _compile(patterns):
+        if not patterns:
+            return None
+        return re.compile('|'.join(f"(?:{fnmatch.translate(os.path.normcase(p))})" for p in patterns))
+    
+    @classmethod
+    def from_types(cls, file_types, exclude=None):
+        """内容替换使用的筛选: 逗号分隔的扩展名，始终跳过 .json"""
+        extensions = [t.strip() for t in file_types.split(",") if t.strip()] if file_types else None
+        return cls(extensions=extensions, exclude=_split_patterns(exclude), skip_json=True)
+    
+    @classmethod
+    def from_pattern(cls, pattern, exclude=None):
+        """文件名替换使用的筛选: 通配符，可用逗号或分号分隔多个"""
+        return cls(include=_split_patterns(pattern) or ["*"], exclude=_split_patterns(exclude))
+    
+    def match_file(self, name):
+        extension = os.path.splitext(name)[1].lstrip('.').lower()
+        if self.skip_json and extension == 'json':
+            return False
+        if self.extensions is not None and extension not in self.extensions:
+            return False
+        if self._include is not None and not self._include.match(os.path.normcase(name)):
+            return False
+        if self._exclude is not None and self._exclude.match(os.path.normcase(name)):
+            return False
+        return True
+    
+    def match_dir(self, name):
+        return self._exclude is None or not self._exclude.match(os.path.normcase(name))
+
+
+def _scan_directory(directory, file_filter):
+    """列出一个文件夹，返回 (匹配的文件路径列表, 子文件夹路径列表)
+    
+    一次性读完整个文件夹再返回，这样调用方在处理（例如重命名）这些文件时
+    不会影响正在进行的遍历。无法访问的文件夹会被跳过（与 os.walk 一致）。
+    """
+    files = []
+    subdirs = []
+    try:
+        with os.scandir(directory) as it:
+            entries = list(it)
+    except OSError:
+        return files, subdirs
+    for entry in entries:
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        if is_dir:
+            # 与 os.walk 默认行为一致，不进入符号链接指向的文件夹
+            if not entry.is_symlink() and (file_filter is None or file_filter.match_dir(entry.name)):
+                subdirs.append(entry.path)
+        elif file_filter is None or file_filter.match_file(entry.name):
+            files.append(entry.path)
+    return files, subdirs
+
+
+def iter_files(directory, recursive=True, file_filter=None, workers=1):
+    """基于 os.scandir 的流式文件查找，找到一个文件夹的匹配文件就立即产出
+    
+    workers > 1 时用多个线程同时列出不同的子文件夹（适合网络盘或慢速磁盘），
+    此时产出顺序不固定。
+    """
+    if workers > 1 and recursive:
+        yield from _iter_files_parallel(directory, file_filter, workers)
+        return
+    
+    stack = [directory]
+    while stack:
+        files, subdirs = _scan_directory(stack.pop(), file_filter)
+        yield from files
+        if recursive:
+            # 倒序入栈，保证按文件夹列出的顺序深度优先遍历（与 os.walk 相同）
+            stack.extend(reversed(subdirs))
+
+
+def _iter_files_parallel(directory, file_filter, workers):
+    """iter_files 的并行版本"""
+    results = queue.Queue()
+    stop = threading.Event()
+    lock = threading.Lock()
+    pending = [1]
+    executor = ThreadPoolExecutor(max_workers=workers)
+    
+    def scan(path):
+        try:
+            if stop.is_set():
+                return
+            files, subdirs = _scan_directory(path, file_filter)
+            if files:
+                results.put(files)
+            with lock:
+                pending[0] += len(subdirs)
+            for subdir in subdirs:
+                executor.submit(scan, subdir)
+        finally:
+            with lock:
+                pending[0] -= 1
+                if pending[0] == 0:
+                    results.put(None)
+    
+    executor.submit(scan, directory)
+    try:
+        while True:
+            files = results.get()
+            if files is None:
+                break
+            yield from files
+    finally:
+        # 调用方提前停止迭代时，不再继续扫描
+        stop.set()
+        executor.shutdown(wait=False)
+
+
+def _chunked(items, size):
+    """把可迭代对象按 size 个一组产出列表"""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _ordered_parallel(func, items, worker_count):
+    """用线程池边读取 items 边处理，按输入顺序产出结果
+    
+    同时提交的任务数有上限，items 可以是正在扫描的生成器，不必先得到完整列表。
+    """
+    window = max(1, worker_count) * 4
+    with ThreadPoolExecutor(max_workers=max(1, worker_count)) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(func, item))
+            while pending and (len(pending) >= window or pending[0].done()):
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class RenamePlan:
+    """批量重命名计划
+    
+    先遍历一次建立目录索引（每个文件夹中的全部名称），在内存中检查冲突:
+    目标已存在、多个文件重命名为同一名称、无效的名称。通过检查的重命名按依赖排序:
+    a→b 且 b→c 时先执行 b→c；a→b、b→a 这样的循环借助一个临时名称完成。
+    文件夹由深到浅处理，同一文件夹中的文件和子文件夹一起排序，
+    因此重命名文件夹时其中的内容已经处理完毕。
+    
+    Windows 下名称不区分大小写，只改变大小写的重命名不算冲突。
+    """
+    
+    def __init__(self):
+        self.operations = []   # (源路径, 目标路径, 是否为文件夹)，按执行顺序
+        self.conflicts = []    # (源路径, 目标名称, 原因)
+        self.checked_count = 0
+        self.cycle_count = 0
+        self.temp_moves = []   # 循环中移到临时名称的操作
+    
+    @classmethod
+    def build(cls, folder, file_filter, search, replace, recursive=True, rename_dirs=False):
+        """扫描文件夹并生成计划。文件需匹配 file_filter；文件夹只要名称包含 search 即可"""
+        plan = cls()
+        directories = []
+        stack = [(folder, 0)]
+        while stack:
+            directory, depth = stack.pop()
+            try:
+                with os.scandir(directory) as it:
+                    entries = list(it)
+            except OSError:
+                continue
+            candidates = []
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    if file_filter is not None and not file_filter.match_dir(entry.name):
+                        continue
+                    if recursive and not entry.is_symlink():
+                        stack.append((entry.path, depth + 1))
+                    if rename_dirs and search in entry.name:
+                        candidates.append((entry.name, entry.name.replace(search, replace), True))
+                elif file_filter is None or file_filter.match_file(entry.name):
+                    plan.checked_count += 1
+                    if search in entry.name:
+                        candidates.append((entry.name, entry.name.replace(search, replace), False))
+            if candidates:
+                directories.append((depth, directory, [entry.name for entry in entries], candidates))
+        
+        # 深的文件夹先处理，浅层文件夹改名时不会影响已计划的路径
+        directories.sort(key=lambda item: -item[0])
+        for _, directory, names, candidates in directories:
+            plan._plan_directory(directory, names, candidates)
+        return plan
+    
+    @staticmethod
+    def _invalid_name(name):
+        if not name or name in ('.', '..') or '/' in name or os.sep in name or '\0' in name:
+            return True
+        # Windows 不允许这些字符，也会去掉名称末尾的空格和点
+        return os.name == 'nt' and (re.search(r'[<>:"|?*\x00-\x1f]', name) is not None or name.endswith((' ', '.')))
+    
+    def _plan_directory(self, directory, names, candidates):
+        """规划一个文件夹内的重命名，names 为文件夹中的全部名称，candidates 为 (名称, 新名称, 是否为文件夹)"""
+        key = os.path.normcase
+        moves = {}
+        for name, new_name, is_dir in candidates:
+            if new_name == name:
+                continue
+            if self._invalid_name(new_name):
+                self.conflicts.append((os.path.join(directory, name), new_name, "无效的名称"))
+                continue
+            moves[key(name)] = (name, new_name, is_dir)
+        
+        # 反复检查直到没有新的冲突: 被拒绝的文件留在原处，可能又挡住其他重命名
+        existing = {key(name) for name in names}
+        while True:
+            targets = {}
+            for source_key, (_, new_name, _) in moves.items():
+                targets.setdefault(key(new_name), []).append(source_key)
+            rejected = {}
+            for target_key, source_keys in targets.items():
+                if len(source_keys) > 1:
+                    for source_key in source_keys:
+                        rejected[source_key] = "多个文件将重命名为同一名称"
+                elif target_key in existing and target_key not in moves and target_key != source_keys[0]:
+                    rejected[source_keys[0]] = "目标已存在"
+            if not rejected:
+                break
+            for source_key, reason in rejected.items():
+                name, new_name, _ = moves.pop(source_key)
+                self.conflicts.append((os.path.join(directory, name), new_name, reason))
+        
+        # 每个目标最多对应一个源，依赖关系只会形成链或环
+        emitted = set()
+        taken = existing | {key(new_name) for _, new_name, _ in moves.values()}
+        for start in moves:
+            if start in emitted:
+                continue
+            path = []
+            on_path = {}
+            current = start
+            cycle_start = None
+            while current in moves and current not in emitted:
+                if current in on_path:
+                    cycle_start = on_path[current]
+                    break
+                on_path[current] = len(path)
+                path.append(current)
+                next_key = key(moves[current][1])
+                if next_key == current:
+                    # 只改变大小写
+                    break
+                current = next_key
+            emitted.update(path)
+            
+            if cycle_start is None:
+                # 链: 从末端开始执行，每一步的目标都已空出
+                for source_key in reversed(path):
+                    name, new_name, is_dir = moves[source_key]
+                    self.operations.append((os.path.join(directory, name), os.path.join(directory, new_name), is_dir))
+                continue
+            
+            # 环: 第一个先移到临时名称，其余倒序执行，最后从临时名称移到目标
+            self.cycle_count += 1
+            cycle = path[cycle_start:]
+            first_name, first_target, first_is_dir = moves[cycle[0]]
+            index = 0
+            while key(f"{first_name}.rename_tmp{index}") in taken:
+                index += 1
+            temp_name = f"{first_name}.rename_tmp{index}"
+            taken.add(key(temp_name))
+            temp_path = os.path.join(directory, temp_name)
+            self.operations.append((os.path.join(directory, first_name), temp_path, first_is_dir))
+            self.temp_moves.append(self.operations[-1])
+            for source_key in reversed(cycle[1:]):
+                name, new_name, is_dir = moves[source_key]
+                self.operations.append((os.path.join(directory, name), os.path.join(directory, new_name), is_dir))
+            self.operations.append((temp_path, os.path.join(directory, first_target), first_is_dir))
+
+
+def _rename_journal_dir():
+    return os.path.join(_default_cache_dir(), "rename_journal")
+
+
+def _create_rename_journal():
+    """新建撤销日志，返回 (路径, 文件对象)。文件名按时间排序，同一秒内的多次重命名加序号"""
+    os.makedirs(_rename_journal_dir(), exist_ok=True)
+    stamp = time.strftime("rename_%Y%m%d_%H%M%S")
+    index = 0
+    while True:
+        name = f"{stamp}.jsonl" if index == 0 else f"{stamp}_{index:03d}.jsonl"
+        path = os.path.join(_rename_journal_dir(), name)
+        try:
+            return path, open(path, 'x', encoding='utf-8')
+        except FileExistsError:
+            index += 1
+
+
+def latest_rename_journal():
+    """最近一次（尚未撤销的）重命名日志，没有时返回 None"""
+    try:
+        journals = [name for name in os.listdir(_rename_journal_dir()) if name.endswith('.jsonl')]
+    except OSError:
+        return None
+    return os.path.join(_rename_journal_dir(), max(journals)) if journals else None
+
+
+class JobJournal:
+    """内容替换任务的进度日志（追加写入的 JSON Lines），用于中断后继续
+    
+    每处理完一个文件追加一行 {"file", "status", "size", "mtime", "hits"}，任务全部成功后删除。
+    任务由文件夹、规则和选项确定（见 job_key），相同的任务再次运行时可以从中断处继续：
+    记录中的大小和修改时间与当前文件一致、且没有出错的文件视为已完成。
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.done = {}  # 绝对路径 -> (大小, 修改时间)
+        self._file = None
+    
+    @staticmethod
+    def job_key(folder, replacer, file_types, recursive, delete_json, exclude):
+        description = json.dumps([os.path.normcase(os.path.abspath(folder)), replacer.rules, file_types or "",
+                                  bool(recursive), bool(delete_json), exclude or ""], ensure_ascii=False)
+        return hashlib.blake2b(description.encode('utf-8'), digest_size=8).hexdigest()
+    
+    @staticmethod
+    def journal_path(key):
+        return os.path.join(_default_cache_dir(), "replace_journal", f"{key}.jsonl")
+    
+    @classmethod
+    def exists(cls, key):
+        """是否有未完成的相同任务"""
+        return os.path.exists(cls.journal_path(key))
+    
+    @classmethod
+    def open(cls, key, folder, resume):
+        """打开任务日志；resume 为 False 时丢弃以前的记录重新开始"""
+        journal = cls(cls.journal_path(key))
+        os.makedirs(os.path.dirname(journal.path), exist_ok=True)
+        if resume and os.path.exists(journal.path):
+            with open(journal.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # 进程被强制结束时最后一行可能不完整
+                        continue
+                    if "file" not in entry:
+                        continue
+                    if entry["status"] == 'error':
+                        journal.done.pop(entry["file"], None)
+                    else:
+                        journal.done[entry["file"]] = (entry["size"], entry["mtime"])
+            journal._file = open(journal.path, 'a', encoding='utf-8')
+        else:
+            journal._file = open(journal.path, 'w', encoding='utf-8')
+            journal._file.write(json.dumps({"folder": os.path.abspath(folder),
+                                            "started": time.strftime("%Y-%m-%d %H:%M:%S")},
+                                           ensure_ascii=False) + "\n")
+            journal._file.flush()
+        return journal
+    
+    def is_done(self, file_path):
+        """文件在上次运行中已处理完，且之后没有变化"""
+        recorded = self.done.get(os.path.abspath(file_path))
+        if recorded is None:
+            return False
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return False
+        return recorded == (st.st_size, st.st_mtime_ns)
+    
+    def record(self, file_path, status, hits):
+        """记录一个已处理完的文件（在处理结果的线程中调用）"""
+        if self._file is None:
+            return
+        try:
+            st = os.stat(file_path)
+            size, mtime = st.st_size, st.st_mtime_ns
+        except OSError:
+            size = mtime = None
+        self._file.write(json.dumps({"file": os.path.abspath(file_path), "status": status, "size": size,
+                                     "mtime": mtime, "hits": hits}, ensure_ascii=False) + "\n")
+        self._file.flush()
+    
+    def close(self, completed):
+        """关闭日志；completed 为 True 时任务已全部完成，删除日志"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if completed and self.path:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+def _atomic_write(path, write, mode_source=None):
+    """先写到同一文件夹中的临时文件，再替换目标文件，中途中断时目标文件保持原样
+    
+    write(f) 负责向二进制文件对象写入内容。新文件的权限取自 mode_source（没有时为 644）。
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            shutil.copymode(path, tmp_path)
+        elif mode_source:
+            shutil.copymode(mode_source, tmp_path)
+        else:
+            os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _atomic_write_bytes(path, data):
+    """原子地把 data 写入 path"""
+    _atomic_write(path, lambda f: f.write(data))
+
+
+def _atomic_copy(source, path):
+    """原子地把 source 的内容复制到 path"""
+    def write(f):
+        with open(source, 'rb') as src:
+            shutil.copyfileobj(src, f, 1024 * 1024)
+    _atomic_write(path, write, source)
+
+
+class _Inotify:
+    """Linux inotify 的 ctypes 封装"""
+    
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    _EVENT = struct.Struct('iIII')
+    
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        self._get_errno = ctypes.get_errno
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            error = self._get_errno()
+            raise OSError(error, os.strerror(error))
+        self._paths = {}  # 监视描述符 -> 文件夹路径
+    
+    def add_watch(self, directory):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), self.WATCH_MASK)
+        if wd < 0:
+            error = self._get_errno()
+            raise OSError(error, os.strerror(error), directory)
+        self._paths[wd] = directory
+    
+    def read(self, timeout):
+        """最多等待 timeout 秒，返回 [(路径, mask)]；事件队列溢出时路径为 None"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + self._EVENT.size <= len(data):
+            wd, mask, _cookie, length = self._EVENT.unpack_from(data, offset)
+            offset += self._EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & self.IN_Q_OVERFLOW:
+                events.append((None, mask))
+            elif mask & self.IN_IGNORED:
+                self._paths.pop(wd, None)
+            elif wd in self._paths and name:
+                events.append((os.path.join(self._paths[wd], os.fsdecode(name)), mask))
+        return events
+    
+    def close(self):
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    """监视文件夹中的文件变化，把一段时间内的多次变化合并后成批产出
+    
+    Linux 下使用 inotify，其他系统、inotify 不可用或 use_inotify 为 False 时定时扫描。
+    清单 (manifest) 记录每个文件上次处理后的 [大小, 修改时间, 内容哈希]：大小和修改时间没变、
+    或者内容哈希没变的文件不算变化，所以工具自己写回的文件不会再被处理一次。
+    """
+    
+    def __init__(self, folder, file_filter, manifest_path, recursive=True, debounce=1.0,
+                 poll_interval=2.0, use_inotify=True, log=None):
+        self.folder = folder
+        self.file_filter = file_filter
+        self.manifest_path = manifest_path
+        self.recursive = recursive
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify and sys.platform.startswith('linux')
+        self.log = log or (lambda message: None)
+        self.manifest = {}  # 路径 -> [大小, 修改时间, 内容哈希或 None]
+        self.mode = None
+    
+    def load_manifest(self):
+        """读取上次保存的清单，没有时返回 False"""
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f)
+            return True
+        except (OSError, ValueError):
+            self.manifest = {}
+            return False
+    
+    def save_manifest(self):
+        os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+        _atomic_write_bytes(self.manifest_path, json.dumps(self.manifest, ensure_ascii=False).encode('utf-8'))
+    
+    def _scan(self):
+        """当前的 {路径: (大小, 修改时间)}"""
+        state = {}
+        for file_path in iter_files(self.folder, self.recursive, self.file_filter):
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                continue
+            state[file_path] = (st.st_size, st.st_mtime_ns)
+        return state
+    
+    def snapshot(self):
+        """当前所有文件的清单（不计算内容哈希）"""
+        return {path: [size, mtime, None] for path, (size, mtime) in self._scan().items()}
+    
+    def set_manifest(self, manifest):
+        self.manifest = manifest
+        self.save_manifest()
+    
+    def _stat_changes(self):
+        """扫描一次，返回大小或修改时间与清单不同的 {路径: (大小, 修改时间)}，并去掉已删除的文件"""
+        state = self._scan()
+        for path in [path for path in self.manifest if path not in state]:
+            del self.manifest[path]
+        return {path: stat for path, stat in state.items()
+                if tuple(self.manifest.get(path, ())[:2]) != stat}
+    
+    def changed_files(self):
+        """与清单相比内容有变化的文件（用于启动时补上未监视期间的修改）"""
+        return self._filter_changed(self._stat_changes())
+    
+    def _filter_changed(self, paths):
+        """去掉已不存在和内容没有变化的文件，返回排序后的列表"""
+        changed = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                self.manifest.pop(path, None)
+                continue
+            entry = self.manifest.get(path)
+            if entry and entry[:2] == [st.st_size, st.st_mtime_ns]:
+                continue
+            if entry and entry[2]:
+                try:
+                    if _file_digest(path) == entry[2]:
+                        entry[:2] = [st.st_size, st.st_mtime_ns]
+                        continue
+                except OSError:
+                    continue
+            changed.append(path)
+        return sorted(changed)
+    
+    @staticmethod
+    def state(paths):
+        """这些文件当前的 {路径: [大小, 修改时间, 内容哈希]}，不包含已不存在的文件"""
+        states = {}
+        for path in paths:
+            try:
+                st = os.stat(path)
+                states[path] = [st.st_size, st.st_mtime_ns, _file_digest(path)]
+            except OSError:
+                pass
+        return states
+    
+    def commit(self, paths, states):
+        """一批文件处理完后更新清单并保存
+        
+        states 是处理前记下的状态（本工具写回的文件则是写回后的状态），
+        处理期间被其他程序修改的文件与清单不一致，之后会再处理一次。
+        """
+        for path in paths:
+            if path in states:
+                self.manifest[path] = states[path]
+            else:
+                self.manifest.pop(path, None)
+        self.save_manifest()
+    
+    def _open_inotify(self):
+        """为文件夹树建立 inotify 监视，失败时返回 None（改为定时扫描）"""
+        if not self.use_inotify:
+            return None
+        try:
+            inotify = _Inotify()
+        except (OSError, AttributeError) as e:
+            self.log(f"无法使用 inotify ({str(e)})，改为定时扫描")
+            return None
+        try:
+            self._watch_tree(inotify, self.folder)
+        except OSError as e:
+            inotify.close()
+            self.log(f"无法监视全部文件夹 ({str(e)}，可调大 fs.inotify.max_user_watches)，改为定时扫描")
+            return None
+        return inotify
+    
+    def _watch_tree(self, inotify, directory):
+        """监视 directory 及其子文件夹，返回其中已有的匹配文件"""
+        found = []
+        stack = [directory]
+        while stack:
+            current = stack.pop()
+            inotify.add_watch(current)
+            files, subdirs = _scan_directory(current, self.file_filter)
+            found.extend(files)
+            if self.recursive:
+                stack.extend(subdirs)
+        return found
+    
+    def batches(self, stop_event):
+        """等待文件变化，每当变化停止 debounce 秒后产出一批变化的文件，直到 stop_event 被设置"""
+        inotify = self._open_inotify()
+        self.mode = "inotify" if inotify else f"每 {self.poll_interval:g} 秒扫描一次"
+        self.log(f"开始监视 {self.folder} ({self.mode})，停止前会一直运行")
+        # 建立监视之后再与清单比较，之前发生的变化不会遗漏
+        changed = self.changed_files()
+        if changed:
+            yield changed
+        # 定时扫描时至少要再扫描一次确认文件不再变化
+        quiet = self.debounce if inotify else self.debounce + self.poll_interval
+        pending = {}
+        first = last = None
+        next_poll = time.monotonic() + self.poll_interval
+        try:
+            while not stop_event.is_set():
+                now = time.monotonic()
+                updates = []
+                if inotify:
+                    for path, mask in inotify.read(0.2):
+                        if path is None:
+                            self.log("inotify 事件过多，重新扫描文件夹")
+                            updates.extend(self._stat_changes().items())
+                        elif mask & _Inotify.IN_ISDIR:
+                            if (mask & (_Inotify.IN_CREATE | _Inotify.IN_MOVED_TO) and self.recursive
+                                    and self.file_filter.match_dir(os.path.basename(path))):
+                                try:
+                                    updates.extend((found, None) for found in self._watch_tree(inotify, path))
+                                except OSError as e:
+                                    self.log(f"无法监视新文件夹 {path}: {str(e)}")
+                        elif self.file_filter.match_file(os.path.basename(path)):
+                            if mask & (_Inotify.IN_DELETE | _Inotify.IN_MOVED_FROM):
+                                self.manifest.pop(path, None)
+                                pending.pop(path, None)
+                            else:
+                                updates.append((path, None))
+                else:
+                    stop_event.wait(0.2)
+                    if now >= next_poll:
+                        updates.extend(self._stat_changes().items())
+                        next_poll = time.monotonic() + self.poll_interval
+                
+                now = time.monotonic()
+                for path, stat in updates:
+                    if path not in pending or stat is None or pending[path] != stat:
+                        pending[path] = stat
+                        first = first or now
+                        last = now
+                
+                # 文件停止变化 quiet 秒后处理；持续变化时最多等待 10 倍时间
+                if pending and (now - last >= quiet or now - first >= quiet * 10):
+                    changed = self._filter_changed(pending)
+                    pending.clear()
+                    first = last = None
+                    if changed:
+                        yield changed
+        finally:
+            if inotify:
+                inotify.close()
+
+
+# 可能被其他 MOD 文件按文件名引用的类型
+_REFERENCE_EXTENSIONS = ('menu', 'mate', 'pmat', 'col', 'phy', 'psk', 'anm', 'model', 'tex', 'preset')
+
+
+def _reference_basename(value):
+    """字符串值中的文件名部分（去掉 / 或 \\ 之前的路径）"""
+    return value[max(value.rfind('/'), value.rfind('\\')) + 1:]
+
+
+def extract_references(document):
+    """从转换后的 JSON 中找出引用的文件名（小写）
+    
+    带有 MOD 扩展名的字符串值都视为引用；.mate 的 Tex2D.Name 不带扩展名，按 Name + ".tex" 记录。
+    """
+    references = set()
+    stack = [document]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            texture = node.get("Tex2D")
+            if isinstance(texture, dict) and isinstance(texture.get("Name"), str) and texture["Name"]:
+                references.add(texture["Name"].lower() + ".tex")
+            values = node.values()
+        elif isinstance(node, list):
+            values = node
+        else:
+            continue
+        for value in values:
+            if isinstance(value, (dict, list)):
+                stack.append(value)
+            elif isinstance(value, str):
+                name = _reference_basename(value)
+                if os.path.splitext(name)[1].lstrip('.').lower() in _REFERENCE_EXTENSIONS:
+                    references.add(name.lower())
+    return references
+
+
+def rewrite_references(document, renames):
+    """把 JSON 中对旧文件名的引用改为新文件名，renames 为 {旧文件名(小写): 新文件名}，返回修改处数"""
+    count = 0
+    stack = [document]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            texture = node.get("Tex2D")
+            if isinstance(texture, dict) and isinstance(texture.get("Name"), str):
+                new_name = renames.get(texture["Name"].lower() + ".tex")
+                if new_name is not None and new_name.lower().endswith(".tex"):
+                    texture["Name"] = new_name[:-len(".tex")]
+                    count += 1
+            items = node.items()
+        elif isinstance(node, list):
+            items = enumerate(node)
+        else:
+            continue
+        for key, value in list(items):
+            if isinstance(value, (dict, list)):
+                stack.append(value)
+            elif isinstance(value, str):
+                name = _reference_basename(value)
+                new_name = renames.get(name.lower())
+                if new_name is not None:
+                    node[key] = value[:len(value) - len(name)] + new_name
+                    count += 1
+    return count
+
+
+class ReferenceIndex:
+    """倒排引用索引: 文件名 -> 引用它的 MOD 文件
+    
+    每个文件夹一个索引文件，保存在缓存目录中，记录每个 .menu/.mate 等文件的
+    (大小, 修改时间) 和它引用的文件名。再次使用时只重新读取有变化的文件。
+    """
+    SOURCE_TYPES = ('menu', 'mate', 'model', 'preset')
+    
+    def __init__(self, folder, path):
+        self.folder = os.path.abspath(folder)
+        self.path = path
+        self.entries = {}  # 相对路径 -> [大小, 修改时间, [引用的文件名]]
+        self._inverted = None
+    
+    @classmethod
+    def open(cls, folder):
+        """打开文件夹对应的索引，不存在或损坏时为空索引"""
+        folder = os.path.abspath(folder)
+        digest = hashlib.blake2b(os.path.normcase(folder).encode('utf-8'), digest_size=8).hexdigest()
+        index = cls(folder, os.path.join(_default_cache_dir(), "reference_index", f"{digest}.json"))
+        try:
+            with open(index.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("folder") == folder:
+                index.entries = data.get("files", {})
+        except (OSError, ValueError, AttributeError):
+            pass
+        return index
+    
+    def save(self):
+        """写入索引（先写临时文件再替换）"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        _atomic_write_bytes(self.path, json.dumps({"folder": self.folder, "files": self.entries},
+                                                  ensure_ascii=False).encode('utf-8'))
+    
+    def update(self, read_document, workers=1):
+        """扫描文件夹，重新读取新增或有变化的文件，返回 (重新读取数, 复用数, 失败数)
+        
+        read_document(路径) 返回转换后的 JSON 对象，无法读取时返回 None。
+        """
+        seen = set()
+        changed = []
+        for file_path in iter_files(self.folder, True, FileFilter(self.SOURCE_TYPES)):
+            relative = os.path.relpath(file_path, self.folder)
+            seen.add(relative)
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                continue
+            entry = self.entries.get(relative)
+            if entry is None or entry[0] != st.st_size or entry[1] != st.st_mtime_ns:
+                changed.append((relative, st))
+        
+        for relative in set(self.entries) - seen:
+            del self.entries[relative]
+        
+        def read(item):
+            relative, st = item
+            try:
+                document = read_document(os.path.join(self.folder, relative))
+            except Exception:
+                document = None
+            return relative, st, document
+        
+        failed = 0
+        for relative, st, document in _ordered_parallel(read, changed, max(1, workers)):
+            if document is None:
+                # 读取失败的文件不记录，下次再试
+                self.entries.pop(relative, None)
+                failed += 1
+                continue
+            self.entries[relative] = [st.st_size, st.st_mtime_ns, sorted(extract_references(document))]
+        self._inverted = None
+        return len(changed) - failed, len(seen) - len(changed), failed
+    
+    def referencing(self, names):
+        """引用了 names 中任一文件名（小写）的文件的相对路径"""
+        if self._inverted is None:
+            self._inverted = {}
+            for relative, (_, _, references) in self.entries.items():
+                for name in references:
+                    self._inverted.setdefault(name, set()).add(relative)
+        result = set()
+        for name in names:
+            result.update(self._inverted.get(name, ()))
+        return result
+    
+    def apply_renames(self, operations):
+        """按已执行的重命名 (源路径, 目标路径, 是否为文件夹) 更新索引中的路径"""
+        for source, target, is_dir in operations:
+            source = os.path.relpath(source, self.folder)
+            target = os.path.relpath(target, self.folder)
+            if not is_dir:
+                if source in self.entries:
+                    self.entries[target] = self.entries.pop(source)
+                continue
+            prefix = source + os.sep
+            for relative in [r for r in self.entries if r.startswith(prefix)]:
+                self.entries[target + os.sep + relative[len(prefix):]] = self.entries.pop(relative)
+        self._inverted = None
+    
+    def refresh(self, relative, document):
+        """文件内容被修改后更新记录"""
+        st = os.stat(os.path.join(self.folder, relative))
+        self.entries[relative] = [st.st_size, st.st_mtime_ns, sorted(extract_references(document))]
+        self._inverted = None
+
+
+class LogSink:
+    """线程安全的日志输出
+    
+    任意线程调用 write() 只是把日志放进队列；主线程通过 after() 定时取出，
+    按文本框合并后一次性插入。每个文本框只保留最近 max_lines 行，
+    完整日志同时写入可轮转的日志文件。
+    """
+    DRAIN_INTERVAL_MS = 50
+    MAX_LINES_PER_DRAIN = 20000
+    
+    def __init__(self, root, max_lines=5000, log_path=None, max_file_bytes=5 * 1024 * 1024, backup_count=5):
+        self.root = root
+        self.max_lines = max_lines
+        self._queue = queue.SimpleQueue()
+        self._channels = {}
+        self._file_handler = None
+        self._stamp_second = None
+        self._stamp_text = ""
+        if log_path:
+            try:
+                os.makedirs(os.path.dirname(log_path), exist_ok=True)
+                self._file_handler = RotatingFileHandler(log_path, maxBytes=max_file_bytes,
+                                                         backupCount=backup_count, encoding='utf-8')
+            except OSError:
+                self._file_handler = None
+        self.log_path = log_path if self._file_handler else None
+        self.root.after(self.DRAIN_INTERVAL_MS, self._drain)
+    
+    def register(self, widget, channel):
+        """登记文本框及其在日志文件中的名称"""
+        self._channels[widget] = channel
+    
+    def write(self, message, widget):
+        """可在任意线程调用"""
+        self._queue.put((widget, message, time.time()))
+    
+    def clear(self, widget):
+        """清空文本框（主线程调用），先输出队列中已有的日志，避免旧日志在清空后出现"""
+        self._drain_pending()
+        widget.delete(1.0, "end")
+    
+    def _timestamp(self, seconds):
+        second = int(seconds)
+        if second != self._stamp_second:
+            self._stamp_second = second
+            self._stamp_text = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(second))
+        return self._stamp_text
+    
+    def _drain_pending(self):
+        """取出队列中的日志并写入文本框和日志文件，返回队列中是否还有剩余"""
+        batches = {}
+        file_lines = []
+        for _ in range(self.MAX_LINES_PER_DRAIN):
+            try:
+                widget, message, seconds = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batches.setdefault(widget, []).append(message)
+            if self._file_handler is not None:
+                file_lines.append(f"{self._timestamp(seconds)} [{self._channels.get(widget, '')}] {message}")
+        
+        for widget, messages in batches.items():
+            try:
+                widget.insert("end", "\n".join(messages) + "\n")
+                # 只保留最近 max_lines 行
+                line_count = int(widget.index("end-1c").split(".")[0])
+                if line_count > self.max_lines:
+                    widget.delete("1.0", f"{line_count - self.max_lines + 1}.0")
+                widget.see("end")
+            except Exception:
+                # 窗口关闭过程中文本框可能已被销毁
+                pass
+        
+        if file_lines:
+            try:
+                self._file_handler.emit(logging.makeLogRecord({"msg": "\n".join(file_lines)}))
+            except Exception:
+                pass
+        return not self._queue.empty()
+    
+    def _drain(self):
+        more = self._drain_pending()
+        try:
+            self.root.after(1 if more else self.DRAIN_INTERVAL_MS, self._drain)
+        except Exception:
+            pass
+
+
+# MeidoSerialization 输出中表示进度的 "当前/总数"，以及处理某个文件时出现的文件名
+_PROGRESS_COUNT_RE = re.compile(r'(?<![\w./\\])(\d+)\s*/\s*(\d+)(?![\w./\\])')
+_PROGRESS_FILE_RE = re.compile(
+    r'\.(?:menu|mate|pmat|col|phy|psk|anm|model|tex|preset|nei|csv|json|png|jpe?g|webp|bmp|tga)\b',
+    re.IGNORECASE)
+
+# 各转换命令的输入文件扩展名，用于预先统计文件总数（None 表示所有文件）
+_CONVERSION_INPUTS = {
+    'convert2json': ('menu', 'mate', 'pmat', 'col', 'phy', 'psk', 'anm', 'model', 'tex', 'preset'),
+    'convert2mod': ('json',),
+    'convert2image': ('tex',),
+    'convert2tex': ('png', 'jpg', 'jpeg', 'webp', 'bmp', 'tga'),
+    'convert2csv': ('nei',),
+    'convert2nei': ('csv',),
+}
+
+
+class ProgressTracker:
+    """线程安全的进度记录
+
+    工作线程只更新计数，界面线程定时读取 snapshot() 刷新进度条。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self, total=None):
+        with self._lock:
+            self.done = 0
+            self.total = total
+            self.active = True
+            self.started = time.perf_counter()
+            self.finished_at = None
+
+    def set_total(self, total):
+        with self._lock:
+            self.total = total
+
+    def advance(self, count=1):
+        with self._lock:
+            self.done += count
+
+    def update(self, done, total=None):
+        with self._lock:
+            self.done = max(self.done, done)
+            if total:
+                self.total = total
+
+    def finish(self, completed=True):
+        """结束计时；completed 为 True 时视为全部完成"""
+        with self._lock:
+            if completed and self.total is not None:
+                self.done = max(self.done, self.total)
+            self.active = False
+            self.finished_at = time.perf_counter()
+
+    def feed_line(self, line):
+        """根据一行命令输出推进进度: 优先使用 "当前/总数"，否则含文件名的行计为处理了一个文件"""
+        match = _PROGRESS_COUNT_RE.search(line)
+        if match and 0 < int(match.group(1)) <= int(match.group(2)):
+            self.update(int(match.group(1)), int(match.group(2)))
+        elif _PROGRESS_FILE_RE.search(line):
+            self.advance()
+
+    def snapshot(self):
+        """返回 (已完成, 总数, 速度(个/秒), 预计剩余秒数)，未知的值为 None"""
+        with self._lock:
+            done, total = self.done, self.total
+            elapsed = (self.finished_at or time.perf_counter()) - self.started
+        rate = done / elapsed if elapsed > 0 and done else None
+        eta = None
+        if rate and total is not None and total > done:
+            eta = (total - done) / rate
+        return done, total, rate, eta
+
+    def describe(self):
+        done, total, rate, eta = self.snapshot()
+        text = f"{done}/{total} 个文件" if total is not None else f"{done} 个文件"
+        if rate:
+            text += f"  {rate:.1f} 个/秒"
+        if eta is not None and self.active:
+            text += f"  预计剩余 {int(eta) // 60}:{int(eta) % 60:02d}"
+        return text
+
+
+class StageTimer:
+    """记录一段代码耗时的 with 语句，结束时写入 RunReport"""
+    __slots__ = ('report', 'stage', 'file_path', 'start')
+    
+    def __init__(self, report, stage, file_path=None):
+        self.report = report
+        self.stage = stage
+        self.file_path = file_path
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.report.add(self.stage, time.perf_counter() - self.start, self.file_path)
+        return False
+
+
+class RunReport:
+    """一次处理中各阶段、各文件的耗时记录（线程安全）
+    
+    每次记录只是两次 perf_counter 加一次列表追加，可以一直开启。
+    多个文件共用的一步（例如批量转换）用 add_shared() 平均分给这些文件。
+    """
+    STAGE_LABELS = OrderedDict([
+        ('scan', "扫描文件"),
+        ('prefilter', "预筛选"),
+        ('convert_to_json', "转为JSON"),
+        ('batch_stage', "复制到临时目录"),
+        ('batch_convert_to_json', "批量转为JSON"),
+        ('replace', "替换关键词"),
+        ('convert_to_mod', "转回原格式"),
+        ('batch_convert_to_mod', "批量转回原格式"),
+        ('cache_store', "写入缓存"),
+        ('delete_json', "删除JSON"),
+    ])
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = OrderedDict()  # 阶段 -> [耗时, ...]
+        self.files = {}  # 文件路径 -> {阶段: 耗时}
+        self.started = time.perf_counter()
+        self.wall_seconds = None
+    
+    def timer(self, stage, file_path=None):
+        return StageTimer(self, stage, file_path)
+    
+    def add(self, stage, seconds, file_path=None):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+            if file_path is not None:
+                stages = self.files.setdefault(file_path, {})
+                stages[stage] = stages.get(stage, 0.0) + seconds
+    
+    def add_shared(self, stage, seconds, file_paths):
+        """把多个文件共用的一步耗时平均记到每个文件上"""
+        if file_paths:
+            share = seconds / len(file_paths)
+            for file_path in file_paths:
+                self.add(stage, share, file_path)
+    
+    def finish(self):
+        self.wall_seconds = time.perf_counter() - self.started
+    
+    @staticmethod
+    def _percentile(ordered, fraction):
+        """已排序列表的百分位数（最近秩法）"""
+        index = max(0, min(len(ordered) - 1, -int(-fraction * len(ordered) // 1) - 1))
+        return ordered[index]
+    
+    def stage_stats(self):
+        """[(阶段, 总计, 次数, 平均, P50, P90, P99, 最大), ...]，按阶段顺序"""
+        with self._lock:
+            samples = {stage: sorted(values) for stage, values in self.samples.items()}
+        order = [stage for stage in self.STAGE_LABELS if stage in samples]
+        order += [stage for stage in samples if stage not in self.STAGE_LABELS]
+        stats = []
+        for stage in order:
+            values = samples[stage]
+            total = sum(values)
+            stats.append((stage, total, len(values), total / len(values),
+                           self._percentile(values, 0.5), self._percentile(values, 0.9),
+                           self._percentile(values, 0.99), values[-1]))
+        return stats
+    
+    def slowest_files(self, count=10):
+        """[(总耗时, 文件路径, {阶段: 耗时}), ...]，耗时最长的在前"""
+        with self._lock:
+            totals = [(sum(stages.values()), file_path, dict(stages)) for file_path, stages in self.files.items()]
+        totals.sort(key=lambda item: item[0], reverse=True)
+        return totals[:count]
+    
+    @staticmethod
+    def _pad(text, width):
+        """按显示宽度（中文占两格）补齐空格"""
+        used = sum(2 if unicodedata.east_asian_width(char) in 'WF' else 1 for char in text)
+        return text + " " * max(0, width - used)
+    
+    def summary_lines(self, top=10):
+        """用于写入日志的摘要"""
+        lines = ["\n阶段耗时 (秒):",
+                 f"  {self._pad('阶段', 16)}{'总计':>8}{'次数':>6}{'平均':>8}{'P50':>10}{'P90':>10}{'P99':>10}{'最大':>8}"]
+        for stage, total, count, mean, p50, p90, p99, maximum in self.stage_stats():
+            lines.append(f"  {self._pad(self.STAGE_LABELS.get(stage, stage), 16)}{total:>10.3f}{count:>8}{mean:>10.4f}"
+                         f"{p50:>10.4f}{p90:>10.4f}{p99:>10.4f}{maximum:>10.4f}")
+        if self.wall_seconds is not None:
+            lines.append(f"  总耗时 {self.wall_seconds:.2f} 秒（并行处理时各阶段合计可能超过总耗时）")
+        slowest = self.slowest_files(top)
+        if slowest:
+            lines.append("耗时最长的文件:")
+            for total, file_path, stages in slowest:
+                detail = ", ".join(f"{self.STAGE_LABELS.get(stage, stage)} {seconds:.3f}"
+                                   for stage, seconds in stages.items())
+                lines.append(f"  {total:.3f} 秒  {file_path}  ({detail})")
+        return lines
+    
+    def to_dict(self):
+        return {
+            "wall_seconds": self.wall_seconds,
+            "stages": [dict(zip(("stage", "total", "count", "mean", "p50", "p90", "p99", "max"), row))
+                       for row in self.stage_stats()],
+            "files": [{"file": file_path, "total": total, "stages": stages}
+                      for total, file_path, stages in self.slowest_files(len(self.files))],
+        }
+    
+    def export(self, path):
+        """导出报告：扩展名为 .csv 时每个文件一行，否则为 JSON"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if path.lower().endswith('.csv'):
+            stages = [stage for stage, *_ in self.stage_stats()]
+            with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(["file", "total"] + stages)
+                for total, file_path, file_stages in self.slowest_files(len(self.files)):
+                    writer.writerow([file_path, f"{total:.6f}"]
+                                    + [f"{file_stages[stage]:.6f}" if stage in file_stages else "" for stage in stages])
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+
+def _timed_iter(items, report, stage):
+    """逐个产出 items，并把等待下一项的时间记为 stage（用于边扫描边处理的生成器）"""
+    iterator = iter(items)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            report.add(stage, time.perf_counter() - start)
+            return
+        report.add(stage, time.perf_counter() - start)
+        yield item
+
+
+def _place_file(source, target, link=False):
+    """把 source 的内容原子地放到 target（覆盖已有文件），link 为 True 时优先创建硬链接"""
+    if link:
+        tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.link(source, tmp_path)
+            os.replace(tmp_path, target)
+            return
+        except OSError:
+            if os.path.lexists(tmp_path):
+                os.remove(tmp_path)
+    _atomic_copy(source, target)
+
+
+def _print_log(message, channel):
+    """命令行模式的默认日志输出"""
+    print(message, flush=True)
+
+
+class COM3D2ToolCore:
+    """与界面无关的处理逻辑，图形界面和命令行共用
+    
+    log(message, channel) 接收日志，channel 为 'content'、'filename'、'convert' 或 'determine'，
+    可在任意线程调用。convert_progress / determine_progress 记录格式转换和类型检测的进度。
+    """
+    
+    def __init__(self, log=None):
+        self.log_callback = log or _print_log
+        
+        # JSON 转换缓存和图片与 TEX 转换结果缓存，仅在启用时创建
+        self.json_cache = None
+        self.convert_cache = None
+        # 当前内容替换的分阶段耗时记录
+        self.run_report = None
+        # 临时文件所在的文件夹（例如内存盘），为 None 时使用系统临时文件夹
+        self.scratch_dir = None
+        # 内置 .mate/.menu 转换还没有用 MeidoSerialization 的实际输出验证过，默认关闭
+        self.use_native_codec = False
+        self._tool_fingerprints = {}
+        
+        # 取消: 流水线检查 _cancel_event，正在运行的子进程登记在 _processes 中以便终止
+        self._cancel_event = threading.Event()
+        self._watch_stop = threading.Event()
+        self._processes = set()
+        self._process_lock = threading.Lock()
+        self.convert_progress = ProgressTracker()
+        self.determine_progress = ProgressTracker()
+        self.convert_progress.active = self.determine_progress.active = False
+    
+    def _log(self, message, channel='content'):
+        """添加日志信息（可在任意线程调用）"""
+        self.log_callback(message, channel)
+    
+    def cancel(self):
+        """取消正在进行的任务并终止正在运行的子进程"""
+        self._cancel_event.set()
+        self._watch_stop.set()
+        with self._process_lock:
+            processes = list(self._processes)
+        for process in processes:
+            threading.Thread(target=self._terminate_process, args=(process,), daemon=True).start()
+    
+    @staticmethod
+    def _terminate_process(process, timeout=5):
+        """先请求子进程退出，超时后强制结束"""
+        try:
+            process.terminate()
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        except OSError:
+            pass
+    
+    def _run_meido_command(self, command, args, channel=None, progress=None, on_line=None):
+        """运行 MeidoSerialization 命令，逐行输出到日志
+        
+        输出边读边写入日志，不在内存中累积；progress 为 ProgressTracker 时根据输出推进进度。
+        提供 on_line 时标准输出的每一行交给 on_line 处理而不写入日志（错误输出仍写入日志）。
+        调用 cancel() 会终止子进程，此时返回 False。
+        """
+        try:
+            cmd = [command] + args
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, 
+                                     encoding='utf-8', errors='ignore')
+        except Exception as e:
+            self._log(f"执行命令时发生错误: {str(e)}", channel)
+            return False
+        
+        with self._process_lock:
+            self._processes.add(process)
+        try:
+            # 开始前已经取消则直接终止
+            if self._cancel_event.is_set():
+                self._terminate_process(process)
+            
+            # stderr 在单独线程中读取，避免任一管道写满导致子进程阻塞
+            stderr_reader = threading.Thread(target=self._pipe_to_log,
+                                             args=(process.stderr, channel, "错误: ", None),
+                                             daemon=True)
+            stderr_reader.start()
+            self._pipe_to_log(process.stdout, channel, "", progress, on_line)
+            stderr_reader.join()
+            process.wait()
+        except Exception as e:
+            self._log(f"执行命令时发生错误: {str(e)}", channel)
+            self._terminate_process(process)
+            return False
+        finally:
+            with self._process_lock:
+                self._processes.discard(process)
+        
+        if self._cancel_event.is_set():
+            self._log("已取消", channel)
+            return False
+        return process.returncode == 0
+    
+    def _run_child(self, cmd):
+        """运行一次子进程并等待结束，返回 (返回码, 错误输出)
+        
+        子进程登记在 _processes 中，cancel() 可以终止它；标准输出直接丢弃，不在内存中累积。
+        已取消时返回码为 None。
+        """
+        process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        with self._process_lock:
+            self._processes.add(process)
+        try:
+            # 开始前已经取消则直接终止
+            if self._cancel_event.is_set():
+                self._terminate_process(process)
+            _, stderr = process.communicate()
+        except BaseException:
+            self._terminate_process(process)
+            raise
+        finally:
+            with self._process_lock:
+                self._processes.discard(process)
+        if self._cancel_event.is_set():
+            return None, "已取消"
+        return process.returncode, stderr.decode('utf-8', errors='ignore')
+    
+    def _pipe_to_log(self, pipe, channel, prefix, progress, on_line=None):
+        """逐行读取子进程输出并写入日志"""
+        for line in pipe:
+            line = line.rstrip("\r\n")
+            if not line:
+                continue
+            if on_line is not None:
+                on_line(line)
+            else:
+                self._log(prefix + line, channel)
+            if progress is not None:
+                progress.feed_line(line)
+        pipe.close()
+    
+    def _count_conversion_inputs(self, path, conversion_type, progress):
+        """在后台统计待处理的文件数，作为进度条的总数"""
+        if os.path.isfile(path):
+            progress.set_total(1)
+            return
+        extensions = _CONVERSION_INPUTS.get(conversion_type)
+        count = 0
+        for _ in iter_files(path, True, FileFilter(extensions)):
+            if self._cancel_event.is_set() or not progress.active:
+                return
+            count += 1
+        progress.set_total(count)
+    
+    def _start_progress(self, path, conversion_type, progress):
+        """开始一个带进度显示的命令"""
+        self._cancel_event.clear()
+        progress.reset()
+        threading.Thread(target=self._count_conversion_inputs,
+                         args=(path, conversion_type, progress), daemon=True).start()
+    
+    def _stage(self, stage, file_path=None):
+        """记录一个阶段耗时的 with 语句，不在内容替换过程中时不记录"""
+        report = self.run_report
+        return report.timer(stage, file_path) if report is not None else contextlib.nullcontext()
+    
+    def _find_files(self, directory, recursive=True, file_types=None, exclude=None, workers=1):
+        """查找匹配的文件（生成器，边扫描边产出）"""
+        return iter_files(directory, recursive, FileFilter.from_types(file_types, exclude), workers)
+    
+    def _find_files_by_pattern(self, directory, pattern="*.*", recursive=True, exclude=None, workers=1):
+        """使用模式查找匹配的文件（生成器，边扫描边产出）"""
+        return iter_files(directory, recursive, FileFilter.from_pattern(pattern, exclude), workers)
+    
+    def _convert_to_json(self, file_path, meido_path, log=None, cache_key=None, native=True):
+        """使用MeidoSerialization将文件转换为JSON
+        
+        cache_key 为源文件的缓存键（源文件是临时副本时需由调用方提供）。
+        native 为 False 时不尝试内置转换（调用方已经尝试过）。
+        """
+        log = log or self._log
+        try:
+            json_file = f"{file_path}.json"
+            if native and self._convert_native(file_path, json_file, log, to_json=True):
+                return json_file
+            
+            cache = self.json_cache
+            if cache is not None:
+                cache_key = cache_key or self._json_cache_key(file_path, meido_path)
+                if cache.fetch(cache_key, json_file):
+                    log("已从缓存读取JSON")
+                    return json_file
+            
+            returncode, stderr = self._run_child([meido_path, "convert2json", file_path])
+            if returncode != 0:
+                log(f"转换失败: {stderr}")
+                return None
+            
+            if cache is not None and os.path.exists(json_file):
+                cache.put(cache_key, json_file)
+                
+            return json_file
+        except Exception as e:
+            log(f"转换过程发生错误: {str(e)}")
+            return None
+    
+    def _convert_to_mod(self, json_file_path, meido_path, log=None, native=True):
+        """使用MeidoSerialization将JSON转回原格式"""
+        log = log or self._log
+        try:
+            mod_file_path = json_file_path[:-len(".json")]
+            if native and self._convert_native(json_file_path, mod_file_path, log, to_json=False):
+                return True
+            
+            returncode, stderr = self._run_child([meido_path, "convert2mod", json_file_path])
+            if returncode != 0:
+                log(f"转换回原格式失败: {stderr}")
+                return False
+                
+            return True
+        except Exception as e:
+            log(f"转换回原格式过程发生错误: {str(e)}")
+            return False
+    
+    def _convert_native(self, src_path, dest_path, log, to_json):
+        """尝试用内置编解码器转换 .mate/.menu，返回是否已完成
+        
+        不支持或无法逐字节还原时返回 False，由调用方改用 MeidoSerialization。
+        """
+        mod_path = dest_path if not to_json else src_path
+        if not self.use_native_codec or not NativeCodec.supports(mod_path):
+            return False
+        
+        file_type = os.path.splitext(mod_path)[1].lstrip('.').lower()
+        try:
+            if to_json:
+                with open(src_path, 'rb') as f:
+                    text = NativeCodec.to_json(file_type, f.read())
+                with open(dest_path, 'w', encoding='utf-8') as f:
+                    f.write(text)
+            else:
+                with open(src_path, 'r', encoding='utf-8') as f:
+                    data = NativeCodec.from_json(file_type, f.read())
+                with open(dest_path, 'wb') as f:
+                    f.write(data)
+            return True
+        except NativeCodecError as e:
+            log(f"内置转换不支持此文件 ({str(e)})，改用 MeidoSerialization")
+            return False
+    
+    def _json_cache_key(self, file_path, meido_path):
+        """JSON 缓存键: 源文件内容哈希 + MeidoSerialization 程序本身的哈希（代替版本号）"""
+        return f"{self.json_cache.file_hash(file_path)}_{self._tool_fingerprint(meido_path)}"
+    
+    def _tool_fingerprint(self, meido_path):
+        """MeidoSerialization 程序的指纹，程序更新后旧缓存自动失效"""
+        fingerprint = self._tool_fingerprints.get(meido_path)
+        if fingerprint is None:
+            fingerprint = (self.json_cache or self.convert_cache).file_hash(meido_path)[:16]
+            self._tool_fingerprints[meido_path] = fingerprint
+        return fingerprint
+    
+    def _store_modified_json(self, json_file, file_path, meido_path, replacer):
+        """转回成功后，把修改后的 JSON 以新文件内容为键存入缓存，连续多次替换时可直接命中
+        
+        结构化规则会重新生成 JSON，格式与 MeidoSerialization 的输出不完全相同，这种情况不存入缓存。
+        """
+        if getattr(replacer, "has_structured", False):
+            return
+        if self.use_native_codec and NativeCodec.supports(file_path):
+            return
+        if self.json_cache is not None:
+            self.json_cache.put(self._json_cache_key(file_path, meido_path), json_file)
+    
+    def open_json_cache(self, max_mb):
+        """打开（或复用）JSON 转换缓存"""
+        if self.json_cache is None:
+            self.json_cache = ContentCache(os.path.join(_default_cache_dir(), "json_cache"))
+        self.json_cache.max_bytes = max_mb * 1024 * 1024
+        self.json_cache.hits = 0
+        self.json_cache.misses = 0
+        return self.json_cache
+    
+    def open_convert_cache(self, max_mb):
+        """打开（或复用）图片与 TEX 转换结果缓存"""
+        if self.convert_cache is None:
+            self.convert_cache = ContentCache(os.path.join(_default_cache_dir(), "convert_cache"))
+        self.convert_cache.max_bytes = max_mb * 1024 * 1024
+        self.convert_cache.hits = 0
+        self.convert_cache.misses = 0
+        return self.convert_cache
+    
+    def clear_json_cache(self):
+        """清空 JSON 转换缓存和图片与 TEX 转换结果缓存"""
+        cache = self.json_cache or ContentCache(os.path.join(_default_cache_dir(), "json_cache"))
+        cache.clear()
+        cache = self.convert_cache or ContentCache(os.path.join(_default_cache_dir(), "convert_cache"))
+        cache.clear()
+        self._tool_fingerprints.clear()
+        self._log("已清空转换缓存")
+    
+    def _replace_keywords_in_json(self, json_file_path, replacer, log=None):
+        """在JSON文件中按规则替换关键词，返回每条规则的命中次数（出错时返回 None）"""
+        log = log or self._log
+        try:
+            with open(json_file_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except Exception as e:
+            log(f"替换关键词时发生错误: {str(e)}")
+            return None
+        
+        modified_content, hits = self._replace_keywords_in_text(content, replacer, log)
+        if hits is None or modified_content == content:
+            return hits
+        try:
+            with open(json_file_path, 'w', encoding='utf-8') as f:
+                f.write(modified_content)
+            return hits
+        except Exception as e:
+            log(f"替换关键词时发生错误: {str(e)}")
+            return None
+    
+    @staticmethod
+    def _replace_keywords_in_text(content, replacer, log):
+        """在 JSON 文本中按规则替换关键词，返回 (替换后的文本, 每条规则的命中次数)，出错时命中次数为 None"""
+        try:
+            modified_content, hits = replacer.replace(content)
+        except Exception as e:
+            log(f"替换关键词时发生错误: {str(e)}")
+            return content, None
+        if content == modified_content:
+            # 例如查找与替换内容相同的规则，没有实际修改
+            return content, [0] * len(hits)
+        return modified_content, hits
+    
+    def _scratch_root(self):
+        """临时文件所在的文件夹，未设置时使用系统临时文件夹"""
+        if self.scratch_dir:
+            os.makedirs(self.scratch_dir, exist_ok=True)
+            return self.scratch_dir
+        return None
+    
+    def _check_scratch_dir(self, folder, channel='content'):
+        """临时文件夹不能位于要处理的文件夹内，否则改用系统临时文件夹"""
+        if not self.scratch_dir:
+            return
+        scratch = os.path.normcase(os.path.realpath(self.scratch_dir))
+        source = os.path.normcase(os.path.realpath(folder if os.path.isdir(folder) else os.path.dirname(folder)))
+        if scratch == source or scratch.startswith(source.rstrip(os.sep) + os.sep):
+            self._log(f"临时文件夹位于要处理的文件夹内，改用系统临时文件夹: {tempfile.gettempdir()}", channel)
+            self.scratch_dir = None
+    
+    def process_files_replacement(self, folder, meido_path, replacer, 
+                                 file_types, recursive, delete_json, worker_count=1, batch_size=0,
+                                 exclude=None, scan_workers=1, prefilter=False, report_path=None, resume=False,
+                                 files=None, on_written=None):
+        """处理文件替换的主要逻辑，返回是否没有发生错误
+        
+        各阶段耗时记录在 self.run_report 中，结束时写入日志；report_path 不为空时另外导出为 JSON/CSV。
+        每处理完一个文件写入任务日志（JobJournal），resume 为 True 时跳过上次已完成的文件。
+        调用 cancel() 会在当前文件处理完后停止。
+        files 不为空时只处理其中的文件（监视模式），不扫描文件夹，也不写任务日志；
+        on_written(路径) 在文件被修改写回后调用。
+        """
+        report = self.run_report = RunReport()
+        self._cancel_event.clear()
+        self._log("开始处理文件...")
+        self._check_scratch_dir(folder)
+        self._log(f"共 {len(replacer.rules)} 条替换规则，每个文件只转换一次")
+        for index in replacer.duplicates:
+            self._log(f"警告: 第 {index + 1} 条规则的查找内容与前面的规则重复，将被忽略")
+        
+        keyword_filter = KeywordPrefilter.from_rules(replacer) if prefilter else None
+        if prefilter and keyword_filter is None:
+            self._log("部分规则无法确定文件中必然出现的文字，本次不跳过任何文件")
+        
+        def may_match(file_path):
+            if keyword_filter is None:
+                return True
+            with report.timer('prefilter', file_path):
+                return keyword_filter.may_match(file_path)
+        
+        if files is not None:
+            journal = JobJournal(None)
+        else:
+            journal = JobJournal.open(JobJournal.job_key(folder, replacer, file_types, recursive, delete_json, exclude),
+                                      folder, resume)
+        if resume and journal.done:
+            self._log(f"继续上次未完成的任务: 已完成 {len(journal.done)} 个文件")
+        
+        def check(file_path):
+            """处理前的检查，返回不需要处理时的状态"""
+            if self._cancel_event.is_set():
+                return 'cancelled'
+            if journal.done and journal.is_done(file_path):
+                return 'resumed'
+            if not may_match(file_path):
+                return 'skipped'
+            return None
+        
+        if files is not None:
+            files = list(files)
+        elif os.path.isfile(folder):
+            files = [folder]
+        else:
+            # 边扫描边处理，不等待完整的文件列表
+            files = _timed_iter(self._find_files(folder, recursive, file_types if file_types else None,
+                                                 exclude, scan_workers), report, 'scan')
+        
+        if batch_size > 1:
+            # 批量模式: 每批文件只启动一次 convert2json 和一次 convert2mod
+            tasks = _chunked(files, batch_size)
+            self._log(f"批量模式: 每批 {batch_size} 个文件")
+            
+            def process(chunk):
+                results = []
+                kept = []
+                for file_path in chunk:
+                    status = check(file_path)
+                    if status:
+                        results.append((file_path, status, [], None))
+                    else:
+                        kept.append(file_path)
+                if kept:
+                    results.extend((file_path,) + result for file_path, result in
+                                   zip(kept, self._process_file_batch(kept, meido_path, replacer, delete_json)))
+                return results
+        else:
+            tasks = files
+            
+            def process(file_path):
+                status = check(file_path)
+                if status:
+                    return [(file_path, status, [], None)]
+                return [(file_path,) + self._process_single_file(file_path, meido_path, replacer, delete_json)]
+        
+        worker_count = max(1, worker_count)
+        if worker_count > 1:
+            self._log(f"使用 {worker_count} 个并行任务")
+        
+        file_count = 0
+        modified_count = 0
+        error_count = 0
+        skipped_count = 0
+        resumed_count = 0
+        rule_hits = [0] * len(replacer.rules)
+        rule_files = [0] * len(replacer.rules)
+        
+        # 按提交顺序返回结果，保证每个文件的日志按顺序整体输出
+        completed = False
+        try:
+            for results in _ordered_parallel(process, tasks, worker_count):
+                for file_path, status, messages, hits in results:
+                    # 停止时被终止的子进程会让正在处理的文件出错，这些文件不记录，续传时重新处理
+                    if status == 'cancelled' or (status == 'error' and self._cancel_event.is_set()):
+                        continue
+                    if status == 'resumed':
+                        resumed_count += 1
+                        continue
+                    journal.record(file_path, status, hits)
+                    if status == 'skipped':
+                        skipped_count += 1
+                        continue
+                    file_count += 1
+                    for message in messages:
+                        self._log(message)
+                    if status == 'modified':
+                        modified_count += 1
+                        if on_written is not None:
+                            on_written(file_path)
+                    elif status == 'error':
+                        error_count += 1
+                    for index, count in enumerate(hits or ()):
+                        if count:
+                            rule_hits[index] += count
+                            rule_files[index] += 1
+                if self._cancel_event.is_set():
+                    break
+            completed = error_count == 0 and not self._cancel_event.is_set()
+        finally:
+            journal.close(completed)
+        
+        self._log("\n规则命中统计:")
+        for index, (search, replace) in enumerate(replacer.rules):
+            self._log(f"  [{index + 1}] {search} → {replace}: 命中 {rule_hits[index]} 次, 涉及 {rule_files[index]} 个文件")
+        
+        cache = self.json_cache
+        if cache is not None:
+            try:
+                cache.save()
+            except OSError as e:
+                self._log(f"保存 JSON 缓存索引失败: {str(e)}")
+            self._log(f"\nJSON 缓存: 命中 {cache.hits} 次, 未命中 {cache.misses} 次, "
+                      f"占用 {cache.total_bytes / 1024 / 1024:.1f} MB")
+                
+        report.finish()
+        for line in report.summary_lines():
+            self._log(line)
+        if report_path:
+            try:
+                report.export(report_path)
+                self._log(f"耗时报告已保存到: {report_path}")
+            except OSError as e:
+                self._log(f"保存耗时报告失败: {str(e)}")
+        
+        self._log(f"\n{'='*60}")
+        if self._cancel_event.is_set():
+            self._log("已停止，进度已保存，再次运行相同的任务时可以从中断处继续")
+        self._log(f"处理完成: 共处理 {file_count} 个文件, 修改了 {modified_count} 个文件, 发生 {error_count} 个错误")
+        if resumed_count:
+            self._log(f"续传: 跳过了 {resumed_count} 个上次已完成的文件")
+        if keyword_filter is not None:
+            self._log(f"预筛选: 跳过了 {skipped_count} 个不含关键词的文件（未转换）")
+        if error_count and not self._cancel_event.is_set():
+            self._log("出错的文件已记录，再次运行相同的任务并选择继续时只重新处理这些文件")
+        return error_count == 0 and not self._cancel_event.is_set()
+    
+    def _process_single_file(self, file_path, meido_path, replacer, delete_json):
+        """处理单个文件的 转换-替换-转回 流程，返回 (状态, 日志列表, 每条规则的命中次数)
+        
+        状态为 'modified'、'unchanged' 或 'error'。日志先缓存在列表中，
+        由调用方统一输出，避免并行处理时不同文件的日志交错。
+        """
+        messages = []
+        log = messages.append
+        hits = None
+        work_dir = None
+        try:
+            log(f"\n处理文件: {file_path}")
+            
+            native = self.use_native_codec and NativeCodec.supports(file_path)
+            if native:
+                result = self._process_in_memory(file_path, replacer, delete_json, log)
+                if result is not None:
+                    return result[0], messages, result[1]
+            
+            # 复制到临时文件夹中 转换-替换-转回，源文件夹中不产生任何临时文件
+            work_dir = tempfile.mkdtemp(prefix="com3d2_work_", dir=self._scratch_root())
+            work_path = os.path.join(work_dir, os.path.basename(file_path))
+            with self._stage('convert_to_json', file_path):
+                cache_key = self._json_cache_key(file_path, meido_path) if self.json_cache is not None else None
+                shutil.copyfile(file_path, work_path)
+                json_file = self._convert_to_json(work_path, meido_path, log, cache_key, native=False)
+            if not json_file or not os.path.exists(json_file):
+                log(f"无法转换文件: {file_path}")
+                return 'error', messages, hits
+                
+            log("已转换为JSON")
+            
+            status = 'unchanged'
+            with self._stage('replace', file_path):
+                hits = self._replace_keywords_in_json(json_file, replacer, log)
+            if hits is None:
+                status = 'error'
+            elif any(hits):
+                log(f"已在JSON中替换关键词 ({self._format_hits(hits)})")
+                
+                with self._stage('convert_to_mod', file_path):
+                    os.remove(work_path)
+                    converted = (self._convert_to_mod(json_file, meido_path, log, native=False)
+                                 and os.path.exists(work_path))
+                    if converted:
+                        _atomic_copy(work_path, file_path)
+                if converted:
+                    log(f"已将修改后的JSON转回原格式")
+                    status = 'modified'
+                    with self._stage('cache_store', file_path):
+                        self._store_modified_json(json_file, file_path, meido_path, replacer)
+                else:
+                    log(f"转回原格式失败")
+                    status = 'error'
+            else:
+                log(f"文件中未找到关键词")
+            
+            if not delete_json:
+                shutil.copyfile(json_file, f"{file_path}.json")
+                log(f"已保留JSON文件: {file_path}.json")
+            
+            return status, messages, hits
+                
+        except Exception as e:
+            log(f"处理文件时发生错误: {str(e)}")
+            return 'error', messages, hits
+        finally:
+            if work_dir is not None:
+                with self._stage('delete_json', file_path):
+                    shutil.rmtree(work_dir, ignore_errors=True)
+    
+    def _process_in_memory(self, file_path, replacer, delete_json, log):
+        """用内置编解码器在内存中完成 转换-替换-转回，不写任何临时文件
+        
+        返回 (状态, 每条规则的命中次数)；无法用内置转换处理时返回 None，由调用方改用 MeidoSerialization。
+        """
+        file_type = os.path.splitext(file_path)[1].lstrip('.').lower()
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        try:
+            with self._stage('convert_to_json', file_path):
+                text = NativeCodec.to_json(file_type, data)
+        except NativeCodecError as e:
+            log(f"内置转换不支持此文件 ({str(e)})，改用 MeidoSerialization")
+            return None
+        log("已转换为JSON (内存中)")
+        
+        with self._stage('replace', file_path):
+            modified_text, hits = self._replace_keywords_in_text(text, replacer, log)
+        if hits is None:
+            return 'error', hits
+        
+        status = 'unchanged'
+        if modified_text != text:
+            log(f"已在JSON中替换关键词 ({self._format_hits(hits)})")
+            try:
+                with self._stage('convert_to_mod', file_path):
+                    _atomic_write_bytes(file_path, NativeCodec.from_json(file_type, modified_text))
+            except NativeCodecError as e:
+                log(f"转回原格式失败: {str(e)}")
+                return 'error', hits
+            log("已将修改后的JSON转回原格式")
+            status = 'modified'
+        else:
+            log("文件中未找到关键词")
+        
+        if not delete_json:
+            with open(f"{file_path}.json", 'w', encoding='utf-8') as f:
+                f.write(modified_text)
+            log(f"已保留JSON文件: {file_path}.json")
+        return status, hits
+    
+    @staticmethod
+    def _format_hits(hits):
+        """把每条规则的命中次数格式化为 "规则1×2, 规则3×1" """
+        return ", ".join(f"规则{index + 1}×{count}" for index, count in enumerate(hits) if count)
+    
+    def _process_file_batch(self, files, meido_path, replacer, delete_json):
+        """批量处理一组文件，返回与 files 顺序一致的 [(状态, 日志列表, 命中次数), ...]
+        
+        文件先复制到临时目录，对整个目录各调用一次 convert2json 和 convert2mod，
+        再按文件名把结果对应回源文件。某个文件缺少输出时单独重试一次，
+        以便拿到该文件自己的错误信息，不影响同批的其他文件。
+        """
+        results = [['unchanged', [f"\n处理文件: {file_path}"], None] for file_path in files]
+        stage_dir = tempfile.mkdtemp(prefix="com3d2_batch_", dir=self._scratch_root())
+        
+        def fail(index, message):
+            results[index][0] = 'error'
+            results[index][1].append(message)
+        
+        def cancelled():
+            """已停止: 还没有写回的文件都标记为取消，续传时重新处理"""
+            for result in results:
+                if result[0] != 'modified':
+                    result[0] = 'cancelled'
+            return [tuple(result) for result in results]
+        
+        try:
+            # 1. 复制到临时目录，加序号前缀避免不同文件夹中的同名文件冲突
+            #    缓存命中的文件不需要复制，转换后直接从缓存取 JSON
+            cache = self.json_cache
+            staged = {}
+            cache_keys = {}
+            cached = set()
+            for index, file_path in enumerate(files):
+                if self.use_native_codec and NativeCodec.supports(file_path):
+                    # 内置转换不需要启动子进程，直接逐个处理
+                    results[index] = list(self._process_single_file(
+                        file_path, meido_path, replacer, delete_json))
+                    continue
+                staged_path = os.path.join(stage_dir, f"{index:05d}_{os.path.basename(file_path)}")
+                try:
+                    staged[index] = staged_path
+                    with self._stage('batch_stage', file_path):
+                        if cache is not None:
+                            cache_keys[index] = self._json_cache_key(file_path, meido_path)
+                            if cache.lookup(cache_keys[index]):
+                                cached.add(index)
+                                continue
+                        shutil.copy2(file_path, staged_path)
+                except OSError as e:
+                    staged.pop(index, None)
+                    fail(index, f"复制到临时目录失败: {str(e)}")
+            
+            if not staged:
+                return [tuple(result) for result in results]
+            
+            # 2. 整批转换为 JSON
+            if len(cached) < len(staged):
+                if self._cancel_event.is_set():
+                    return cancelled()
+                start = time.perf_counter()
+                self._run_batch_step(meido_path, "convert2json", stage_dir)
+                if self.run_report is not None:
+                    self.run_report.add_shared('batch_convert_to_json', time.perf_counter() - start,
+                                               [files[index] for index in staged if index not in cached])
+                # 停止时子进程被终止，不再逐个重试缺少输出的文件
+                if self._cancel_event.is_set():
+                    return cancelled()
+            
+            modified = {}
+            for index, staged_path in staged.items():
+                log = results[index][1].append
+                json_file = f"{staged_path}.json"
+                if index in cached and cache.fetch(cache_keys[index], json_file):
+                    log("已从缓存读取JSON")
+                elif os.path.exists(json_file):
+                    log("已转换为JSON (批量)")
+                    if cache is not None:
+                        cache.put(cache_keys[index], json_file)
+                else:
+                    if not os.path.exists(staged_path):
+                        shutil.copy2(files[index], staged_path)
+                    json_file = self._convert_to_json(staged_path, meido_path, log, cache_keys.get(index))
+                    if not json_file or not os.path.exists(json_file):
+                        fail(index, f"无法转换文件: {files[index]}")
+                        continue
+                    log("已转换为JSON")
+                
+                # 3. 替换关键词，未修改的文件不参与转回
+                with self._stage('replace', files[index]):
+                    hits = self._replace_keywords_in_json(json_file, replacer, log)
+                results[index][2] = hits
+                if hits is None:
+                    fail(index, f"无法替换文件: {files[index]}")
+                    continue
+                if any(hits):
+                    log(f"已在JSON中替换关键词 ({self._format_hits(hits)})")
+                    modified[index] = json_file
+                    # 删除暂存的原文件，转回后重新出现即表示转换成功
+                    if os.path.exists(staged_path):
+                        os.remove(staged_path)
+                else:
+                    log("文件中未找到关键词")
+                    self._keep_json_copy(json_file, files[index], delete_json, log)
+                    os.remove(json_file)
+                    if os.path.exists(staged_path):
+                        os.remove(staged_path)
+            
+            if not modified:
+                return [tuple(result) for result in results]
+            
+            # 4. 整批转回原格式
+            if self._cancel_event.is_set():
+                return cancelled()
+            start = time.perf_counter()
+            self._run_batch_step(meido_path, "convert2mod", stage_dir)
+            if self.run_report is not None:
+                self.run_report.add_shared('batch_convert_to_mod', time.perf_counter() - start,
+                                           [files[index] for index in modified])
+            if self._cancel_event.is_set():
+                return cancelled()
+            
+            for index, json_file in modified.items():
+                log = results[index][1].append
+                staged_path = staged[index]
+                if not os.path.exists(staged_path):
+                    if not self._convert_to_mod(json_file, meido_path, log) or not os.path.exists(staged_path):
+                        fail(index, "转回原格式失败")
+                        continue
+                _atomic_copy(staged_path, files[index])
+                log("已将修改后的JSON转回原格式")
+                results[index][0] = 'modified'
+                with self._stage('cache_store', files[index]):
+                    self._store_modified_json(json_file, files[index], meido_path, replacer)
+                self._keep_json_copy(json_file, files[index], delete_json, log)
+            
+            return [tuple(result) for result in results]
+        except Exception as e:
+            for index in range(len(files)):
+                if results[index][0] != 'modified':
+                    fail(index, f"批量处理时发生错误: {str(e)}")
+            return [tuple(result) for result in results]
+        finally:
+            shutil.rmtree(stage_dir, ignore_errors=True)
+    
+    def _run_batch_step(self, meido_path, command, path):
+        """对整个目录运行一次 MeidoSerialization，返回是否成功
+        
+        失败时不在这里记录日志，由调用方按文件检查输出并归属错误。
+        子进程登记在 _processes 中，停止时会被终止，此时返回 False。
+        """
+        try:
+            return self._run_child([meido_path, command, path])[0] == 0
+        except OSError:
+            return False
+    
+    def _keep_json_copy(self, json_file, file_path, delete_json, log):
+        """批量模式下如果不删除 JSON，则把 JSON 复制到源文件旁边，与逐个处理时一致"""
+        if not delete_json:
+            shutil.copyfile(json_file, f"{file_path}.json")
+            log(f"已保留JSON文件: {file_path}.json")
+    
+    def process_filename_replacement(self, folder, pattern, search_keyword, replace_keyword, recursive,
+                                      exclude=None, rename_dirs=False, update_refs=False, meido_path=None,
+                                      worker_count=1):
+        """处理文件名替换的主要逻辑，返回是否全部成功
+        
+        先生成重命名计划并检查冲突，再按计划一次执行；每一步都写入撤销日志。
+        update_refs 为 True 时通过引用索引找到引用了被重命名文件的 MOD 文件，只改写这些文件。
+        """
+        self._log("开始处理文件名...", 'filename')
+        
+        index = None
+        if update_refs:
+            self._check_scratch_dir(folder, 'filename')
+            self._log("正在更新引用索引...", 'filename')
+            index = ReferenceIndex.open(folder)
+            reread, reused, failed = index.update(lambda path: self._read_document(path, meido_path), worker_count)
+            self._log(f"引用索引: 读取了 {reread} 个文件, 复用 {reused} 个未变化的文件"
+                      + (f", {failed} 个文件无法读取" if failed else ""), 'filename')
+        
+        self._log("正在扫描并检查冲突...", 'filename')
+        plan = RenamePlan.build(folder, FileFilter.from_pattern(pattern, exclude), search_keyword, replace_keyword,
+                                recursive, rename_dirs)
+        
+        for source, new_name, reason in plan.conflicts:
+            self._log(f"跳过 ({reason}): {source} -> {new_name}", 'filename')
+        if plan.cycle_count:
+            self._log(f"有 {plan.cycle_count} 组循环重命名，将借助临时名称完成", 'filename')
+        
+        renamed_count = 0
+        error_count = 0
+        journal_path = None
+        done_operations = []
+        renames = {}  # 旧文件名(小写) -> 新文件名
+        if plan.operations:
+            journal_path, journal = _create_rename_journal()
+            temp_moves = set(plan.temp_moves)
+            temp_sources = {}
+            with journal:
+                journal.write(json.dumps({"folder": folder, "search": search_keyword, "replace": replace_keyword,
+                                          "time": time.time()}, ensure_ascii=False) + "\n")
+                for source, target, is_dir in plan.operations:
+                    if self._cancel_event.is_set():
+                        self._log("已取消", 'filename')
+                        break
+                    kind = "文件夹" if is_dir else "文件"
+                    try:
+                        # 计划之后目标可能被其他程序创建；os.rename 在 Linux 下会直接覆盖，因此先检查
+                        if os.path.lexists(target) and os.path.normcase(source) != os.path.normcase(target):
+                            raise FileExistsError(f"目标已存在: {target}")
+                        os.rename(source, target)
+                    except Exception as e:
+                        self._log(f"重命名{kind}时发生错误: {str(e)}", 'filename')
+                        error_count += 1
+                        continue
+                    journal.write(json.dumps({"src": source, "dst": target}, ensure_ascii=False) + "\n")
+                    journal.flush()
+                    done_operations.append((source, target, is_dir))
+                    if (source, target, is_dir) in temp_moves:
+                        # 循环中的临时名称，最后一步再输出日志
+                        temp_sources[target] = source
+                        continue
+                    source = temp_sources.pop(source, source)
+                    if not is_dir:
+                        renames[os.path.basename(source).lower()] = os.path.basename(target)
+                    renamed_count += 1
+                    self._log(f"重命名{kind}: {os.path.basename(source)} -> {os.path.basename(target)}", 'filename')
+        
+        updated_count = 0
+        if index is not None:
+            index.apply_renames(done_operations)
+            if renames:
+                updated_count, update_errors = self._update_references(index, renames, meido_path, journal_path)
+                error_count += update_errors
+            try:
+                index.save()
+            except OSError as e:
+                self._log(f"保存引用索引失败: {str(e)}", 'filename')
+        
+        self._log(f"\n{'='*60}", 'filename')
+        self._log(f"处理完成: 共检查 {plan.checked_count} 个文件, 重命名了 {renamed_count} 个, "
+                  f"因冲突跳过 {len(plan.conflicts)} 个, 发生 {error_count} 个错误", 'filename')
+        if index is not None:
+            self._log(f"更新了 {updated_count} 个文件中的引用", 'filename')
+        if journal_path:
+            self._log(f"撤销日志: {journal_path}", 'filename')
+        return error_count == 0 and not plan.conflicts
+    
+    def _read_document(self, file_path, meido_path=None):
+        """把 MOD 文件转换为 JSON 对象，不在源文件夹中留下文件；无法转换时返回 None
+        
+        启用内置转换时 .mate/.menu 直接在内存中解码，其他类型复制到临时文件夹后用 MeidoSerialization 转换。
+        """
+        if self.use_native_codec and NativeCodec.supports(file_path):
+            try:
+                with open(file_path, 'rb') as f:
+                    return NativeCodec.decode(os.path.splitext(file_path)[1].lstrip('.').lower(), f.read())
+            except NativeCodecError:
+                pass
+        if not meido_path:
+            return None
+        
+        stage_dir = tempfile.mkdtemp(prefix="com3d2_ref_", dir=self._scratch_root())
+        try:
+            staged = os.path.join(stage_dir, os.path.basename(file_path))
+            shutil.copyfile(file_path, staged)
+            json_file = self._convert_to_json(staged, meido_path, log=lambda message: None)
+            if not json_file:
+                return None
+            with open(json_file, 'r', encoding='utf-8') as f:
+                return json.loads(f.read(), parse_int=lambda t: -0.0 if t == "-0" else int(t))
+        finally:
+            shutil.rmtree(stage_dir, ignore_errors=True)
+    
+    def _rewrite_file_references(self, file_path, renames, meido_path=None):
+        """改写一个 MOD 文件中的文件名引用，返回 (修改处数, 修改后的 JSON 对象)"""
+        file_type = os.path.splitext(file_path)[1].lstrip('.').lower()
+        if self.use_native_codec and NativeCodec.supports(file_path):
+            try:
+                with open(file_path, 'rb') as f:
+                    document = NativeCodec.decode(file_type, f.read())
+                count = rewrite_references(document, renames)
+                if count:
+                    _atomic_write_bytes(file_path, NativeCodec.encode(file_type, document))
+                return count, document
+            except NativeCodecError:
+                pass
+        if not meido_path:
+            raise ValueError("需要 MeidoSerialization 才能修改此类文件")
+        
+        # 在临时文件夹中 转换-修改-转回，成功后再复制回原位置
+        stage_dir = tempfile.mkdtemp(prefix="com3d2_ref_", dir=self._scratch_root())
+        try:
+            staged = os.path.join(stage_dir, os.path.basename(file_path))
+            shutil.copyfile(file_path, staged)
+            messages = []
+            json_file = self._convert_to_json(staged, meido_path, log=messages.append)
+            if not json_file:
+                raise ValueError("; ".join(messages) or "转换失败")
+            with open(json_file, 'r', encoding='utf-8') as f:
+                document = json.loads(f.read(), parse_int=lambda t: -0.0 if t == "-0" else int(t))
+            count = rewrite_references(document, renames)
+            if count:
+                with open(json_file, 'w', encoding='utf-8') as f:
+                    f.write(json.dumps(document, ensure_ascii=False, separators=(',', ':')))
+                if not self._convert_to_mod(json_file, meido_path, log=messages.append):
+                    raise ValueError("; ".join(messages) or "转回失败")
+                _atomic_copy(staged, file_path)
+            return count, document
+        finally:
+            shutil.rmtree(stage_dir, ignore_errors=True)
+    
+    def _update_references(self, index, renames, meido_path, journal_path):
+        """改写引用了被重命名文件的 MOD 文件，返回 (修改的文件数, 错误数)
+        
+        改写前把原文件备份到撤销日志旁的文件夹，并在日志中记录，撤销时一并恢复。
+        没有修改或改写失败的文件（原文件未动）删除备份。
+        """
+        affected = sorted(index.referencing(renames))
+        backup_dir = journal_path[:-len(".jsonl")] + "_backup"
+        self._log(f"\n有 {len(affected)} 个文件引用了被重命名的文件", 'filename')
+        updated_count = 0
+        error_count = 0
+        for relative in affected:
+            if self._cancel_event.is_set():
+                self._log("已取消", 'filename')
+                break
+            file_path = os.path.join(index.folder, relative)
+            backup_path = os.path.join(backup_dir, f"{updated_count + error_count:05d}_{os.path.basename(relative)}")
+            count = 0
+            try:
+                os.makedirs(backup_dir, exist_ok=True)
+                shutil.copyfile(file_path, backup_path)
+                count, document = self._rewrite_file_references(file_path, renames, meido_path)
+            except Exception as e:
+                self._log(f"更新引用时发生错误: {relative}: {str(e)}", 'filename')
+                error_count += 1
+            if not count:
+                try:
+                    os.remove(backup_path)
+                except OSError:
+                    pass
+            else:
+                with open(journal_path, 'a', encoding='utf-8') as journal:
+                    journal.write(json.dumps({"restore": file_path, "backup": backup_path}, ensure_ascii=False) + "\n")
+                updated_count += 1
+                index.refresh(relative, document)
+                self._log(f"更新引用: {relative} ({count} 处)", 'filename')
+        try:
+            os.rmdir(backup_dir)  # 没有留下备份时不保留空文件夹
+        except OSError:
+            pass
+        return updated_count, error_count
+    
+    def undo_rename(self, journal_path=None):
+        """按撤销日志倒序恢复原名称，默认撤销最近一次重命名，返回是否全部成功"""
+        journal_path = journal_path or latest_rename_journal()
+        if not journal_path:
+            self._log("没有可以撤销的重命名", 'filename')
+            return False
+        
+        with open(journal_path, 'r', encoding='utf-8') as journal:
+            entries = [json.loads(line) for line in journal if line.strip()]
+        
+        self._log(f"撤销重命名: {journal_path}", 'filename')
+        restored_count = 0
+        error_count = 0
+        for entry in reversed(entries):
+            try:
+                if "restore" in entry:
+                    # 恢复被改写引用的文件内容（改写发生在重命名之后，所以先恢复）
+                    _atomic_copy(entry["backup"], entry["restore"])
+                    restored_count += 1
+                    continue
+                if "src" not in entry:
+                    continue
+                source, target = entry["src"], entry["dst"]
+                if os.path.lexists(source) and os.path.normcase(source) != os.path.normcase(target):
+                    raise FileExistsError(f"原名称已被占用: {source}")
+                os.rename(target, source)
+                restored_count += 1
+            except Exception as e:
+                self._log(f"恢复 {entry.get('dst') or entry.get('restore')} 时发生错误: {str(e)}", 'filename')
+                error_count += 1
+        
+        if error_count == 0:
+            # 已撤销的日志不再作为"最近一次"
+            os.replace(journal_path, journal_path + ".undone")
+            shutil.rmtree(journal_path[:-len(".jsonl")] + "_backup", ignore_errors=True)
+        self._log(f"\n{'='*60}", 'filename')
+        self._log(f"撤销完成: 恢复了 {restored_count} 项, 发生 {error_count} 个错误", 'filename')
+        return error_count == 0
+    
+    def process_conversion(self, path, meido_path, conversion_type, file_type='', strict=False,
+                           image_format='png', compress=False, force_png=True,
+                           worker_count=1, recursive=True, link_duplicates=False, files=None):
+        """处理格式转换的主要逻辑，返回是否成功
+        
+        convert2tex / convert2image 使用并行去重转换（见 _convert_images_parallel），
+        打开了 convert_cache 时相同内容、相同选项的转换结果直接从缓存取得。
+        files 不为空时只转换其中的文件（监视模式）。
+        """
+        self._log(f"开始 {conversion_type} 转换...", 'convert')
+        self._check_scratch_dir(path, 'convert')
+        
+        # 构建命令参数
+        args = [conversion_type, path]
+        
+        # 添加可选参数
+        if file_type:
+            args.extend(['--type', file_type])
+        
+        if strict:
+            args.append('--strict')
+        
+        # 特定转换类型的参数
+        if conversion_type == 'convert2image':
+            if image_format and image_format != 'png':
+                args.extend(['--format', image_format])
+        
+        elif conversion_type == 'convert2tex':
+            if compress:
+                args.append('--compress')
+            args.extend(['--forcePng', str(force_png).lower()])
+        
+        if conversion_type in ('convert2tex', 'convert2image'):
+            return self._convert_images_parallel(path, meido_path, conversion_type, args[2:],
+                                                 worker_count, recursive, link_duplicates, files)
+        
+        if files is not None:
+            # 其他转换类型逐个文件调用 MeidoSerialization
+            success = True
+            for file_path in files:
+                if self._cancel_event.is_set():
+                    return False
+                self._log(f"执行命令: {meido_path} {conversion_type} {file_path}", 'convert')
+                success = self._run_meido_command(meido_path, [conversion_type, file_path] + args[2:],
+                                                  'convert') and success
+            return success
+        
+        self._log(f"执行命令: {meido_path} {' '.join(args)}", 'convert')
+        
+        # 运行命令
+        self._start_progress(path, conversion_type, self.convert_progress)
+        success = False
+        try:
+            success = self._run_meido_command(meido_path, args, 'convert', self.convert_progress)
+        finally:
+            self.convert_progress.finish(success)
+        
+        if success:
+            self._log(f"\n{'='*60}", 'convert')
+            self._log("转换完成!", 'convert')
+        else:
+            self._log(f"\n{'='*60}", 'convert')
+            self._log("转换过程中出现错误，请查看上方日志", 'convert')
+        return success
+    
+    def _convert_images_parallel(self, folder, meido_path, conversion_type, options,
+                                 worker_count=1, recursive=True, link_duplicates=False, files=None):
+        """并行、去重的图片与 TEX 互转，返回是否成功
+        
+        先按内容哈希分组，内容相同的文件只转换一次，其余文件直接复制（或硬链接）转换结果；
+        不同内容的文件分成若干组，每组复制到一个临时目录，由多个 MeidoSerialization 进程同时转换，
+        结果再按序号前缀放回各源文件旁边。options 为传给 MeidoSerialization 的其他参数。
+        """
+        progress = self.convert_progress
+        self._cancel_event.clear()
+        progress.reset()
+        start_time = time.perf_counter()
+        worker_count = max(1, worker_count)
+        
+        # 1. 查找并计算内容哈希
+        def digest(file_path):
+            try:
+                return file_path, _file_digest(file_path)
+            except OSError as e:
+                return file_path, e
+        
+        if files is not None:
+            files = list(files)
+        elif os.path.isfile(folder):
+            files = [folder]
+        else:
+            files = iter_files(folder, recursive, FileFilter(_CONVERSION_INPUTS[conversion_type]))
+        groups = OrderedDict()
+        error_count = 0
+        for file_path, result in _ordered_parallel(digest, files, worker_count):
+            if isinstance(result, OSError):
+                self._log(f"读取文件失败: {file_path}: {str(result)}", 'convert')
+                error_count += 1
+                continue
+            groups.setdefault(result, []).append(file_path)
+            if self._cancel_event.is_set():
+                break
+        
+        total = sum(len(members) for members in groups.values())
+        progress.set_total(total)
+        if not groups:
+            progress.finish(error_count == 0)
+            self._log("没有找到需要转换的文件", 'convert')
+            return error_count == 0
+        
+        self._log(f"找到 {total} 个文件，其中 {len(groups)} 个内容不同，"
+                  f"{total - len(groups)} 个重复文件将直接复用转换结果", 'convert')
+        
+        # 2. 先从缓存取结果，缓存键包含转换选项和 MeidoSerialization 的指纹
+        cache = self.convert_cache
+        unique = []
+        converted_count = 0
+        hit_count = 0
+        fetch_dir = tempfile.mkdtemp(prefix="com3d2_conv_", dir=self._scratch_root()) if cache is not None else None
+        for digest_value, members in groups.items():
+            key = None
+            if cache is not None:
+                key = hashlib.blake2b(
+                    "\0".join([digest_value, conversion_type, self._tool_fingerprint(meido_path)] + list(options))
+                    .encode('utf-8'), digest_size=20).hexdigest()
+                outputs = self._fetch_cached_outputs(key, fetch_dir)
+                if outputs is not None:
+                    try:
+                        self._place_outputs(members, outputs, link_duplicates)
+                        self._log(f"已从缓存取得: {members[0]}", 'convert')
+                        converted_count += len(members)
+                        hit_count += 1
+                        progress.advance(len(members))
+                        continue
+                    except OSError as e:
+                        self._log(f"写入缓存的转换结果失败: {members[0]}: {str(e)}", 'convert')
+            unique.append((key, members))
+        if fetch_dir is not None:
+            shutil.rmtree(fetch_dir, ignore_errors=True)
+        
+        # 3. 其余不同内容的文件分组并行转换，每组不超过 64 个以便及时更新进度
+        shards = []
+        if unique:
+            shard_size = min(64, max(1, -(-len(unique) // worker_count)))
+            shards = list(_chunked(unique, shard_size))
+            self._log(f"执行命令: {meido_path} {conversion_type} <临时目录> {' '.join(options)} "
+                      f"（{len(shards)} 组, {min(worker_count, len(shards))} 个进程）", 'convert')
+        
+        timings = []
+        success = False
+        try:
+            with ThreadPoolExecutor(max_workers=worker_count) as executor:
+                futures = [executor.submit(self._convert_image_shard, shard, meido_path,
+                                           conversion_type, options, link_duplicates)
+                           for shard in shards]
+                for future in futures:
+                    shard_converted, shard_errors, shard_timings = future.result()
+                    converted_count += shard_converted
+                    error_count += shard_errors
+                    timings.extend(shard_timings)
+            success = error_count == 0 and not self._cancel_event.is_set()
+        finally:
+            progress.finish(success)
+        
+        # 4. 汇总
+        if cache is not None:
+            try:
+                cache.save()
+            except OSError as e:
+                self._log(f"保存转换缓存索引失败: {str(e)}", 'convert')
+        elapsed = time.perf_counter() - start_time
+        self._log(f"\n{'='*60}", 'convert')
+        if self._cancel_event.is_set():
+            self._log("已取消", 'convert')
+        self._log(f"转换完成: {converted_count} 个文件（实际转换 {len(timings)} 个），"
+                  f"发生 {error_count} 个错误，耗时 {elapsed:.2f} 秒，"
+                  f"{converted_count / elapsed if elapsed > 0 else 0:.1f} 个/秒", 'convert')
+        if cache is not None:
+            self._log(f"转换缓存: 命中 {hit_count} 个, 未命中 {len(unique)} 个, "
+                      f"缓存大小 {cache.total_bytes / 1024 / 1024:.1f} MB / {cache.max_bytes / 1024 / 1024:.0f} MB",
+                      'convert')
+        if timings:
+            self._log("耗时最长的文件:", 'convert')
+            for seconds, file_path in sorted(timings, reverse=True)[:5]:
+                self._log(f"  {seconds:.2f} 秒  {file_path}", 'convert')
+        if not success and not self._cancel_event.is_set():
+            self._log("转换过程中出现错误，请查看上方日志", 'convert')
+        return success
+    
+    def _convert_image_shard(self, shard, meido_path, conversion_type, options, link_duplicates):
+        """转换一组内容不同的文件，返回 (完成的文件数, 错误数, [(耗时, 源文件), ...])
+        
+        shard 中每一项是 (缓存键, 内容相同的一组文件)，只有第一个文件会被转换，缓存键不为 None 时结果存入缓存。
+        单个文件的耗时按 MeidoSerialization 输出中提到该文件的时间计算，没有提到时按整组平均。
+        """
+        if self._cancel_event.is_set():
+            return 0, 0, []
+        progress = self.convert_progress
+        stage_dir = tempfile.mkdtemp(prefix="com3d2_conv_", dir=self._scratch_root())
+        converted_count = 0
+        error_count = 0
+        timings = []
+        try:
+            prefixes = {}
+            for index, (_, members) in enumerate(shard):
+                prefix = f"{index:05d}_"
+                try:
+                    shutil.copy2(members[0], os.path.join(stage_dir, prefix + os.path.basename(members[0])))
+                    prefixes[prefix] = index
+                except OSError as e:
+                    self._log(f"复制到临时目录失败: {members[0]}: {str(e)}", 'convert')
+                    error_count += len(members)
+                    progress.advance(len(members))
+            staged_names = set(os.listdir(stage_dir))
+            
+            # 记录输出中每个文件最后一次被提到的时间；失败时再把输出写入日志
+            output = deque(maxlen=200)
+            mentioned = {}
+            
+            def on_line(line):
+                output.append(line)
+                for match in re.finditer(r"(\d{5})_", line):
+                    index = prefixes.get(match.group(0))
+                    if index is not None:
+                        mentioned[index] = time.perf_counter()
+            
+            shard_start = time.perf_counter()
+            finished = self._run_meido_command(
+                meido_path, [conversion_type, stage_dir] + list(options), 'convert', on_line=on_line)
+            shard_elapsed = time.perf_counter() - shard_start
+            if self._cancel_event.is_set():
+                return converted_count, error_count, timings
+            
+            outputs = {}
+            for name in os.listdir(stage_dir):
+                if name not in staged_names and name[:6] in prefixes:
+                    outputs.setdefault(prefixes[name[:6]], []).append(name)
+            
+            # 按输出顺序估算单个文件的耗时
+            durations = {}
+            previous = shard_start
+            for index, moment in sorted(mentioned.items(), key=lambda item: item[1]):
+                durations[index] = moment - previous
+                previous = moment
+            average = shard_elapsed / max(1, len(prefixes))
+            
+            if not finished or len(outputs) < len(prefixes):
+                for line in output:
+                    self._log(line, 'convert')
+            
+            for index in sorted(prefixes.values()):
+                key, members = shard[index]
+                source = members[0]
+                names = outputs.get(index)
+                if not names:
+                    self._log(f"转换失败: {source}", 'convert')
+                    error_count += len(members)
+                    progress.advance(len(members))
+                    continue
+                timings.append((durations.get(index, average), source))
+                # 输出文件名 = 源文件主名 + 后缀，重复文件使用各自的主名
+                stem = os.path.splitext(os.path.basename(source))[0]
+                results = []
+                for name in sorted(names):
+                    output_name = name[6:]
+                    suffix = output_name[len(stem):] if output_name.startswith(stem) else os.path.splitext(output_name)[1]
+                    results.append((suffix, os.path.join(stage_dir, name)))
+                try:
+                    self._place_outputs(members, results, link_duplicates)
+                    self._log(f"已转换: {source}" + (f"（另有 {len(members) - 1} 个重复文件）" if len(members) > 1 else ""),
+                              'convert')
+                    converted_count += len(members)
+                except OSError as e:
+                    self._log(f"写入转换结果失败: {source}: {str(e)}", 'convert')
+                    error_count += len(members)
+                    progress.advance(len(members))
+                    continue
+                progress.advance(len(members))
+                if key is not None:
+                    try:
+                        self._store_cached_outputs(key, results)
+                    except OSError as e:
+                        self._log(f"写入转换缓存失败: {source}: {str(e)}", 'convert')
+            return converted_count, error_count, timings
+        finally:
+            shutil.rmtree(stage_dir, ignore_errors=True)
+    
+    @staticmethod
+    def _place_outputs(members, outputs, link_duplicates):
+        """把转换结果 [(后缀, 文件路径), ...] 放到每个源文件旁边（源文件主名 + 后缀）"""
+        for suffix, output_path in outputs:
+            source = members[0]
+            first_target = os.path.join(os.path.dirname(source), os.path.splitext(os.path.basename(source))[0] + suffix)
+            _place_file(output_path, first_target)
+            for member in members[1:]:
+                target = os.path.join(os.path.dirname(member), os.path.splitext(os.path.basename(member))[0] + suffix)
+                if os.path.normcase(target) != os.path.normcase(first_target):
+                    _place_file(first_target, target, link_duplicates)
+    
+    def _fetch_cached_outputs(self, key, fetch_dir):
+        """从转换缓存取出一个文件的全部转换结果到 fetch_dir，返回 [(后缀, 文件路径), ...]，未命中时返回 None
+        
+        结果列表（各输出文件的后缀）单独存为一个条目，任何一个输出已被淘汰都视为未命中。
+        """
+        cache = self.convert_cache
+        data = cache.get_bytes(key)
+        if data is None:
+            return None
+        try:
+            suffixes = json.loads(data.decode('utf-8'))
+        except ValueError:
+            return None
+        outputs = []
+        for position, suffix in enumerate(suffixes):
+            blob_key = f"{key}_{position}"
+            output_path = os.path.join(fetch_dir, blob_key)
+            if not cache.fetch(blob_key, output_path):
+                return None
+            outputs.append((suffix, output_path))
+        return outputs
+    
+    def _store_cached_outputs(self, key, outputs):
+        """把一个文件的全部转换结果存入转换缓存"""
+        cache = self.convert_cache
+        for position, (_, output_path) in enumerate(outputs):
+            cache.put(f"{key}_{position}", output_path)
+        cache.put_bytes(key, json.dumps([suffix for suffix, _ in outputs]).encode('utf-8'))
+    
+    def watch_folder(self, folder, file_filter, job, run, run_initial, channel='content', recursive=True,
+                     debounce=1.0, poll_interval=2.0, use_inotify=True):
+        """监视文件夹，文件变化时调用 run(变化的文件列表, record) 只处理这些文件，直到调用 cancel()
+        
+        job 是描述任务（规则、选项）的可序列化对象，与文件夹一起决定清单文件。
+        没有相同任务的清单时先调用 run_initial(record) 完整处理一次；有清单时只处理上次监视以来变化的文件。
+        run 写回文件后应调用 record(路径)，这样本工具写回的内容不会被当成新的变化。
+        """
+        if not os.path.isdir(folder):
+            self._log("监视模式需要选择文件夹", channel)
+            return False
+        self._watch_stop.clear()
+        key = hashlib.blake2b(json.dumps([os.path.normcase(os.path.abspath(folder)), job], ensure_ascii=False)
+                              .encode('utf-8'), digest_size=8).hexdigest()
+        watcher = FolderWatcher(folder, file_filter, os.path.join(_default_cache_dir(), "watch_manifest", f"{key}.json"),
+                                recursive, debounce, poll_interval, use_inotify,
+                                log=lambda message: self._log(message, channel))
+        
+        def process(files, states):
+            run(files, lambda path: states.update(watcher.state([path])))
+            # 被停止时这批文件可能没有处理完，不记入清单，下次监视时重新检查
+            if not self._watch_stop.is_set():
+                watcher.commit(files, states)
+        
+        if not watcher.load_manifest():
+            snapshot = watcher.snapshot()
+            run_initial(lambda path: snapshot.update(watcher.state([path])))
+            if self._watch_stop.is_set():
+                return False
+            watcher.set_manifest(snapshot)
+        
+        for files in watcher.batches(self._watch_stop):
+            self._log(f"\n{'='*60}", channel)
+            self._log(f"{time.strftime('%H:%M:%S')} 检测到 {len(files)} 个文件发生变化", channel)
+            process(files, watcher.state(files))
+            self._log(f"继续监视文件夹 ({watcher.mode})", channel)
+        self._log("已停止监视", channel)
+        return True
+    
+    def watch_replacement(self, folder, meido_path, replacer, file_types, recursive, delete_json,
+                          worker_count=1, batch_size=0, exclude=None, prefilter=False, report_path=None,
+                          debounce=1.0, poll_interval=2.0, use_inotify=True):
+        """监视模式的内容替换: 先完整处理一次，之后只处理发生变化的文件
+        
+        每一轮的耗时报告分别保存，文件名加上开始时间和轮次（如 run_report_20260101_120000_001.json）。
+        """
+        job = ['replace', replacer.rules, file_types or "", bool(recursive), bool(delete_json), exclude or ""]
+        rounds = itertools.count()
+        
+        def round_report_path():
+            if not report_path:
+                return None
+            base, ext = os.path.splitext(report_path)
+            return f"{base}_{time.strftime('%Y%m%d_%H%M%S')}_{next(rounds):03d}{ext}"
+        
+        def run_initial(record):
+            self.process_files_replacement(folder, meido_path, replacer, file_types, recursive, delete_json,
+                                           worker_count, batch_size, exclude, 1, prefilter, round_report_path(),
+                                           on_written=record)
+        
+        def run(files, record):
+            self.process_files_replacement(folder, meido_path, replacer, file_types, recursive, delete_json,
+                                           worker_count, batch_size, exclude, 1, prefilter, round_report_path(),
+                                           files=files, on_written=record)
+        
+        return self.watch_folder(folder, FileFilter.from_types(file_types, exclude), job, run, run_initial,
+                                 'content', recursive, debounce, poll_interval, use_inotify)
+    
+    def watch_conversion(self, path, meido_path, conversion_type, file_type='', strict=False,
+                         image_format='png', compress=False, force_png=True, worker_count=1, recursive=True,
+                         link_duplicates=False, debounce=1.0, poll_interval=2.0, use_inotify=True):
+        """监视模式的格式转换: 先完整转换一次，之后只转换发生变化的文件"""
+        if conversion_type not in _CONVERSION_INPUTS:
+            self._log("自动转换 (convert) 的输出也是它的输入，不能使用监视模式，请选择具体的转换方向", 'convert')
+            return False
+        options = (meido_path, conversion_type, file_type, strict, image_format, compress, force_png,
+                   worker_count, recursive, link_duplicates)
+        job = ['convert', conversion_type, file_type or "", bool(strict), image_format, bool(compress),
+               bool(force_png), bool(recursive)]
+        return self.watch_folder(path, FileFilter(_CONVERSION_INPUTS[conversion_type]), job,
+                                 lambda files, record: self.process_conversion(path, *options, files=files),
+                                 lambda record: self.process_conversion(path, *options),
+                                 'convert', recursive, debounce, poll_interval, use_inotify)
+    
+    def process_determine(self, path, meido_path, file_type='', strict=False):
+        """处理文件类型检测的主要逻辑，返回是否成功"""
+        self._log("开始检测文件类型...", 'determine')
+        
+        # 构建命令参数
+        args = ['determine', path]
+        
+        # 添加可选参数
+        if strict:
+            args.append('--strict')
+        
+        if file_type:
+            args.extend(['--type', file_type])
+        
+        self._log(f"执行命令: {meido_path} {' '.join(args)}", 'determine')
+        
+        # 运行命令
+        self._start_progress(path, 'determine', self.determine_progress)
+        success = False
+        try:
+            success = self._run_meido_command(meido_path, args, 'determine', self.determine_progress)
+        finally:
+            self.determine_progress.finish(success)
+        
+        if success:
+            self._log(f"\n{'='*60}", 'determine')
+            self._log("检测完成!", 'determine')
+        else:
+            self._log(f"\n{'='*60}", 'determine')
+            self._log("检测过程中出现错误，请查看上方日志", 'determine')
+        return success
+
+
+class PathTable:
+    """紧凑的路径表，供预览窗口显示大量文件
+    
+    文件夹路径只保存一次，每行只存文件夹序号、文件名和可选的新名称、说明；
+    排序和筛选只生成行号数组，不复制路径。可以一个线程添加、另一个线程读取。
+    """
+    
+    def __init__(self):
+        self.dirs = []
+        self._dir_ids = {}
+        self.dir_index = array('I')
+        self.names = []
+        self.targets = []
+        self.notes = {}  # 行号 -> 说明（多数行没有）
+    
+    def __len__(self):
+        return len(self.names)
+    
+    def add(self, path, target=None, note=None):
+        folder, name = os.path.split(path)
+        dir_id = self._dir_ids.get(folder)
+        if dir_id is None:
+            dir_id = self._dir_ids[folder] = len(self.dirs)
+            self.dirs.append(folder)
+        self.dir_index.append(dir_id)
+        self.targets.append(target)
+        if note:
+            self.notes[len(self.names)] = note
+        # 最后添加文件名，读取方按 len() 只会看到完整的行
+        self.names.append(name)
+    
+    def path(self, row):
+        return os.path.join(self.dirs[self.dir_index[row]], self.names[row])
+    
+    def value(self, row, column):
+        """一行中某列的显示内容，列为 order/name/target/folder/note"""
+        if column == 'order':
+            return row + 1
+        if column == 'name':
+            return self.names[row]
+        if column == 'target':
+            return self.targets[row] or ""
+        if column == 'folder':
+            return self.dirs[self.dir_index[row]]
+        return self.notes.get(row, "")
+    
+    def view(self, text="", sort=None, reverse=False):
+        """按文字筛选（不区分大小写，匹配路径或新名称）并排序，返回行号序列
+        
+        不筛选也不排序时返回 range，不占额外内存。
+        """
+        rows = range(len(self))
+        if text:
+            needle = text.casefold()
+            names, targets, dir_index = self.names, self.targets, self.dir_index
+            if os.sep in needle or '/' in needle:
+                rows = [row for row in rows
+                        if needle in self.path(row).casefold() or needle in (targets[row] or "").casefold()]
+            else:
+                # 不含路径分隔符时文件夹只需各判断一次
+                dir_match = [needle in folder.casefold() for folder in self.dirs]
+                rows = [row for row in rows
+                        if dir_match[dir_index[row]] or needle in names[row].casefold()
+                        or (targets[row] is not None and needle in targets[row].casefold())]
+        if sort == 'folder':
+            rows = sorted(rows, key=lambda row: (self.dirs[self.dir_index[row]].casefold(), self.names[row].casefold()),
+                          reverse=reverse)
+        elif sort and sort != 'order':
+            rows = sorted(rows, key=lambda row: str(self.value(row, sort)).casefold(), reverse=reverse)
+        elif reverse:
+            rows = rows[::-1]
+        return rows if isinstance(rows, range) else array('I', rows)
+
+
+class PreviewWindow:
+    """预览窗口: 用 Treeview 分页显示 PathTable，滚动到接近底部时再加载下一页
+    
+    表格由后台线程填充（完成后调用 finish），窗口定时刷新行数；点击列标题排序，输入文字筛选。
+    """
+    PAGE_SIZE = 500
+    REFRESH_MS = 200
+    
+    def __init__(self, root, title, columns):
+        self.table = PathTable()
+        self.columns = columns  # [(列名, 标题, 宽度)]
+        self.closed = False
+        self.done = False
+        self.summary = ""
+        self._rows = range(0)
+        self._loaded = 0
+        self._sort = None
+        self._reverse = False
+        self._at_end = False
+        self._page_pending = False
+        self._filter_job = None
+        
+        self.window = tk.Toplevel(root)
+        self.window.title(title)
+        self.window.geometry("1100x700")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+        
+        top = ttk.Frame(self.window, padding="5")
+        top.pack(fill=tk.X)
+        self.status = ttk.Label(top, text="正在查找...")
+        self.status.pack(side=tk.LEFT, padx=5)
+        self.filter_var = tk.StringVar()
+        ttk.Entry(top, textvariable=self.filter_var, width=30).pack(side=tk.RIGHT, padx=5)
+        ttk.Label(top, text="筛选:").pack(side=tk.RIGHT)
+        self.filter_var.trace_add('write', self._schedule_filter)
+        
+        tree_frame = ttk.Frame(self.window)
+        tree_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.tree = ttk.Treeview(tree_frame, columns=[key for key, _, _ in columns], show="headings")
+        for key, heading, width in columns:
+            self.tree.heading(key, text=heading, command=lambda key=key: self._sort_by(key))
+            self.tree.column(key, width=width, stretch=(key == 'folder'))
+        self.scrollbar = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self._on_scroll)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        self.window.after(self.REFRESH_MS, self._poll)
+    
+    def finish(self, summary=""):
+        """表格填充完毕（可在任意线程调用）"""
+        self.summary = summary
+        self.done = True
+    
+    def close(self):
+        self.closed = True
+        self.window.destroy()
+    
+    def _is_plain(self):
+        return self._sort is None and not self.filter_var.get().strip()
+    
+    def _poll(self):
+        if self.closed:
+            return
+        done = self.done
+        if self._is_plain():
+            # 未排序、未筛选时按找到的顺序直接追加显示
+            self._rows = range(len(self.table))
+            if self._loaded < self.PAGE_SIZE or self._at_end:
+                self._load_page()
+        elif done:
+            self._apply()
+        self._update_status()
+        if not done:
+            self.window.after(self.REFRESH_MS, self._poll)
+    
+    def _load_page(self):
+        self._page_pending = False
+        if self.closed:
+            return
+        end = min(self._loaded + self.PAGE_SIZE, len(self._rows))
+        keys = [key for key, _, _ in self.columns]
+        for position in range(self._loaded, end):
+            row = self._rows[position]
+            self.tree.insert("", tk.END, values=[self.table.value(row, key) for key in keys])
+        self._loaded = end
+        self._update_status()
+    
+    def _on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self._at_end = float(last) >= 0.95
+        if self._at_end and self._loaded < len(self._rows) and not self._page_pending:
+            self._page_pending = True
+            self.window.after_idle(self._load_page)
+    
+    def _apply(self):
+        """重新筛选、排序并从第一页开始显示"""
+        self._filter_job = None
+        if self.closed:
+            return
+        self._rows = self.table.view(self.filter_var.get().strip(), self._sort, self._reverse)
+        self.tree.delete(*self.tree.get_children())
+        self._loaded = 0
+        self._load_page()
+        self.tree.yview_moveto(0)
+    
+    def _schedule_filter(self, *args):
+        if self._filter_job is not None:
+            self.window.after_cancel(self._filter_job)
+        self._filter_job = self.window.after(300, self._apply)
+    
+    def _sort_by(self, key):
+        """点击列标题: 升序 → 降序 → 恢复原顺序"""
+        if self._sort != key:
+            self._sort, self._reverse = key, False
+        elif not self._reverse:
+            self._reverse = True
+        else:
+            self._sort, self._reverse = None, False
+        for column, heading, _ in self.columns:
+            arrow = (" ▼" if self._reverse else " ▲") if column == self._sort else ""
+            self.tree.heading(column, text=heading + arrow)
+        self._apply()
+    
+    def _update_status(self):
+        text = f"共 {len(self.table)} 个"
+        if not self.done:
+            text += "（正在查找...）"
+        if not self._is_plain():
+            text += f"，筛选后 {len(self._rows)} 个"
+        text += f"，已显示 {self._loaded} 行"
+        if self.summary:
+            text += f"    {self.summary}"
+        self.status.configure(text=text)
+
+
+class COM3D2ToolGUI(COM3D2ToolCore):
     def __init__(self):
-        super().__init__()
-        self.title("COM3D2 MOD 文件处理工具")
-        self.geometry("1400x1000")
+        super().__init__(log=self._write_log)
+        self.root = tk.Tk()
+        self.root.title("COM3D2 MOD 文件处理工具")
+        self.root.geometry("1400x1000")
         
         # 设置变量
         self.folder_path = tk.StringVar()
@@ -36,14 +4002,75 @@ class COM3D2ToolGUI(tk.Tk):
         self.image_format = tk.StringVar(value="png")
         self.compress_tex_var = tk.BooleanVar(value=False)
         self.force_png_var = tk.BooleanVar(value=True)
+        self.worker_count_var = tk.IntVar(value=os.cpu_count() or 1)
+        self.batch_mode_var = tk.BooleanVar(value=False)
+        self.batch_size_var = tk.IntVar(value=200)
+        self.use_json_cache_var = tk.BooleanVar(value=True)
+        self.json_cache_size_var = tk.IntVar(value=1024)
+        self.native_codec_var = tk.BooleanVar(value=False)
+        self.exclude_pattern = tk.StringVar()
+        self.parallel_scan_var = tk.BooleanVar(value=False)
+        self.prefilter_var = tk.BooleanVar(value=True)
+        self.rename_dirs_var = tk.BooleanVar(value=False)
+        self.link_duplicates_var = tk.BooleanVar(value=False)
+        self.use_convert_cache_var = tk.BooleanVar(value=True)
+        self.scratch_dir_var = tk.StringVar()
+        self.convert_cache_size_var = tk.IntVar(value=2048)
+        self.update_refs_var = tk.BooleanVar(value=False)
+        self.watch_content_var = tk.BooleanVar(value=False)
+        self.watch_convert_var = tk.BooleanVar(value=False)
+        
+        self._progress_views = []
+        self._workers = []
         
         # 初始化界面
         self._init_ui()
         
+        # 日志: 工作线程只写队列，由主线程批量刷新到界面，并完整写入日志文件
+        self.log_sink = LogSink(self.root, log_path=os.path.join(_default_cache_dir(), "logs", "com3d2_tool.log"))
+        self._log_widgets = {
+            'content': self.log_text,
+            'filename': self.filename_log_text,
+            'convert': self.convert_log_text,
+            'determine': self.determine_log_text,
+        }
+        self.log_sink.register(self.log_text, "内容替换")
+        self.log_sink.register(self.filename_log_text, "文件名替换")
+        self.log_sink.register(self.convert_log_text, "格式转换")
+        self.log_sink.register(self.determine_log_text, "类型检测")
+        self.root.after(200, self._poll_progress)
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
+    
+    def mainloop(self):
+        self.root.mainloop()
+    
+    def _start_worker(self, target, args):
+        """在后台线程中运行任务，并记录线程以便关闭窗口时等待其结束"""
+        self._workers = [worker for worker in self._workers if worker.is_alive()]
+        worker = threading.Thread(target=target, args=args, daemon=True)
+        self._workers.append(worker)
+        worker.start()
+    
+    def _on_close(self):
+        """关闭窗口: 有任务在运行时先停止任务，等当前文件写完再退出，避免留下写了一半的文件"""
+        if not any(worker.is_alive() for worker in self._workers):
+            self.root.destroy()
+            return
+        if not messagebox.askyesno("确认", "还有任务正在运行，停止任务并退出?\n内容替换的进度会保存，下次可以继续"):
+            return
+        self.cancel()
+        self._wait_workers_and_close(time.monotonic() + 10)
+    
+    def _wait_workers_and_close(self, deadline):
+        if any(worker.is_alive() for worker in self._workers) and time.monotonic() < deadline:
+            self.root.after(100, self._wait_workers_and_close, deadline)
+            return
+        self.root.destroy()
+        
     def _init_ui(self):
         """初始化用户界面"""
         # 创建主框架
-        main_frame = ttk.Frame(self, padding="10")
+        main_frame = ttk.Frame(self.root, padding="10")
         main_frame.pack(fill=tk.BOTH, expand=True)
         
         # 创建选项卡
@@ -96,22 +4123,82 @@ class COM3D2ToolGUI(tk.Tk):
         ttk.Checkbutton(options_frame, text="处理完成后删除 JSON 文件", variable=self.delete_json_var).pack(side=tk.LEFT, padx=5)
         ttk.Checkbutton(options_frame, text="严格模式", variable=self.strict_mode_var).pack(side=tk.LEFT, padx=5)
         
+        perf_frame = ttk.Frame(folder_frame)
+        perf_frame.grid(row=4, column=0, columnspan=3, sticky=tk.W, padx=5, pady=5)
+        ttk.Label(perf_frame, text="并行处理数:").pack(side=tk.LEFT, padx=5)
+        ttk.Spinbox(perf_frame, from_=1, to=64, textvariable=self.worker_count_var, width=5).pack(side=tk.LEFT)
+        ttk.Checkbutton(perf_frame, text="批量调用 MeidoSerialization", variable=self.batch_mode_var).pack(side=tk.LEFT, padx=(15, 5))
+        ttk.Label(perf_frame, text="每批文件数:").pack(side=tk.LEFT, padx=5)
+        ttk.Spinbox(perf_frame, from_=2, to=5000, textvariable=self.batch_size_var, width=6).pack(side=tk.LEFT)
+        ttk.Checkbutton(perf_frame, text="内置转换 .mate/.menu (实验性，不调用 MeidoSerialization)", variable=self.native_codec_var).pack(side=tk.LEFT, padx=(15, 5))
+        ttk.Checkbutton(perf_frame, text="跳过不含关键词的文件", variable=self.prefilter_var).pack(side=tk.LEFT, padx=(15, 5))
+        
+        cache_frame = ttk.Frame(folder_frame)
+        cache_frame.grid(row=5, column=0, columnspan=3, sticky=tk.W, padx=5, pady=5)
+        ttk.Checkbutton(cache_frame, text="使用 JSON 转换缓存", variable=self.use_json_cache_var).pack(side=tk.LEFT, padx=5)
+        ttk.Label(cache_frame, text="缓存上限(MB):").pack(side=tk.LEFT, padx=5)
+        ttk.Spinbox(cache_frame, from_=16, to=1048576, textvariable=self.json_cache_size_var, width=8).pack(side=tk.LEFT)
+        ttk.Button(cache_frame, text="清空缓存", command=self.clear_json_cache).pack(side=tk.LEFT, padx=15)
+        
+        ttk.Label(folder_frame, text="排除文件/文件夹:").grid(row=6, column=0, sticky=tk.W, padx=5, pady=5)
+        ttk.Entry(folder_frame, textvariable=self.exclude_pattern, width=50).grid(row=6, column=1, padx=5, pady=5)
+        ttk.Checkbutton(folder_frame, text="并行扫描子文件夹", variable=self.parallel_scan_var).grid(row=6, column=2, sticky=tk.W, padx=5, pady=5)
+        
+        ttk.Label(folder_frame, text="临时文件夹 (可选):").grid(row=7, column=0, sticky=tk.W, padx=5, pady=5)
+        ttk.Entry(folder_frame, textvariable=self.scratch_dir_var, width=50).grid(row=7, column=1, padx=5, pady=5)
+        ttk.Button(folder_frame, text="浏览...", command=self._browse_scratch_dir).grid(row=7, column=2, padx=5, pady=5)
+        
         # 关键词替换部分
         keyword_frame = ttk.LabelFrame(parent, text="关键词替换", padding="10")
         keyword_frame.pack(fill=tk.X, padx=5, pady=5)
         
         ttk.Label(keyword_frame, text="查找关键词:").grid(row=0, column=0, sticky=tk.W, padx=5, pady=5)
         ttk.Entry(keyword_frame, textvariable=self.search_keyword, width=50).grid(row=0, column=1, padx=5, pady=5)
+        ttk.Button(keyword_frame, text="添加到规则表", command=self._add_replacement_rule).grid(row=0, column=2, padx=5, pady=5)
         
         ttk.Label(keyword_frame, text="替换为:").grid(row=1, column=0, sticky=tk.W, padx=5, pady=5)
         ttk.Entry(keyword_frame, textvariable=self.replace_keyword, width=50).grid(row=1, column=1, padx=5, pady=5)
         
+        # 规则表: 与上方关键词一起，在一次扫描中同时替换
+        rules_frame = ttk.Frame(keyword_frame)
+        rules_frame.grid(row=2, column=0, columnspan=4, sticky=tk.EW, padx=5, pady=5)
+        
+        self.rules_tree = ttk.Treeview(rules_frame, columns=("search", "replace"), show="headings", height=4)
+        self.rules_tree.heading("search", text="查找")
+        self.rules_tree.heading("replace", text="替换为")
+        self.rules_tree.column("search", width=420)
+        self.rules_tree.column("replace", width=420)
+        self.rules_tree.bind("<Double-1>", self._edit_replacement_rule)
+        rules_scroll = ttk.Scrollbar(rules_frame, orient=tk.VERTICAL, command=self.rules_tree.yview)
+        self.rules_tree.configure(yscrollcommand=rules_scroll.set)
+        self.rules_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        rules_scroll.pack(side=tk.LEFT, fill=tk.Y)
+        
+        rules_buttons = ttk.Frame(rules_frame)
+        rules_buttons.pack(side=tk.LEFT, fill=tk.Y, padx=5)
+        ttk.Button(rules_buttons, text="删除选中", command=self._remove_replacement_rules).pack(fill=tk.X, pady=1)
+        ttk.Button(rules_buttons, text="清空规则", command=lambda: self.rules_tree.delete(*self.rules_tree.get_children())).pack(fill=tk.X, pady=1)
+        ttk.Button(rules_buttons, text="导入规则...", command=self._import_replacement_rules).pack(fill=tk.X, pady=1)
+        ttk.Button(rules_buttons, text="导出规则...", command=self._export_replacement_rules).pack(fill=tk.X, pady=1)
+        ttk.Label(keyword_frame, text="双击规则可重新编辑；规则文件每行为 \"查找<Tab>替换为\"").grid(row=3, column=0, columnspan=3, sticky=tk.W, padx=5)
+        
+        # 结构化规则: 按 JSON 中的属性修改，不依赖文本格式
+        structured_frame = ttk.LabelFrame(parent, text="结构化规则（每行一条，例如: PropName == _MatcapValue -> Number = 0.7）", padding="10")
+        structured_frame.pack(fill=tk.X, padx=5, pady=5)
+        
+        self.structured_rules_text = scrolledtext.ScrolledText(structured_frame, wrap=tk.NONE, width=80, height=3)
+        self.structured_rules_text.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        ttk.Button(structured_frame, text="导入...", command=self._import_structured_rules).pack(side=tk.LEFT, padx=5)
+        
         # 操作按钮
         button_frame = ttk.Frame(parent)
         button_frame.pack(fill=tk.X, padx=5, pady=10)
         
+        ttk.Button(button_frame, text="停止", command=self.cancel).pack(side=tk.RIGHT, padx=5)
         ttk.Button(button_frame, text="开始替换", command=self._start_content_replacement).pack(side=tk.RIGHT, padx=5)
         ttk.Button(button_frame, text="预览文件", command=self._preview_files).pack(side=tk.RIGHT, padx=5)
+        ttk.Checkbutton(button_frame, text="完成后继续监视文件夹，只处理发生变化的文件",
+                        variable=self.watch_content_var).pack(side=tk.LEFT, padx=5)
         
         # 日志输出
         log_frame = ttk.LabelFrame(parent, text="处理日志", padding="10")
@@ -134,7 +4221,14 @@ class COM3D2ToolGUI(tk.Tk):
         ttk.Entry(folder_frame, textvariable=self.file_pattern, width=50).grid(row=1, column=1, padx=5, pady=5)
         ttk.Label(folder_frame, text="例如: *.txt, *.menu").grid(row=1, column=2, sticky=tk.W, padx=5, pady=5)
         
-        ttk.Checkbutton(folder_frame, text="包含子文件夹", variable=self.recursive_var).grid(row=2, column=0, sticky=tk.W, padx=5, pady=5)
+        ttk.Label(folder_frame, text="排除文件/文件夹:").grid(row=2, column=0, sticky=tk.W, padx=5, pady=5)
+        ttk.Entry(folder_frame, textvariable=self.exclude_pattern, width=50).grid(row=2, column=1, padx=5, pady=5)
+        ttk.Label(folder_frame, text="例如: backup, *.bak").grid(row=2, column=2, sticky=tk.W, padx=5, pady=5)
+        
+        ttk.Checkbutton(folder_frame, text="包含子文件夹", variable=self.recursive_var).grid(row=3, column=0, sticky=tk.W, padx=5, pady=5)
+        ttk.Checkbutton(folder_frame, text="同时重命名文件夹", variable=self.rename_dirs_var).grid(row=3, column=1, sticky=tk.W, padx=5, pady=5)
+        ttk.Checkbutton(folder_frame, text="同时更新 MOD 文件中的引用 (.menu/.mate 以外的文件使用内容替换页的 MeidoSerialization 路径)",
+                        variable=self.update_refs_var).grid(row=4, column=0, columnspan=3, sticky=tk.W, padx=5, pady=5)
         
         # 关键词替换部分
         keyword_frame = ttk.LabelFrame(parent, text="文件名关键词替换", padding="10")
@@ -152,6 +4246,7 @@ class COM3D2ToolGUI(tk.Tk):
         
         ttk.Button(button_frame, text="开始替换文件名", command=self._start_filename_replacement).pack(side=tk.RIGHT, padx=5)
         ttk.Button(button_frame, text="预览匹配文件", command=self._preview_filename_matches).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(button_frame, text="撤销上次重命名", command=self._start_undo_rename).pack(side=tk.LEFT, padx=5)
         
         # 日志输出
         log_frame = ttk.LabelFrame(parent, text="处理日志", padding="10")
@@ -198,6 +4293,21 @@ class COM3D2ToolGUI(tk.Tk):
         ttk.Checkbutton(check_frame, text="DXT压缩 (转.tex)", variable=self.compress_tex_var).pack(side=tk.LEFT, padx=5)
         ttk.Checkbutton(check_frame, text="强制PNG (转.tex)", variable=self.force_png_var).pack(side=tk.LEFT, padx=5)
         
+        perf_frame = ttk.Frame(options_frame)
+        perf_frame.grid(row=3, column=0, columnspan=3, sticky=tk.W, padx=5, pady=5)
+        ttk.Label(perf_frame, text="并行进程数 (图片↔TEX):").pack(side=tk.LEFT, padx=5)
+        ttk.Spinbox(perf_frame, from_=1, to=64, textvariable=self.worker_count_var, width=5).pack(side=tk.LEFT)
+        ttk.Checkbutton(perf_frame, text="重复文件使用硬链接", variable=self.link_duplicates_var).pack(side=tk.LEFT, padx=(15, 5))
+        ttk.Checkbutton(perf_frame, text="完成后继续监视文件夹，只转换发生变化的文件",
+                        variable=self.watch_convert_var).pack(side=tk.LEFT, padx=(15, 5))
+        
+        cache_frame = ttk.Frame(options_frame)
+        cache_frame.grid(row=4, column=0, columnspan=3, sticky=tk.W, padx=5, pady=5)
+        ttk.Checkbutton(cache_frame, text="使用转换结果缓存 (图片↔TEX)", variable=self.use_convert_cache_var).pack(side=tk.LEFT, padx=5)
+        ttk.Label(cache_frame, text="缓存上限(MB):").pack(side=tk.LEFT, padx=5)
+        ttk.Spinbox(cache_frame, from_=16, to=1048576, textvariable=self.convert_cache_size_var, width=8).pack(side=tk.LEFT)
+        ttk.Button(cache_frame, text="清空缓存", command=self.clear_json_cache).pack(side=tk.LEFT, padx=15)
+        
         # 操作按钮
         button_frame = ttk.Frame(parent)
         button_frame.pack(fill=tk.X, padx=5, pady=10)
@@ -210,6 +4320,8 @@ class COM3D2ToolGUI(tk.Tk):
         ttk.Button(button_frame, text="NEI→CSV", command=lambda: self._start_conversion('convert2csv')).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="CSV→NEI", command=lambda: self._start_conversion('convert2nei')).pack(side=tk.LEFT, padx=5)
         
+        self._add_progress_row(parent, self.convert_progress)
+        
         # 日志输出
         log_frame = ttk.LabelFrame(parent, text="处理日志", padding="10")
         log_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
@@ -245,6 +4357,8 @@ class COM3D2ToolGUI(tk.Tk):
         
         ttk.Button(button_frame, text="检测文件类型", command=self._start_determine).pack(side=tk.RIGHT, padx=5)
         
+        self._add_progress_row(parent, self.determine_progress)
+        
         # 日志输出
         log_frame = ttk.LabelFrame(parent, text="检测结果", padding="10")
         log_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
@@ -252,6 +4366,33 @@ class COM3D2ToolGUI(tk.Tk):
         self.determine_log_text = scrolledtext.ScrolledText(log_frame, wrap=tk.WORD, width=80, height=15)
         self.determine_log_text.pack(fill=tk.BOTH, expand=True)
     
+    def _add_progress_row(self, parent, tracker):
+        """进度条、速度/剩余时间和取消按钮"""
+        progress_frame = ttk.Frame(parent)
+        progress_frame.pack(fill=tk.X, padx=5, pady=(0, 5))
+        
+        bar = ttk.Progressbar(progress_frame, mode='determinate', maximum=100)
+        bar.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        label = ttk.Label(progress_frame, text="", width=40)
+        label.pack(side=tk.LEFT, padx=5)
+        ttk.Button(progress_frame, text="取消", command=self.cancel).pack(side=tk.LEFT, padx=5)
+        self._progress_views.append((tracker, bar, label))
+    
+    def _poll_progress(self):
+        """主线程定时读取各任务进度并刷新进度条"""
+        for tracker, bar, label in self._progress_views:
+            if not tracker.active and tracker.finished_at is None:
+                continue
+            done, total, _, _ = tracker.snapshot()
+            if total:
+                bar.configure(mode='determinate', value=min(100.0, done * 100.0 / total))
+            elif tracker.active:
+                # 总数未知时显示滚动条
+                bar.configure(mode='indeterminate')
+                bar.step(2)
+            label.configure(text=tracker.describe())
+        self.root.after(200, self._poll_progress)
+    
     def _browse_folder(self):
         """浏览并选择文件夹"""
         folder = filedialog.askdirectory()
@@ -264,78 +4405,21 @@ class COM3D2ToolGUI(tk.Tk):
         if file_path:
             self.folder_path.set(file_path)
     
+    def _browse_scratch_dir(self):
+        """选择存放临时文件的文件夹（例如内存盘），留空使用系统临时文件夹"""
+        folder_path = filedialog.askdirectory()
+        if folder_path:
+            self.scratch_dir_var.set(folder_path)
+    
     def _browse_meido(self):
         """浏览并选择MeidoSerialization程序"""
         file_path = filedialog.askopenfilename(filetypes=[("可执行文件", "*.exe")])
         if file_path:
             self.meido_path.set(file_path)
     
-    def _log(self, message, log_widget=None):
-        """添加日志信息"""
-        if log_widget is None:
-            log_widget = self.log_text
-            
-        log_widget.insert(tk.END, message + "\n")
-        log_widget.see(tk.END)
-        log_widget.update()
-    
-    def _run_meido_command(self, command, args, log_widget=None):
-        """运行 MeidoSerialization 命令"""
-        try:
-            cmd = [command] + args
-            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, 
-                                     encoding='utf-8', errors='ignore')
-            stdout, stderr = process.communicate()
-            
-            if stdout:
-                self._log(stdout, log_widget)
-            if stderr:
-                self._log(f"错误: {stderr}", log_widget)
-                
-            return process.returncode == 0
-        except Exception as e:
-            self._log(f"执行命令时发生错误: {str(e)}", log_widget)
-            return False
-    
-    def _find_files(self, directory, recursive=True, file_types=None):
-        """查找匹配的文件"""
-        files = []
-        if file_types:
-            type_list = [t.strip() for t in file_types.split(",")]
-        else:
-            type_list = []
-            
-        for root, dirs, filenames in os.walk(directory):
-            for filename in filenames:
-                if filename.endswith('.json'):
-                    continue
-                
-                if type_list:
-                    file_ext = os.path.splitext(filename)[1].lstrip('.')
-                    if file_ext not in type_list:
-                        continue
-                        
-                files.append(os.path.join(root, filename))
-                
-            if not recursive:
-                break
-                
-        return files
-    
-    def _find_files_by_pattern(self, directory, pattern="*.*", recursive=True):
-        """使用模式查找匹配的文件"""
-        import fnmatch
-        files = []
-        
-        for root, dirs, filenames in os.walk(directory):
-            for filename in filenames:
-                if fnmatch.fnmatch(filename, pattern):
-                    files.append(os.path.join(root, filename))
-                
-            if not recursive:
-                break
-                
-        return files
+    def _write_log(self, message, channel):
+        """日志写入对应选项卡的文本框（可在任意线程调用）"""
+        self.log_sink.write(message, self._log_widgets[channel])
     
     def _preview_files(self):
         """预览匹配的文件"""
@@ -345,16 +4429,27 @@ class COM3D2ToolGUI(tk.Tk):
             return
             
         file_types = self.file_type_filter.get().strip()
-        recursive = self.recursive_var.get()
+        files = self._find_files(folder, self.recursive_var.get(), file_types if file_types else None,
+                                 self.exclude_pattern.get().strip())
         
-        self.log_text.delete(1.0, tk.END)
-        self._log("正在查找匹配的文件...")
+        self.log_sink.clear(self.log_text)
+        self._log("正在查找匹配的文件，结果显示在预览窗口中...")
+        self._show_file_preview(f"预览文件 - {folder}", files, 'content')
+    
+    def _show_file_preview(self, title, files, channel):
+        """在预览窗口中显示 files（生成器，在后台线程中遍历）"""
+        window = PreviewWindow(self.root, title, [('name', "文件名", 280), ('folder', "文件夹", 760)])
         
-        files = self._find_files(folder, recursive, file_types if file_types else None)
+        def scan():
+            for file_path in files:
+                if window.closed:
+                    return
+                window.table.add(file_path)
+            summary = f"找到 {len(window.table)} 个匹配的文件"
+            window.finish(summary)
+            self._log(summary, channel)
         
-        self._log(f"找到 {len(files)} 个匹配的文件:")
-        for file in files:
-            self._log(f"- {file}")
+        threading.Thread(target=scan, daemon=True).start()
     
     def _preview_filename_matches(self):
         """预览匹配文件名的文件"""
@@ -365,86 +4460,137 @@ class COM3D2ToolGUI(tk.Tk):
             
         pattern = self.file_pattern.get().strip()
         recursive = self.recursive_var.get()
+        exclude = self.exclude_pattern.get().strip()
+        search_keyword = self.file_search_keyword.get().strip()
         
-        self.filename_log_text.delete(1.0, tk.END)
-        self._log("正在查找匹配的文件...", self.filename_log_text)
+        self.log_sink.clear(self.filename_log_text)
+        self._log("正在查找匹配的文件，结果显示在预览窗口中...", 'filename')
+        if not search_keyword:
+            self._show_file_preview(f"预览文件 - {folder}",
+                                    self._find_files_by_pattern(folder, pattern, recursive, exclude), 'filename')
+            return
         
-        files = self._find_files_by_pattern(folder, pattern, recursive)
+        # 有关键词时按执行顺序显示重命名计划，冲突排在最后
+        window = PreviewWindow(self.root, f"预览重命名 - {folder}",
+                               [('order', "#", 60), ('name', "原名称", 240), ('target', "新名称", 240),
+                                ('folder', "文件夹", 500), ('note', "说明", 180)])
+        replace_keyword = self.file_replace_keyword.get().strip()
+        rename_dirs = self.rename_dirs_var.get()
         
-        self._log(f"找到 {len(files)} 个匹配的文件:", self.filename_log_text)
-        for file in files:
-            self._log(f"- {file}", self.filename_log_text)
-            
-        search_keyword = self.file_search_keyword.get().strip()
+        def build():
+            try:
+                plan = RenamePlan.build(folder, FileFilter.from_pattern(pattern, exclude), search_keyword,
+                                        replace_keyword, recursive, rename_dirs)
+            except (OSError, ValueError) as e:
+                window.finish(f"生成重命名计划失败: {str(e)}")
+                self._log(f"生成重命名计划失败: {str(e)}", 'filename')
+                return
+            for source, target, is_dir in plan.operations:
+                window.table.add(source, os.path.basename(target), "文件夹" if is_dir else None)
+            for source, new_name, reason in plan.conflicts:
+                window.table.add(source, new_name, f"跳过: {reason}")
+            summary = f"将执行 {len(plan.operations)} 次重命名，{len(plan.conflicts)} 个冲突将被跳过"
+            window.finish(summary)
+            self._log(summary, 'filename')
+        
+        threading.Thread(target=build, daemon=True).start()
+    
+    def _get_replacement_rules(self):
+        """收集替换规则: 上方输入框中的关键词（如果有）+ 规则表"""
+        rules = []
+        search_keyword = self.search_keyword.get().strip()
         if search_keyword:
-            self._log("\n包含关键词的文件:", self.filename_log_text)
-            matching_files = [f for f in files if search_keyword in os.path.basename(f)]
-            self._log(f"找到 {len(matching_files)} 个包含关键词 '{search_keyword}' 的文件:", self.filename_log_text)
-            for file in matching_files:
-                self._log(f"- {file}", self.filename_log_text)
-                new_name = os.path.basename(file).replace(search_keyword, self.file_replace_keyword.get().strip())
-                self._log(f"  将重命名为: {new_name}", self.filename_log_text)
-    
-    def _convert_to_json(self, file_path, meido_path):
-        """使用MeidoSerialization将文件转换为JSON"""
-        try:
-            cmd = [meido_path, "convert2json", file_path]
-            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout, stderr = process.communicate()
-            
-            if process.returncode != 0:
-                self._log(f"转换失败: {stderr.decode('utf-8', errors='ignore')}")
-                return None
-                
-            return f"{file_path}.json"
-        except Exception as e:
-            self._log(f"转换过程发生错误: {str(e)}")
-            return None
+            rules.append((search_keyword, self.replace_keyword.get().strip()))
+        for item in self.rules_tree.get_children():
+            search, replace = self.rules_tree.item(item, "values")
+            rules.append((str(search), str(replace)))
+        return rules
     
-    def _convert_to_mod(self, json_file_path, meido_path):
-        """使用MeidoSerialization将JSON转回原格式"""
+    def _add_replacement_rule(self):
+        """把输入框中的关键词添加到规则表"""
+        search_keyword = self.search_keyword.get().strip()
+        if not search_keyword:
+            messagebox.showerror("错误", "请输入要查找的关键词")
+            return
+        self.rules_tree.insert("", tk.END, values=(search_keyword, self.replace_keyword.get().strip()))
+        self.search_keyword.set("")
+        self.replace_keyword.set("")
+    
+    def _edit_replacement_rule(self, event):
+        """双击规则: 移回输入框以便修改"""
+        item = self.rules_tree.identify_row(event.y)
+        if not item:
+            return
+        search, replace = self.rules_tree.item(item, "values")
+        self.search_keyword.set(search)
+        self.replace_keyword.set(replace)
+        self.rules_tree.delete(item)
+    
+    def _remove_replacement_rules(self):
+        """删除选中的规则"""
+        for item in self.rules_tree.selection():
+            self.rules_tree.delete(item)
+    
+    def _import_replacement_rules(self):
+        """从文件导入规则，追加到规则表末尾"""
+        path = filedialog.askopenfilename(filetypes=[("规则文件", "*.tsv *.txt *.json"), ("所有文件", "*.*")])
+        if not path:
+            return
         try:
-            cmd = [meido_path, "convert2mod", json_file_path]
-            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout, stderr = process.communicate()
-            
-            if process.returncode != 0:
-                self._log(f"转换回原格式失败: {stderr.decode('utf-8', errors='ignore')}")
-                return False
-                
-            return True
-        except Exception as e:
-            self._log(f"转换回原格式过程发生错误: {str(e)}")
-            return False
+            rules = load_replacement_rules(path)
+        except (OSError, ValueError, KeyError, IndexError, TypeError) as e:
+            messagebox.showerror("错误", f"读取规则文件失败: {str(e)}")
+            return
+        for search, replace in rules:
+            self.rules_tree.insert("", tk.END, values=(search, replace))
+        self._log(f"已导入 {len(rules)} 条规则: {path}")
     
-    def _replace_keywords_in_json(self, json_file_path, search_keyword, replace_keyword):
-        """在JSON文件中替换关键词"""
+    def _export_replacement_rules(self):
+        """把规则表保存到文件"""
+        path = filedialog.asksaveasfilename(defaultextension=".tsv",
+                                            filetypes=[("Tab 分隔", "*.tsv"), ("JSON", "*.json")])
+        if not path:
+            return
+        rules = [tuple(map(str, self.rules_tree.item(item, "values"))) for item in self.rules_tree.get_children()]
         try:
-            with open(json_file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-                
-            modified_content = content.replace(search_keyword, replace_keyword)
-            
-            if content == modified_content:
-                return False
-                
-            with open(json_file_path, 'w', encoding='utf-8') as f:
-                f.write(modified_content)
-                
-            return True
-        except Exception as e:
-            self._log(f"替换关键词时发生错误: {str(e)}")
-            return False
+            save_replacement_rules(path, rules)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("错误", f"保存规则文件失败: {str(e)}")
+            return
+        self._log(f"已导出 {len(rules)} 条规则: {path}")
+    
+    def _import_structured_rules(self):
+        """从文本文件导入结构化规则，追加到输入框末尾"""
+        path = filedialog.askopenfilename(filetypes=[("规则文件", "*.txt"), ("所有文件", "*.*")])
+        if not path:
+            return
+        try:
+            with open(path, 'r', encoding='utf-8-sig') as f:
+                text = f.read()
+        except OSError as e:
+            messagebox.showerror("错误", f"读取规则文件失败: {str(e)}")
+            return
+        current = self.structured_rules_text.get(1.0, tk.END).strip()
+        self.structured_rules_text.insert(tk.END, ("\n" if current else "") + text.strip() + "\n")
     
     def _start_content_replacement(self):
         """开始替换文件内容关键词的处理"""
         folder = self.folder_path.get().strip()
         meido_path = self.meido_path.get().strip()
-        search_keyword = self.search_keyword.get().strip()
-        replace_keyword = self.replace_keyword.get().strip()
+        rules = self._get_replacement_rules()
         file_types = self.file_type_filter.get().strip()
         recursive = self.recursive_var.get()
         delete_json = self.delete_json_var.get()
+        exclude = self.exclude_pattern.get().strip()
+        scan_workers = 8 if self.parallel_scan_var.get() else 1
+        
+        try:
+            worker_count = int(self.worker_count_var.get())
+            batch_size = int(self.batch_size_var.get()) if self.batch_mode_var.get() else 0
+            cache_size = int(self.json_cache_size_var.get())
+        except (tk.TclError, ValueError):
+            messagebox.showerror("错误", "并行处理数、每批文件数和缓存上限必须是整数")
+            return
         
         if not folder or not os.path.exists(folder):
             messagebox.showerror("错误", "请选择有效的文件夹")
@@ -454,66 +4600,52 @@ class COM3D2ToolGUI(tk.Tk):
             messagebox.showerror("错误", "请选择有效的MeidoSerialization程序")
             return
             
-        if not search_keyword:
-            messagebox.showerror("错误", "请输入要查找的关键词")
+        try:
+            editor = StructuredEditor.parse(self.structured_rules_text.get(1.0, tk.END))
+        except ValueError as e:
+            messagebox.showerror("错误", f"结构化规则有误: {str(e)}")
             return
-            
-        self.log_text.delete(1.0, tk.END)
-            
-        threading.Thread(target=self._process_files_replacement, 
-                         args=(folder, meido_path, search_keyword, replace_keyword, 
-                              file_types, recursive, delete_json),
-                         daemon=True).start()
-    
-    def _process_files_replacement(self, folder, meido_path, search_keyword, replace_keyword, 
-                                 file_types, recursive, delete_json):
-        """处理文件替换的主要逻辑"""
-        self._log("开始处理文件...")
         
-        if os.path.isfile(folder):
-            files = [folder]
-        else:
-            files = self._find_files(folder, recursive, file_types if file_types else None)
+        if not rules and not editor.rules:
+            messagebox.showerror("错误", "请输入要查找的关键词或添加替换规则")
+            return
         
-        self._log(f"找到 {len(files)} 个匹配的文件")
+        try:
+            replacer = ContentRules(KeywordReplacer(rules) if rules else None,
+                                    editor if editor.rules else None)
+        except ValueError as e:
+            messagebox.showerror("错误", str(e))
+            return
+            
+        watch = self.watch_content_var.get()
+        resume = False
+        if not watch and JobJournal.exists(JobJournal.job_key(folder, replacer, file_types, recursive, delete_json, exclude)):
+            answer = messagebox.askyesnocancel("继续任务", "相同的任务上次没有完成，是否从中断处继续?\n"
+                                               "选择“否”将重新处理全部文件")
+            if answer is None:
+                return
+            resume = answer
         
-        modified_count = 0
-        error_count = 0
+        self.log_sink.clear(self.log_text)
+        self.scratch_dir = self.scratch_dir_var.get().strip() or None
         
-        for file_path in files:
-            try:
-                self._log(f"\n处理文件: {file_path}")
-                
-                json_file = self._convert_to_json(file_path, meido_path)
-                if not json_file:
-                    self._log(f"无法转换文件: {file_path}")
-                    error_count += 1
-                    continue
-                    
-                self._log(f"已转换为JSON: {json_file}")
-                
-                if self._replace_keywords_in_json(json_file, search_keyword, replace_keyword):
-                    self._log(f"已在JSON中替换关键词")
-                    
-                    if self._convert_to_mod(json_file, meido_path):
-                        self._log(f"已将修改后的JSON转回原格式")
-                        modified_count += 1
-                    else:
-                        self._log(f"转回原格式失败")
-                        error_count += 1
-                else:
-                    self._log(f"文件中未找到关键词")
-                
-                if delete_json and os.path.exists(json_file):
-                    os.remove(json_file)
-                    self._log(f"已删除临时JSON文件")
-                    
-            except Exception as e:
-                self._log(f"处理文件时发生错误: {str(e)}")
-                error_count += 1
-                
-        self._log(f"\n{'='*60}")
-        self._log(f"处理完成: 共处理 {len(files)} 个文件, 修改了 {modified_count} 个文件, 发生 {error_count} 个错误")
+        if self.use_json_cache_var.get():
+            self.open_json_cache(cache_size)
+        else:
+            self.json_cache = None
+        self.use_native_codec = self.native_codec_var.get()
+        prefilter = self.prefilter_var.get()
+            
+        report_path = os.path.join(_default_cache_dir(), "logs", "run_report.json")
+        if watch:
+            self._start_worker(self.watch_replacement,
+                               (folder, meido_path, replacer, file_types, recursive, delete_json,
+                                worker_count, batch_size, exclude, prefilter, report_path))
+            return
+        self._start_worker(self.process_files_replacement,
+                           (folder, meido_path, replacer, 
+                            file_types, recursive, delete_json, worker_count, batch_size,
+                            exclude, scan_workers, prefilter, report_path, resume))
     
     def _start_filename_replacement(self):
         """开始替换文件名的处理"""
@@ -522,6 +4654,7 @@ class COM3D2ToolGUI(tk.Tk):
         search_keyword = self.file_search_keyword.get().strip()
         replace_keyword = self.file_replace_keyword.get().strip()
         recursive = self.recursive_var.get()
+        exclude = self.exclude_pattern.get().strip()
         
         if not folder or not os.path.isdir(folder):
             messagebox.showerror("错误", "请选择有效的文件夹")
@@ -531,40 +4664,34 @@ class COM3D2ToolGUI(tk.Tk):
             messagebox.showerror("错误", "请输入要查找的关键词")
             return
             
-        self.filename_log_text.delete(1.0, tk.END)
+        self.log_sink.clear(self.filename_log_text)
+        self.scratch_dir = self.scratch_dir_var.get().strip() or None
+        self.use_native_codec = self.native_codec_var.get()
             
-        threading.Thread(target=self._process_filename_replacement, 
-                         args=(folder, pattern, search_keyword, replace_keyword, recursive),
-                         daemon=True).start()
+        try:
+            worker_count = int(self.worker_count_var.get())
+        except (tk.TclError, ValueError):
+            worker_count = 1
+        meido_path = self.meido_path.get().strip()
+        if not os.path.isfile(meido_path):
+            meido_path = None
+            
+        self._cancel_event.clear()
+        self._start_worker(self.process_filename_replacement,
+                           (folder, pattern, search_keyword, replace_keyword, recursive, exclude,
+                            self.rename_dirs_var.get(), self.update_refs_var.get(), meido_path, worker_count))
     
-    def _process_filename_replacement(self, folder, pattern, search_keyword, replace_keyword, recursive):
-        """处理文件名替换的主要逻辑"""
-        self._log("开始处理文件名...", self.filename_log_text)
-        
-        files = self._find_files_by_pattern(folder, pattern, recursive)
-        self._log(f"找到 {len(files)} 个匹配的文件", self.filename_log_text)
-        
-        renamed_count = 0
-        error_count = 0
+    def _start_undo_rename(self):
+        """撤销最近一次重命名"""
+        journal_path = latest_rename_journal()
+        if not journal_path:
+            messagebox.showinfo("提示", "没有可以撤销的重命名")
+            return
+        if not messagebox.askyesno("确认", f"撤销这次重命名?\n{journal_path}"):
+            return
         
-        for file_path in files:
-            try:
-                base_name = os.path.basename(file_path)
-                if search_keyword in base_name:
-                    new_name = base_name.replace(search_keyword, replace_keyword)
-                    new_path = os.path.join(os.path.dirname(file_path), new_name)
-                    
-                    self._log(f"重命名文件: {base_name} -> {new_name}", self.filename_log_text)
-                    
-                    os.rename(file_path, new_path)
-                    renamed_count += 1
-                
-            except Exception as e:
-                self._log(f"重命名文件时发生错误: {str(e)}", self.filename_log_text)
-                error_count += 1
-                
-        self._log(f"\n{'='*60}", self.filename_log_text)
-        self._log(f"处理完成: 共检查 {len(files)} 个文件, 重命名了 {renamed_count} 个文件, 发生 {error_count} 个错误", self.filename_log_text)
+        self.log_sink.clear(self.filename_log_text)
+        self._start_worker(self.undo_rename, (journal_path,))
     
     def _start_conversion(self, conversion_type):
         """开始格式转换"""
@@ -579,49 +4706,26 @@ class COM3D2ToolGUI(tk.Tk):
             messagebox.showerror("错误", "请选择有效的MeidoSerialization程序")
             return
             
-        self.convert_log_text.delete(1.0, tk.END)
-        
-        threading.Thread(target=self._process_conversion, 
-                         args=(folder, meido_path, conversion_type),
-                         daemon=True).start()
-    
-    def _process_conversion(self, path, meido_path, conversion_type):
-        """处理格式转换的主要逻辑"""
-        self._log(f"开始 {conversion_type} 转换...", self.convert_log_text)
-        
-        # 构建命令参数
-        args = [conversion_type, path]
-        
-        # 添加可选参数
-        file_type = self.file_type_filter.get().strip()
-        if file_type:
-            args.extend(['--type', file_type])
-        
-        if self.strict_mode_var.get():
-            args.append('--strict')
-        
-        # 特定转换类型的参数
-        if conversion_type == 'convert2image':
-            image_format = self.image_format.get().strip()
-            if image_format and image_format != 'png':
-                args.extend(['--format', image_format])
-        
-        elif conversion_type == 'convert2tex':
-            if self.compress_tex_var.get():
-                args.append('--compress')
-            args.extend(['--forcePng', str(self.force_png_var.get()).lower()])
-        
-        self._log(f"执行命令: {meido_path} {' '.join(args)}", self.convert_log_text)
+        try:
+            worker_count = int(self.worker_count_var.get())
+            cache_size = int(self.convert_cache_size_var.get())
+        except (tk.TclError, ValueError):
+            messagebox.showerror("错误", "并行进程数和缓存上限必须是整数")
+            return
         
-        # 运行命令
-        success = self._run_meido_command(meido_path, args, self.convert_log_text)
+        self.log_sink.clear(self.convert_log_text)
+        self.scratch_dir = self.scratch_dir_var.get().strip() or None
         
-        if success:
-            self._log(f"\n{'='*60}", self.convert_log_text)
-            self._log("转换完成!", self.convert_log_text)
+        if self.use_convert_cache_var.get():
+            self.open_convert_cache(cache_size)
         else:
-            self._log(f"\n{'='*60}", self.convert_log_text)
-            self._log("转换过程中出现错误，请查看上方日志", self.convert_log_text)
+            self.convert_cache = None
+        
+        self._start_worker(self.watch_conversion if self.watch_convert_var.get() else self.process_conversion,
+                           (folder, meido_path, conversion_type, self.file_type_filter.get().strip(),
+                            self.strict_mode_var.get(), self.image_format.get().strip(),
+                            self.compress_tex_var.get(), self.force_png_var.get(),
+                            worker_count, self.recursive_var.get(), self.link_duplicates_var.get()))
     
     def _start_determine(self):
         """开始文件类型检测"""
@@ -636,41 +4740,338 @@ class COM3D2ToolGUI(tk.Tk):
             messagebox.showerror("错误", "请选择有效的MeidoSerialization程序")
             return
             
-        self.determine_log_text.delete(1.0, tk.END)
+        self.log_sink.clear(self.determine_log_text)
         
-        threading.Thread(target=self._process_determine, 
-                         args=(path, meido_path),
-                         daemon=True).start()
+        self._start_worker(self.process_determine,
+                           (path, meido_path, self.file_type_filter.get().strip(), self.strict_mode_var.get()))
+
+
+CONVERSION_TYPES = ('convert', 'convert2json', 'convert2mod', 'convert2image', 'convert2tex', 'convert2csv', 'convert2nei')
+
+
+def _add_watch_arguments(parser):
+    parser.add_argument('--watch', action='store_true',
+                        help='处理完后继续监视文件夹，文件变化时只处理变化的文件（Ctrl+C 结束）')
+    parser.add_argument('--debounce', type=float, default=1.0, metavar='SECONDS',
+                        help='文件停止变化多少秒后开始处理（默认 1）')
+    parser.add_argument('--poll', action='store_true', help='不使用 inotify，定时扫描文件夹（适合网络盘）')
+    parser.add_argument('--poll-interval', type=float, default=2.0, metavar='SECONDS', help='定时扫描的间隔（默认 2）')
+
+
+def _build_arg_parser():
+    import argparse
     
-    def _process_determine(self, path, meido_path):
-        """处理文件类型检测的主要逻辑"""
-        self._log("开始检测文件类型...", self.determine_log_text)
-        
-        # 构建命令参数
-        args = ['determine', path]
-        
-        # 添加可选参数
-        if self.strict_mode_var.get():
-            args.append('--strict')
-        
-        file_type = self.file_type_filter.get().strip()
-        if file_type:
-            args.extend(['--type', file_type])
-        
-        self._log(f"执行命令: {meido_path} {' '.join(args)}", self.determine_log_text)
-        
-        # 运行命令
-        success = self._run_meido_command(meido_path, args, self.determine_log_text)
-        
-        if success:
-            self._log(f"\n{'='*60}", self.determine_log_text)
-            self._log("检测完成!", self.determine_log_text)
+    parser = argparse.ArgumentParser(
+        description='COM3D2 MOD 文件处理工具，不带参数运行时启动图形界面',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例:
+  # 批量替换文件内容
+  python COM3D2文件关键词替换GUI工具.py replace ./mods --meido ./MeidoSerialization.exe --rule hair_01 hair_02
+  
+  # 使用规则文件和结构化规则，8 个并行任务，只处理 .mate
+  python COM3D2文件关键词替换GUI工具.py replace ./mods --meido ./MeidoSerialization.exe --rules rules.tsv --structured edits.txt --types mate --workers 8
+  
+  # 批量重命名
+  python COM3D2文件关键词替换GUI工具.py rename ./mods --search hair_01 --replace hair_02 --pattern "*.menu, *.mate"
+  python COM3D2文件关键词替换GUI工具.py undo-rename
+  
+  # 格式转换 / 类型检测
+  python COM3D2文件关键词替换GUI工具.py convert convert2image ./tex --meido ./MeidoSerialization.exe --format webp
+  python COM3D2文件关键词替换GUI工具.py determine ./mods --meido ./MeidoSerialization.exe
+  
+  # 按任务文件执行多个任务，同时运行 2 个
+  python COM3D2文件关键词替换GUI工具.py --job jobs.json --jobs 2
+        """
+    )
+    parser.add_argument('--job', action='append', default=[], metavar='FILE',
+                        help='任务文件 (JSON)，可重复使用；内容为一个任务对象或任务列表')
+    parser.add_argument('--jobs', type=int, default=1, metavar='N', help='同时运行的任务数（默认 1）')
+    parser.add_argument('--clear-cache', action='store_true', help='清空 JSON 转换缓存')
+    subparsers = parser.add_subparsers(dest='command', metavar='命令')
+    
+    replace_parser = subparsers.add_parser('replace', help='替换 MOD 文件内容')
+    replace_parser.add_argument('folder', help='文件或文件夹')
+    replace_parser.add_argument('--meido', required=True, help='MeidoSerialization 程序路径')
+    replace_parser.add_argument('--rule', nargs=2, action='append', default=[], metavar=('SEARCH', 'REPLACE'),
+                                help='一条 查找→替换 规则，可重复使用')
+    replace_parser.add_argument('--rules', action='append', default=[], metavar='FILE',
+                                help='规则文件 (.tsv/.txt 或 .json)，可重复使用')
+    replace_parser.add_argument('--structured', action='append', default=[], metavar='FILE',
+                                help='结构化规则文件，每行一条，可重复使用')
+    replace_parser.add_argument('--types', default='', help='文件类型，逗号分隔，例如 menu,mate（默认全部）')
+    replace_parser.add_argument('--exclude', default='', help='排除的文件/文件夹，例如 "backup, *_old.*"')
+    replace_parser.add_argument('--no-recursive', action='store_true', help='不包含子文件夹')
+    replace_parser.add_argument('--keep-json', action='store_true', help='保留转换出的 JSON 文件')
+    replace_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='并行处理数（默认 CPU 核数）')
+    replace_parser.add_argument('--batch', type=int, default=0, metavar='N',
+                                help='批量调用 MeidoSerialization，每批 N 个文件（默认不使用）')
+    replace_parser.add_argument('--no-cache', action='store_true', help='不使用 JSON 转换缓存')
+    replace_parser.add_argument('--cache-size', type=int, default=1024, metavar='MB', help='缓存上限 (MB)')
+    replace_parser.add_argument('--native', action='store_true',
+                                help='使用内置 .mate/.menu 转换（实验性，默认关闭）')
+    # 旧版本的任务文件中可能有 no_native，现在已是默认行为
+    replace_parser.add_argument('--no-native', action='store_true', help=argparse.SUPPRESS)
+    replace_parser.add_argument('--no-prefilter', action='store_true', help='不跳过不含关键词的文件')
+    replace_parser.add_argument('--parallel-scan', action='store_true', help='并行扫描文件夹')
+    replace_parser.add_argument('--report', default=None, help='导出各阶段耗时报告（.json 或 .csv）')
+    replace_parser.add_argument('--resume', action='store_true', help='继续上次中断的相同任务，跳过已完成的文件')
+    replace_parser.add_argument('--scratch-dir', default=None, help='存放临时文件的文件夹（例如内存盘），默认为系统临时文件夹')
+    _add_watch_arguments(replace_parser)
+    
+    rename_parser = subparsers.add_parser('rename', help='替换文件名')
+    rename_parser.add_argument('folder', help='文件夹')
+    rename_parser.add_argument('--search', required=True, help='文件名中要查找的内容')
+    rename_parser.add_argument('--replace', default='', help='替换为')
+    rename_parser.add_argument('--pattern', default='*.*', help='文件名匹配模式，可用逗号分隔多个')
+    rename_parser.add_argument('--exclude', default='', help='排除的文件/文件夹')
+    rename_parser.add_argument('--no-recursive', action='store_true', help='不包含子文件夹')
+    rename_parser.add_argument('--dirs', action='store_true', help='同时重命名名称包含关键词的文件夹')
+    rename_parser.add_argument('--update-refs', action='store_true', help='同时更新 MOD 文件中对被重命名文件的引用')
+    rename_parser.add_argument('--meido', default=None,
+                               help='MeidoSerialization 程序路径（更新 .menu/.mate 以外文件中的引用时需要）')
+    rename_parser.add_argument('--native', action='store_true',
+                               help='更新引用时使用内置 .mate/.menu 转换（实验性，默认关闭）')
+    rename_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='读取文件的并行数')
+    rename_parser.add_argument('--scratch-dir', default=None, help='存放临时文件的文件夹（例如内存盘），默认为系统临时文件夹')
+    
+    undo_parser = subparsers.add_parser('undo-rename', help='撤销重命名（默认撤销最近一次）')
+    undo_parser.add_argument('--journal', default=None, help='撤销日志文件')
+    
+    convert_parser = subparsers.add_parser('convert', help='格式转换')
+    convert_parser.add_argument('conversion', choices=CONVERSION_TYPES, help='转换命令')
+    convert_parser.add_argument('path', help='文件或文件夹')
+    convert_parser.add_argument('--meido', required=True, help='MeidoSerialization 程序路径')
+    convert_parser.add_argument('--type', default='', help='文件类型过滤')
+    convert_parser.add_argument('--strict', action='store_true', help='严格模式')
+    convert_parser.add_argument('--format', default='png', help='图片格式（用于 convert2image）')
+    convert_parser.add_argument('--compress', action='store_true', help='DXT 压缩（用于 convert2tex）')
+    convert_parser.add_argument('--no-force-png', action='store_true', help='不强制 PNG（用于 convert2tex）')
+    convert_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                                help='同时运行的 MeidoSerialization 进程数（用于 convert2tex / convert2image）')
+    convert_parser.add_argument('--no-recursive', action='store_true', help='不包含子文件夹（用于 convert2tex / convert2image）')
+    convert_parser.add_argument('--link-duplicates', action='store_true', help='重复文件的转换结果使用硬链接')
+    convert_parser.add_argument('--no-cache', action='store_true', help='不使用转换结果缓存（用于 convert2tex / convert2image）')
+    convert_parser.add_argument('--cache-size', type=int, default=2048, help='转换结果缓存上限 (MB)')
+    convert_parser.add_argument('--scratch-dir', default=None, help='存放临时文件的文件夹（例如内存盘），默认为系统临时文件夹')
+    _add_watch_arguments(convert_parser)
+    
+    determine_parser = subparsers.add_parser('determine', help='检测文件类型')
+    determine_parser.add_argument('path', help='文件或文件夹')
+    determine_parser.add_argument('--meido', required=True, help='MeidoSerialization 程序路径')
+    determine_parser.add_argument('--type', default='', help='文件类型过滤')
+    determine_parser.add_argument('--strict', action='store_true', help='严格模式')
+    
+    subparsers.add_parser('clear-cache', help='清空 JSON 转换缓存')
+    return parser
+
+
+# 任务文件中各命令的位置参数，其余键按同名选项处理（下划线或短横线均可）
+_JOB_POSITIONALS = {
+    'replace': ('folder',),
+    'rename': ('folder',),
+    'convert': ('conversion', 'path'),
+    'determine': ('path',),
+    'undo-rename': (),
+    'clear-cache': (),
+}
+
+
+def _job_to_argv(job):
+    """把任务文件中的一个任务转换为命令行参数，以便复用命令行的校验和默认值"""
+    if not isinstance(job, dict) or job.get('command') not in _JOB_POSITIONALS:
+        raise ValueError(f"任务缺少有效的 command ({', '.join(_JOB_POSITIONALS)}): {job}")
+    command = job['command']
+    argv = [command]
+    for key in _JOB_POSITIONALS[command]:
+        if key not in job:
+            raise ValueError(f"{command} 任务缺少 {key}")
+        argv.append(str(job[key]))
+    for key, value in job.items():
+        if key in ('command', 'name') or key in _JOB_POSITIONALS[command]:
+            continue
+        option = '--' + key.replace('_', '-')
+        if value is True:
+            argv.append(option)
+        elif value is False or value is None:
+            continue
+        elif key == 'rule':
+            # [[查找, 替换], ...]
+            for search, replace in value:
+                argv.extend([option, str(search), str(replace)])
+        elif isinstance(value, list):
+            for item in value:
+                argv.extend([option, str(item)])
         else:
-            self._log(f"\n{'='*60}", self.determine_log_text)
-            self._log("检测过程中出现错误，请查看上方日志", self.determine_log_text)
+            argv.extend([option, str(value)])
+    return argv
 
 
-if __name__ == "__main__":
+def _load_job_file(path):
+    """读取任务文件: 一个任务对象、任务列表，或 {"jobs": [...]}"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get('jobs', [data])
+    return data
+
+
+def _report_progress(tracker, stop):
+    """命令行模式下在终端同一行刷新进度"""
+    while not stop.wait(1.0):
+        if tracker.active:
+            sys.stderr.write(f"\r{tracker.describe()}   ")
+            sys.stderr.flush()
+    sys.stderr.write("\n")
+
+
+def run_job(core, args):
+    """执行一个已解析的命令行任务，返回是否成功"""
+    if args.command == 'clear-cache':
+        core.clear_json_cache()
+        return True
+    
+    core.scratch_dir = getattr(args, 'scratch_dir', None)
+    if args.command == 'rename':
+        core.use_native_codec = args.native
+        if not os.path.isdir(args.folder):
+            core._log(f"文件夹不存在: {args.folder}", 'filename')
+            return False
+        return core.process_filename_replacement(args.folder, args.pattern, args.search, args.replace,
+                                                 not args.no_recursive, args.exclude, args.dirs,
+                                                 args.update_refs, args.meido, args.workers)
+    
+    if args.command == 'undo-rename':
+        return core.undo_rename(args.journal)
+    
+    path = args.folder if args.command == 'replace' else args.path
+    if not os.path.exists(path):
+        core._log(f"文件或文件夹不存在: {path}")
+        return False
+    if not os.path.isfile(args.meido):
+        core._log(f"找不到 MeidoSerialization 程序: {args.meido}")
+        return False
+    
+    if args.command == 'replace':
+        rules = [tuple(rule) for rule in args.rule]
+        for rules_file in args.rules:
+            rules.extend(load_replacement_rules(rules_file))
+        structured_text = ""
+        for structured_file in args.structured:
+            with open(structured_file, 'r', encoding='utf-8') as f:
+                structured_text += f.read() + "\n"
+        editor = StructuredEditor.parse(structured_text)
+        if not rules and not editor.rules:
+            core._log("请用 --rule、--rules 或 --structured 指定替换规则")
+            return False
+        replacer = ContentRules(KeywordReplacer(rules) if rules else None,
+                                editor if editor.rules else None)
+        # 由 main 统一打开的共用缓存不再重新打开，以免清零其他任务的统计
+        if not args.no_cache and core.json_cache is None:
+            core.open_json_cache(args.cache_size)
+        core.use_native_codec = args.native and not args.no_native
+        if args.watch:
+            return core.watch_replacement(path, args.meido, replacer, args.types, not args.no_recursive,
+                                          not args.keep_json, args.workers, args.batch, args.exclude,
+                                          not args.no_prefilter, args.report, args.debounce,
+                                          args.poll_interval, not args.poll)
+        return core.process_files_replacement(path, args.meido, replacer, args.types, not args.no_recursive,
+                                              not args.keep_json, args.workers, args.batch, args.exclude,
+                                              8 if args.parallel_scan else 1, not args.no_prefilter, args.report,
+                                              args.resume)
+    
+    tracker = core.convert_progress if args.command == 'convert' else core.determine_progress
+    stop = threading.Event()
+    reporter = None
+    if sys.stderr.isatty():
+        reporter = threading.Thread(target=_report_progress, args=(tracker, stop), daemon=True)
+        reporter.start()
+    try:
+        if args.command == 'convert':
+            if not args.no_cache and core.convert_cache is None:
+                core.open_convert_cache(args.cache_size)
+            if args.watch:
+                return core.watch_conversion(path, args.meido, args.conversion, args.type, args.strict,
+                                             args.format, args.compress, not args.no_force_png,
+                                             args.workers, not args.no_recursive, args.link_duplicates,
+                                             args.debounce, args.poll_interval, not args.poll)
+            return core.process_conversion(path, args.meido, args.conversion, args.type, args.strict,
+                                           args.format, args.compress, not args.no_force_png,
+                                           args.workers, not args.no_recursive, args.link_duplicates)
+        return core.process_determine(path, args.meido, args.type, args.strict)
+    finally:
+        stop.set()
+        if reporter is not None:
+            reporter.join()
+
+
+def main(argv=None):
+    """命令行入口，返回退出码"""
+    parser = _build_arg_parser()
+    args = parser.parse_args(argv)
+    
+    tasks = []
+    if args.clear_cache:
+        tasks.append(parser.parse_args(['clear-cache']))
+    if args.command:
+        tasks.append(args)
+    for job_file in args.job:
+        try:
+            for job in _load_job_file(job_file):
+                tasks.append(parser.parse_args(_job_to_argv(job)))
+        except (OSError, ValueError) as e:
+            parser.error(f"无法读取任务文件 {job_file}: {str(e)}")
+    if not tasks:
+        parser.error("请指定命令或 --job 任务文件")
+    
+    # 并行的任务各自使用一个核心对象，共用同一个 JSON 缓存和转换结果缓存。
+    # 每个缓存只打开一次，大小上限取各任务中最大的；每个任务通过 ContentCacheView 单独统计命中次数
+    shared_cache = {}
+    cache_lock = threading.Lock()
+    cache_sizes = {}
+    for task in tasks:
+        if task.command in ('replace', 'convert') and not task.no_cache:
+            cache_sizes[task.command] = max(cache_sizes.get(task.command, 0), task.cache_size)
+    
+    def shared(command):
+        # 第一次用到时才打开，排在前面的 clear-cache 任务先执行
+        with cache_lock:
+            if command not in shared_cache:
+                name = "json_cache" if command == 'replace' else "convert_cache"
+                shared_cache[command] = ContentCache(os.path.join(_default_cache_dir(), name),
+                                                     cache_sizes[command] * 1024 * 1024)
+            return shared_cache[command]
+    
+    def run(index, task):
+        if len(tasks) > 1 and args.jobs > 1:
+            prefix = f"[任务 {index + 1}] "
+            core = COM3D2ToolCore(log=lambda message, channel: print(prefix + message, flush=True))
+        else:
+            core = COM3D2ToolCore()
+        if task.command == 'replace' and not task.no_cache:
+            core.json_cache = ContentCacheView(shared('replace'))
+        elif task.command == 'convert' and not task.no_cache:
+            core.convert_cache = ContentCacheView(shared('convert'))
+        try:
+            return run_job(core, task)
+        except KeyboardInterrupt:
+            core.cancel()
+            raise
+        except (OSError, ValueError) as e:
+            core._log(f"任务失败: {str(e)}")
+            return False
+    
+    if args.jobs > 1 and len(tasks) > 1:
+        with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+            results = list(executor.map(run, range(len(tasks)), tasks))
+    else:
+        results = [run(index, task) for index, task in enumerate(tasks)]
+    return 0 if all(results) else 1
+
+
+def run_gui():
+    """启动图形界面"""
+    _load_tkinter()
     # 设置高DPI缩放
     try:
         from ctypes import windll
@@ -679,4 +5080,13 @@ if __name__ == "__main__":
         pass
         
     app = COM3D2ToolGUI()
-    app.mainloop()
\ No newline at end of file
+    app.mainloop()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        try:
+            sys.exit(main())
+        except KeyboardInterrupt:
+            sys.exit(130)
+    run_gui()
@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Function: COM3D2 文件关键词替换工具的性能测试：生成模拟 MOD 文件，用模拟的 MeidoSerialization 测量各项操作的速度和内存
+# Author: Claude Sonnet 4.5 & 90135
+# Creation date: 2026-10-18
+# Version: 2026-10-18
+# License: BSD-3
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import importlib.util
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块
+    resource = None
+
+TOOL_FILENAME = "COM3D2文件关键词替换GUI工具.py"
+HIT_KEYWORD = "bench_hit_a"
+HIT_REPLACEMENT = "bench_hit_b"
+MOD_TYPES = ('menu', 'mate', 'pmat', 'col', 'phy', 'psk', 'anm', 'model', 'tex', 'preset')
+
+# 模拟的 MeidoSerialization：按命令处理文件，启动延迟和每个文件的耗时由环境变量控制。
+# MOD 文件转成 {"Format": 扩展名, "Data": 按 latin-1 解码的内容}，转回时原样还原。
+FAKE_MEIDO_SOURCE = r'''#!/usr/bin/env python3
+import os, sys, json, time
+
+MOD_TYPES = %(mod_types)r
+IMAGE_TYPES = ('png', 'jpg', 'jpeg', 'webp', 'bmp', 'tga')
+time.sleep(float(os.environ.get("FAKE_MEIDO_STARTUP", "0")))
+per_file = float(os.environ.get("FAKE_MEIDO_PER_FILE", "0"))
+
+
+def ext(path):
+    return os.path.splitext(path)[1].lstrip('.').lower()
+
+
+def targets(path, wanted):
+    if os.path.isfile(path):
+        return [path]
+    found = []
+    for root, _, names in os.walk(path):
+        found += [os.path.join(root, name) for name in sorted(names) if wanted(name)]
+    return found
+
+
+def option(name, default):
+    return sys.argv[sys.argv.index(name) + 1] if name in sys.argv else default
+
+
+command, path = sys.argv[1], sys.argv[2]
+if command == 'convert':
+    command = 'convert2mod' if ext(path) == 'json' else 'convert2json'
+wanted = {
+    'convert2json': lambda name: ext(name) in MOD_TYPES,
+    'convert2mod': lambda name: ext(name) == 'json' and ext(name[:-5]) in MOD_TYPES,
+    'convert2image': lambda name: ext(name) == 'tex',
+    'convert2tex': lambda name: ext(name) in IMAGE_TYPES,
+    'determine': lambda name: True,
+}.get(command, lambda name: True)
+
+files = targets(path, wanted)
+for index, file_path in enumerate(files, 1):
+    time.sleep(per_file)
+    if command == 'convert2json':
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        with open(file_path + '.json', 'w', encoding='utf-8') as f:
+            json.dump({"Format": ext(file_path), "Data": data.decode('latin-1')}, f)
+    elif command == 'convert2mod':
+        with open(file_path, 'r', encoding='utf-8') as f:
+            document = json.load(f)
+        with open(file_path[:-5], 'wb') as f:
+            f.write(document["Data"].encode('latin-1'))
+    elif command == 'convert2image':
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        with open(os.path.splitext(file_path)[0] + '.' + option('--format', 'png'), 'wb') as f:
+            f.write(b'IMG' + data)
+    elif command == 'convert2tex':
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        with open(os.path.splitext(file_path)[0] + '.tex', 'wb') as f:
+            f.write(b'TEX' + data)
+    elif command == 'determine':
+        print(f"{file_path}: {ext(file_path) or 'unknown'}")
+        continue
+    print(f"[{index}/{len(files)}] {command} {file_path}", flush=True)
+'''
+
+
+def load_tool(path=None):
+    """按文件路径加载主程序（文件名不是合法的模块名，不能直接 import）"""
+    path = path or os.path.join(os.path.dirname(os.path.abspath(__file__)), TOOL_FILENAME)
+    spec = importlib.util.spec_from_file_location("com3d2_tool", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def tool_version(path):
+    """读取主程序文件头中的 Version"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.startswith("# Version:"):
+                return line.split(":", 1)[1].strip()
+            if not line.startswith("#"):
+                break
+    return ""
+
+
+def write_fake_meido(directory):
+    """写出模拟的 MeidoSerialization，返回可执行文件路径"""
+    script_path = os.path.join(directory, "fake_meido.py")
+    with open(script_path, 'w', encoding='utf-8') as f:
+        f.write(FAKE_MEIDO_SOURCE % {"mod_types": MOD_TYPES})
+    if os.name == 'nt':
+        wrapper_path = os.path.join(directory, "fake_meido.cmd")
+        with open(wrapper_path, 'w', encoding='utf-8') as f:
+            f.write(f'@"{sys.executable}" "%~dp0fake_meido.py" %*\n')
+        return wrapper_path
+    os.chmod(script_path, 0o755)
+    return script_path
+
+
+def _parse_mix(text):
+    """"mate=4,menu=4,tex=2" -> [(类型, 权重), ...]"""
+    mix = []
+    for part in text.split(','):
+        name, _, weight = part.strip().partition('=')
+        if name not in MOD_TYPES:
+            raise argparse.ArgumentTypeError(f"未知的文件类型: {name}")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+def _make_mate(tool, name, hit):
+    texture = f"{HIT_KEYWORD}_{name}" if hit else f"tex_{name}"
+    mate = {
+        "Signature": "CM3D2_MATERIAL", "Version": 1000, "Name": name,
+        "Material": {
+            "Name": name, "ShaderName": "CM3D2/Toony_Lighted_Trans", "ShaderFilename": "CM3D2__Toony_Lighted_Trans",
+            "Properties": [
+                {"TypeName": "tex", "PropName": "_MainTex", "SubTag": "tex2d",
+                 "Tex2D": {"Name": texture, "Path": f"Assets/texture/texture/{texture}.png",
+                           "Offset": [0.0, 0.0], "Scale": [1.0, 1.0]}},
+                {"TypeName": "col", "PropName": "_Color", "Color": [1.0, 1.0, 1.0, 1.0]},
+                {"TypeName": "f", "PropName": "_Shininess", "Number": 0.5},
+            ],
+        },
+    }
+    return tool.NativeCodec.encode('mate', mate)
+
+
+def _make_menu(tool, name, hit, rng):
+    model = f"{HIT_KEYWORD}_{name}.model" if hit else f"{name}.model"
+    commands = [["name", name], ["category", "wear"], ["additem", model, "wear"]]
+    commands += [["setumekomi", f"param_{rng.randrange(1000)}"] for _ in range(rng.randrange(5, 40))]
+    menu = {
+        "Signature": "CM3D2_MENU", "Version": 1000, "SrcFileName": f"{name}.txt", "ItemName": name,
+        "Category": "wear", "InfoText": "benchmark", "BodySize": 0,
+        "Commands": [{"ArgCount": len(args), "Args": args} for args in commands],
+    }
+    return tool.NativeCodec.encode('menu', menu)
+
+
+def generate_corpus(tool, root, files=2000, depth=3, fanout=4, hit_rate=0.3, mix=None, tex_kb=64, seed=1):
+    """生成模拟的 MOD 文件夹，返回每种类型的文件数
+
+    文件平均分布在 depth 层、每层 fanout 个子文件夹中；hit_rate 比例的文件名和内容包含 HIT_KEYWORD。
+    .mate/.menu 是合法的文件（可用内置转换读写），其他类型是随机内容。
+    """
+    rng = random.Random(seed)
+    mix = mix or [('mate', 4), ('menu', 4), ('tex', 2)]
+    directories = [root]
+    level = [root]
+    for _ in range(depth):
+        level = [os.path.join(parent, f"dir_{index}") for parent in level for index in range(fanout)]
+        directories += level
+    for directory in directories:
+        os.makedirs(directory, exist_ok=True)
+
+    counts = {}
+    types, weights = zip(*mix)
+    for index in range(files):
+        file_type = rng.choices(types, weights)[0]
+        hit = rng.random() < hit_rate
+        name = f"{HIT_KEYWORD}_{index:06d}" if hit else f"item_{index:06d}"
+        if file_type == 'mate':
+            data = _make_mate(tool, name, hit)
+        elif file_type == 'menu':
+            data = _make_menu(tool, name, hit, rng)
+        else:
+            size = tex_kb * 1024 if file_type == 'tex' else rng.randrange(256, 4096)
+            data = rng.randbytes(size) if hasattr(rng, 'randbytes') else os.urandom(size)
+            if hit:
+                data = HIT_KEYWORD.encode('ascii') + data
+        with open(os.path.join(rng.choice(directories), f"{name}.{file_type}"), 'wb') as f:
+            f.write(data)
+        counts[file_type] = counts.get(file_type, 0) + 1
+    return counts
+
+
+def _peak_rss_mb():
+    """进程的峰值常驻内存（MB），不支持时返回 None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def measure(name, func, file_count):
+    """运行一个测试项，记录耗时、每秒文件数和 Python 内存分配峰值"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        ok = bool(func())
+        error = None
+    except Exception as e:
+        ok = False
+        error = str(e)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result = {
+        "files": file_count,
+        "seconds": round(seconds, 4),
+        "files_per_sec": round(file_count / seconds, 2) if seconds > 0 else None,
+        "peak_python_mb": round(peak / 1024 / 1024, 2),
+        "ok": ok,
+    }
+    if error:
+        result["error"] = error
+    print(f"{name:<16} {file_count:>7} 个文件  {seconds:>8.2f} 秒  "
+          f"{result['files_per_sec'] or 0:>9.1f} 个/秒  内存峰值 {result['peak_python_mb']:>7.2f} MB"
+          + ("" if ok else f"  失败{': ' + error if error else ''}"), flush=True)
+    return result
+
+
+def codec_fixtures(tool, root):
+    """root 中旁边有 MeidoSerialization 参考 JSON（文件名加 .json）的 .mate/.menu"""
+    if not os.path.isdir(root):
+        return []
+    return [file_path for file_path in tool.iter_files(root, True, tool.FileFilter(tool.NativeCodec.FILE_TYPES))
+            if os.path.isfile(f"{file_path}.json")]
+
+
+def check_codec(tool, root):
+    """与参考输出对照：内置转换得到的 JSON 要与 MeidoSerialization 的逐字节相同，参考 JSON 要能逐字节转回原文件
+    
+    返回 (检查数, 失败文件列表)。
+    """
+    fixtures = codec_fixtures(tool, root)
+    failed = []
+    for file_path in fixtures:
+        file_type = os.path.splitext(file_path)[1].lstrip('.').lower()
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        with open(f"{file_path}.json", 'rb') as f:
+            reference = f.read()
+        try:
+            if (tool.NativeCodec.to_json(file_type, data).encode('utf-8') != reference
+                    or tool.NativeCodec.from_json(file_type, reference.decode('utf-8')) != data):
+                failed.append(file_path)
+        except tool.NativeCodecError:
+            failed.append(file_path)
+    return len(fixtures), failed
+
+
+def run_benchmarks(tool, args, work_dir, meido_path):
+    """在 work_dir 中运行所有测试项，返回 {测试项: 结果}"""
+    corpus = os.path.join(work_dir, "corpus")
+    counts = generate_corpus(tool, corpus, args.files, args.depth, args.fanout, args.hit_rate,
+                             args.mix, args.tex_kb, args.seed)
+    total = sum(counts.values())
+    print(f"已生成 {total} 个文件: " + ", ".join(f"{name} {count}" for name, count in sorted(counts.items())))
+
+    def fresh_copy(name):
+        # 会修改文件的测试项各自使用一份新的副本，复制时间不计入结果
+        target = os.path.join(work_dir, name)
+        shutil.rmtree(target, ignore_errors=True)
+        shutil.copytree(corpus, target)
+        return target
+
+    def count(folder, extensions):
+        return sum(1 for _ in tool.iter_files(folder, True, tool.FileFilter(extensions)))
+
+    def new_core():
+        return tool.COM3D2ToolCore(log=None if args.verbose else (lambda message, channel: None))
+
+    stages = [name.strip() for name in args.stages.split(',') if name.strip()]
+    results = {}
+    replacer = tool.ContentRules(tool.KeywordReplacer([(HIT_KEYWORD, HIT_REPLACEMENT)]), None)
+    mod_count = count(corpus, MOD_TYPES)
+
+    for stage in stages:
+        core = new_core()
+        if stage == 'scan':
+            results[stage] = measure(stage, lambda: count(corpus, None) >= 0, total)
+        elif stage in ('replace', 'replace_native'):
+            folder = fresh_copy(stage)
+            core.use_native_codec = stage == 'replace_native'
+            results[stage] = measure(stage, lambda: core.process_files_replacement(
+                folder, meido_path, replacer, "", True, True, args.workers, args.batch), mod_count)
+        elif stage == 'rename':
+            folder = fresh_copy(stage)
+            results[stage] = measure(stage, lambda: core.process_filename_replacement(
+                folder, "*.*", HIT_KEYWORD, HIT_REPLACEMENT, True), total)
+            results['undo_rename'] = measure('undo_rename', core.undo_rename, total)
+        elif stage == 'convert':
+            folder = fresh_copy(stage)
+            results[stage] = measure(stage, lambda: core.process_conversion(
+                folder, meido_path, 'convert2image', worker_count=args.workers), count(folder, ('tex',)))
+        elif stage == 'determine':
+            results[stage] = measure(stage, lambda: core.process_determine(corpus, meido_path), total)
+        elif stage == 'codec':
+            checked = failed = None
+
+            def codec():
+                nonlocal checked, failed
+                checked, failed = check_codec(tool, args.fixtures)
+                return checked > 0 and not failed
+            results[stage] = measure(stage, codec, len(codec_fixtures(tool, args.fixtures)))
+            if not checked:
+                print(f"  {args.fixtures} 中没有带参考 JSON 的 .mate/.menu", file=sys.stderr)
+            if failed:
+                results[stage]["failed_files"] = failed[:20]
+        else:
+            print(f"未知的测试项: {stage}", file=sys.stderr)
+    return results, counts
+
+
+def compare(results, baseline_path):
+    """与之前保存的结果比较每秒文件数"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"\n与 {baseline_path} (版本 {baseline.get('tool_version', '?')}) 比较:")
+    for stage, result in results.items():
+        old = baseline.get("stages", {}).get(stage)
+        if not old or not old.get("files_per_sec") or not result.get("files_per_sec"):
+            continue
+        ratio = result["files_per_sec"] / old["files_per_sec"]
+        print(f"  {stage:<16} {old['files_per_sec']:>9.1f} -> {result['files_per_sec']:>9.1f} 个/秒  ({ratio:.2f}x)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="COM3D2 文件关键词替换工具的性能测试")
+    parser.add_argument('--files', type=int, default=2000, help='生成的文件数')
+    parser.add_argument('--depth', type=int, default=3, help='文件夹层数')
+    parser.add_argument('--fanout', type=int, default=4, help='每层的子文件夹数')
+    parser.add_argument('--hit-rate', type=float, default=0.3, help='包含关键词的文件比例')
+    parser.add_argument('--mix', type=_parse_mix, default=None, help='文件类型及比例，例如 mate=4,menu=4,tex=2')
+    parser.add_argument('--tex-kb', type=int, default=64, help='.tex 文件大小 (KB)')
+    parser.add_argument('--seed', type=int, default=1, help='随机数种子')
+    parser.add_argument('--startup', type=float, default=0.05, help='模拟 MeidoSerialization 的启动耗时（秒）')
+    parser.add_argument('--per-file', type=float, default=0.001, help='模拟 MeidoSerialization 处理每个文件的耗时（秒）')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='并行处理数')
+    parser.add_argument('--batch', type=int, default=0, help='批量模式每批文件数（0 为逐个处理）')
+    parser.add_argument('--stages', default='scan,replace,replace_native,rename,convert,determine,codec',
+                        help='要运行的测试项，逗号分隔')
+    parser.add_argument('--tool', default=None, help='主程序路径（默认与本脚本在同一文件夹）')
+    parser.add_argument('--fixtures', default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                                           "tests", "fixtures"),
+                        help='codec 测试项使用的 MOD 文件及其 MeidoSerialization 参考 JSON 所在的文件夹')
+    parser.add_argument('--work-dir', default=None, help='工作文件夹（默认使用临时文件夹，结束后删除）')
+    parser.add_argument('--output', default='benchmark.json', help='结果文件 (JSON)')
+    parser.add_argument('--compare', default=None, help='与之前的结果文件比较')
+    parser.add_argument('--verbose', action='store_true', help='显示工具的日志')
+    args = parser.parse_args(argv)
+
+    tool_path = args.tool or os.path.join(os.path.dirname(os.path.abspath(__file__)), TOOL_FILENAME)
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="com3d2_bench_")
+    os.makedirs(work_dir, exist_ok=True)
+
+    # 缓存、撤销日志等写到工作文件夹中，不影响正常使用的缓存
+    os.environ["LOCALAPPDATA"] = os.path.join(work_dir, "cache")
+    os.environ["FAKE_MEIDO_STARTUP"] = str(args.startup)
+    os.environ["FAKE_MEIDO_PER_FILE"] = str(args.per_file)
+
+    tool = load_tool(tool_path)
+    meido_path = write_fake_meido(work_dir)
+    try:
+        results, counts = run_benchmarks(tool, args, work_dir, meido_path)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "tool_version": tool_version(tool_path),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "parameters": {
+            "files": args.files, "depth": args.depth, "fanout": args.fanout, "hit_rate": args.hit_rate,
+            "mix": counts, "tex_kb": args.tex_kb, "seed": args.seed, "startup": args.startup,
+            "per_file": args.per_file, "workers": args.workers, "batch": args.batch,
+        },
+        "peak_rss_mb": _peak_rss_mb(),
+        "stages": results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存到 {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+    return 0 if all(result["ok"] for result in results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,26 +3,280 @@
 # Function: 检查指定文件夹内的 .xml 文件格式是否正确，是否为 songList 格式，以及引用的文件是否存在
 # Author: Claude Sonnet 4.5 & 90135
 # Creation date: 2025-11-21
-# Version: 2025-11-21
+# Version: 2026-10-18
 # License: Bsd-3
 
 import os
 import sys
+import json
+import difflib
+import hashlib
+import tempfile
+import threading
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 import xml.etree.ElementTree as ET
-from typing import List, Tuple, Set
+from xml.parsers import expat
+from typing import List, Tuple, Set, Optional
+
+
+def _default_cache_dir() -> str:
+    """缓存目录（与 COM3D2文件关键词替换GUI工具 相同: Windows 下位于 %LOCALAPPDATA%，其他系统位于 ~/.cache）"""
+    base = (os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME")
+            or os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(base, "COM3D2_Tools_901")
+
+
+@dataclass
+class CheckResult:
+    """单个 XML 文件的检查结果
+    
+    检查过程中的输出保存在 lines 中而不是直接打印，多个文件可以同时检查，
+    之后再按文件顺序输出。结果为真值当且仅当没有错误。
+    quiet 为 True 时不保存逐项的检查过程，只保留错误、警告和汇总。
+    使用缓存时 references 记录每个引用文件的 (路径, 是否存在, 相近名称建议, 查找时读取的文件夹)。
+    """
+    path: Path
+    lines: List[str] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+    warnings: List[str] = field(default_factory=list)
+    quiet: bool = False
+    references: List[Tuple[str, bool, Optional[str], List[str]]] = field(default_factory=list)
+    cache_key: Optional[str] = None
+    cacheable: bool = True  # 读取文件出错等偶发错误的结果不缓存
+    cached: bool = False
+    
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+    
+    def __bool__(self) -> bool:
+        return self.ok
+    
+    def log(self, message: str = ""):
+        if not self.quiet:
+            self.lines.append(message)
+    
+    def report(self) -> str:
+        """完整的检查报告（检查过程 + 警告和错误汇总）"""
+        lines = list(self.lines)
+        if self.cached:
+            lines.insert(0, "✓ XML 及引用的文件都没有变化，使用上次的检查结果")
+        lines.append("\n" + "="*60)
+        
+        if self.warnings:
+            lines.append("⚠️  警告:")
+            for warning in self.warnings:
+                lines.append(f"  {warning}")
+            lines.append("")
+        
+        if self.errors:
+            lines.append("❌ 错误:")
+            for error in self.errors:
+                lines.append(f"  {error}")
+            lines.append("\n检查结果: 失败")
+        else:
+            lines.append("✅ 检查结果: 通过")
+        
+        lines.append("="*60)
+        return "\n".join(lines)
+
+
+class DirectoryCache:
+    """文件夹内容缓存: 每个文件夹只用 os.scandir 列出一次，之后判断文件是否存在只是集合查找
+    
+    ignore_case 为 True 时不区分大小写（与游戏所在的 Windows 相同，在 Windows 下总是如此）。
+    找不到文件时根据已列出的同一文件夹给出相近的名称，不再读取磁盘。可以在多个线程中同时使用。
+    """
+    
+    def __init__(self, ignore_case: bool = False):
+        self.ignore_case = ignore_case or os.name == "nt"
+        self.scan_count = 0
+        self._listings = {}    # 文件夹 -> {名称键: 实际名称}，文件夹不存在时为 None
+        self._mtimes = {}      # 文件夹 -> 修改时间，文件夹不存在时为 None
+        self._scan_locks = {}  # 正在列出的文件夹，避免多个线程重复列出同一个文件夹
+        self._lock = threading.Lock()
+    
+    def _key(self, name: str) -> str:
+        return name.casefold() if self.ignore_case else name
+    
+    def _listing(self, directory: str) -> Optional[dict]:
+        with self._lock:
+            if directory in self._listings:
+                return self._listings[directory]
+            scan_lock = self._scan_locks.setdefault(directory, threading.Lock())
+        
+        with scan_lock:
+            with self._lock:
+                if directory in self._listings:
+                    return self._listings[directory]
+            # 先记下修改时间再列出，列出过程中发生的变化下次会被发现
+            self.dir_mtime(directory)
+            try:
+                with os.scandir(directory) as entries:
+                    names = [entry.name for entry in entries]
+            except OSError:
+                listing = None
+            else:
+                listing = {}
+                for name in names:
+                    listing.setdefault(self._key(name), name)
+            with self._lock:
+                self._listings[directory] = listing
+                self._scan_locks.pop(directory, None)
+                self.scan_count += 1
+            return listing
+    
+    def dir_mtime(self, directory: str) -> Optional[int]:
+        """文件夹的修改时间（每个文件夹只读取一次），文件夹中增删或重命名文件时会改变"""
+        with self._lock:
+            if directory in self._mtimes:
+                return self._mtimes[directory]
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            mtime = None
+        with self._lock:
+            return self._mtimes.setdefault(directory, mtime)
+    
+    def find(self, path: Path, base: Path, dirs: Optional[List[str]] = None) -> Tuple[bool, Optional[str]]:
+        """判断 base 之下的 path 是否存在，返回 (是否存在, 不存在时相近的路径建议)
+        
+        path 不在 base 之下时直接查询磁盘，不使用缓存。
+        提供 dirs 时把结果所依据的文件夹加入其中，这些文件夹的内容不变时结果也不会变。
+        """
+        try:
+            parts = Path(os.path.normpath(path)).relative_to(os.path.normpath(base)).parts
+        except ValueError:
+            if dirs is not None:
+                dirs.append(os.path.dirname(os.path.normpath(path)))
+            return Path(path).exists(), None
+        
+        current = os.path.normpath(base)
+        listing = self._listing(current)
+        if dirs is not None:
+            dirs.append(current)
+        for index, part in enumerate(parts):
+            actual = listing.get(self._key(part)) if listing else None
+            if actual is None:
+                return False, self._suggest(current, listing, part)
+            # 只列出中间的文件夹，最后一项已在上一级的列表中找到
+            if index < len(parts) - 1:
+                current = os.path.join(current, actual)
+                listing = self._listing(current)
+                if dirs is not None:
+                    dirs.append(current)
+        return bool(parts) or listing is not None, None
+    
+    @staticmethod
+    def _suggest(directory: str, listing: Optional[dict], name: str) -> Optional[str]:
+        """同一文件夹中只有大小写不同或拼写相近的名称"""
+        if not listing:
+            return None
+        names = list(listing.values())
+        folded = {candidate.casefold(): candidate for candidate in names}
+        match = folded.get(name.casefold())
+        if match is None:
+            close = difflib.get_close_matches(name.casefold(), list(folded), n=1, cutoff=0.85)
+            match = folded[close[0]] if close else None
+        return os.path.join(directory, match) if match else None
+
+
+class ResultCache:
+    """检查结果的持久缓存（用户缓存目录中的一个 JSON 文件）
+    
+    每个 XML 按检查选项分别记录: 内容哈希、检查结果、查找引用文件时读取过的文件夹及其修改时间，
+    以及每个引用文件的查找结果。检查只判断文件是否存在，结果只取决于这些文件夹的内容，
+    因此再次检查时只需读取每个文件夹的修改时间；发生变化的文件夹中的引用文件重新查找一次，
+    结果都相同时直接使用上次的检查结果。
+    """
+    VERSION = 2
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = {}
+    
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> "ResultCache":
+        cache = cls(path or os.path.join(_default_cache_dir(), "songlist_check_cache.json"))
+        try:
+            with open(cache.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("version") == cls.VERSION:
+                cache.entries = data.get("entries", {})
+        except (OSError, ValueError, AttributeError):
+            pass
+        return cache
+    
+    @staticmethod
+    def _name(xml_path: Path) -> str:
+        return os.path.normcase(os.path.abspath(xml_path))
+    
+    def get(self, xml_path: Path, options: str, key: str) -> Optional[dict]:
+        entry = self.entries.get(self._name(xml_path), {}).get(options)
+        return entry if entry and entry.get("key") == key else None
+    
+    def put(self, result: CheckResult, options: str, dir_mtimes: dict):
+        """保存检查结果；dir_mtimes 为 references 中各文件夹的修改时间"""
+        dirs = list(dict.fromkeys(directory for *_, ref_dirs in result.references for directory in ref_dirs))
+        index = {directory: i for i, directory in enumerate(dirs)}
+        self.entries.setdefault(self._name(result.path), {})[options] = {
+            "key": result.cache_key,
+            "lines": result.lines,
+            "errors": result.errors,
+            "warnings": result.warnings,
+            "dirs": [[directory, dir_mtimes[directory]] for directory in dirs],
+            "references": [[path, exists, suggestion, [index[directory] for directory in ref_dirs]]
+                           for path, exists, suggestion, ref_dirs in result.references],
+        }
+    
+    def prune(self, folder: Path, xml_files: List[Path]):
+        """删除 folder 中已不存在的 XML 的记录"""
+        prefix = os.path.join(self._name(folder), "")
+        keep = {self._name(xml_file) for xml_file in xml_files}
+        for name in [name for name in self.entries if name.startswith(prefix) and name not in keep]:
+            del self.entries[name]
+    
+    def save(self):
+        """先写入临时文件再替换，中断时不会留下损坏的缓存"""
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".songlist_check_cache.", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({"version": self.VERSION, "entries": self.entries}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
 
 class XMLChecker:
-    def __init__(self, folder_path: str, check_files: bool = True):
+    def __init__(self, folder_path: str, check_files: bool = True, jobs: int = 1, stream: bool = False,
+                 ignore_case: bool = False, cache: Optional[ResultCache] = None):
         self.folder_path = Path(folder_path)
         self.song_folder = self.folder_path.parent / "song"
         self.check_files = check_files
-        self.errors = []
-        self.warnings = []
-        
+        self.jobs = max(1, jobs)
+        self.stream = stream
+        # 所有 XML 共用，同一个歌曲文件夹只列出一次
+        self.dir_cache = DirectoryCache(ignore_case)
+        self.cache = cache
+        # 检查选项不同的结果分别缓存；缓存中的路径与报告一样是相对路径，因此同时记录原样的路径和绝对路径
+        self.cache_options = json.dumps([ResultCache.VERSION, check_files, stream, self.dir_cache.ignore_case,
+                                         str(self.song_folder), os.path.abspath(self.song_folder)])
+    
     def check_all_xml_files(self) -> bool:
-        """检查文件夹内所有 XML 文件"""
-        xml_files = list(self.folder_path.glob("*.xml"))
+        """检查文件夹内所有 XML 文件
+        
+        jobs > 1 时用线程池同时检查多个文件（引用文件的检查主要是等待磁盘或网络），
+        报告始终按文件名顺序输出。
+        """
+        xml_files = sorted(self.folder_path.glob("*.xml"), key=lambda path: path.name)
         
         if not xml_files:
             print(f"❌ 在 {self.folder_path} 中没有找到 XML 文件")
@@ -31,72 +285,186 @@ class XMLChecker:
         print(f"找到 {len(xml_files)} 个 XML 文件\n")
         
         all_valid = True
-        for xml_file in xml_files:
-            print(f"{'='*60}")
-            print(f"检查文件: {xml_file.name}")
-            print(f"{'='*60}")
-            
-            if not self.check_xml_file(xml_file):
-                all_valid = False
-            
-            print()
+        rechecked = 0
+        check = self._check_with_cache if self.cache is not None else self.check_xml_file
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            # map 按提交顺序返回结果，前面的文件检查完就可以先输出
+            for result in executor.map(check, xml_files):
+                if not result.cached:
+                    rechecked += 1
+                # 使用缓存的结果也重新保存，以记下发生变化的文件夹的新修改时间
+                if self.cache is not None and result.cache_key and result.cacheable:
+                    self.cache.put(result, self.cache_options,
+                                   {directory: self.dir_cache.dir_mtime(directory)
+                                    for *_, dirs in result.references for directory in dirs})
+                print(f"{'='*60}")
+                print(f"检查文件: {result.path.name}")
+                print(f"{'='*60}")
+                print(result.report())
+                
+                if not result:
+                    all_valid = False
+                
+                print()
         
+        if self.check_files:
+            print(f"共列出 {self.dir_cache.scan_count} 个文件夹")
+        if self.cache is not None:
+            self.cache.prune(self.folder_path, xml_files)
+            try:
+                self.cache.save()
+            except OSError as e:
+                print(f"⚠️  保存检查结果缓存失败: {e}")
+            print(f"重新检查了 {rechecked} 个文件，{len(xml_files) - rechecked} 个文件没有变化，使用了缓存的结果")
         return all_valid
     
-    def check_xml_file(self, xml_path: Path) -> bool:
-        """检查单个 XML 文件"""
-        self.errors = []
-        self.warnings = []
+    @staticmethod
+    def _content_key(xml_path: Path) -> str:
+        """XML 内容的哈希"""
+        digest = hashlib.blake2b(digest_size=20)
+        with open(xml_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+    
+    def _cached_references(self, entry: dict) -> Optional[list]:
+        """检查缓存的引用文件查找结果是否仍然成立，成立时返回最新的 references，否则返回 None
+        
+        每个文件夹只读取一次修改时间；只有所在文件夹发生变化的引用文件才重新查找。
+        """
+        dirs = [directory for directory, _ in entry["dirs"]]
+        changed = {i for i, (directory, mtime) in enumerate(entry["dirs"])
+                   if self.dir_cache.dir_mtime(directory) != mtime}
+        references = []
+        for path, exists, suggestion, dir_ids in entry["references"]:
+            if changed.isdisjoint(dir_ids):
+                references.append((path, exists, suggestion, [dirs[i] for i in dir_ids]))
+                continue
+            ref_dirs = []
+            if self.dir_cache.find(Path(path), self.song_folder, ref_dirs) != (exists, suggestion):
+                return None
+            references.append((path, exists, suggestion, ref_dirs))
+        return references
+    
+    def _check_with_cache(self, xml_path: Path) -> CheckResult:
+        """XML 没有变化、引用文件的查找结果也没有变化时使用缓存的结果，否则重新检查"""
+        try:
+            key = self._content_key(xml_path)
+        except OSError:
+            return self.check_xml_file(xml_path)
+        
+        entry = self.cache.get(xml_path, self.cache_options, key)
+        references = self._cached_references(entry) if entry is not None else None
+        if references is not None:
+            return CheckResult(Path(xml_path), lines=entry["lines"], errors=entry["errors"],
+                               warnings=entry["warnings"], references=references, cache_key=key, cached=True)
+        
+        result = self.check_xml_file(xml_path)
+        result.cache_key = key
+        return result
+    
+    def check_xml_file(self, xml_path: Path) -> CheckResult:
+        """检查单个 XML 文件，返回检查结果（不修改检查器的状态，可在多个线程中同时调用）"""
+        if self.stream:
+            return self._check_xml_file_streaming(xml_path)
+        
+        result = CheckResult(Path(xml_path))
         
         # 1. 检查 XML 格式
         try:
             tree = ET.parse(xml_path)
             root = tree.getroot()
-            print("✓ XML 格式正确")
+            result.log("✓ XML 格式正确")
         except ET.ParseError as e:
-            self.errors.append(f"XML 解析错误: {e}")
-            self._print_results()
-            return False
+            result.errors.append(f"XML 解析错误: {e}")
+            return result
         except Exception as e:
-            self.errors.append(f"读取文件错误: {e}")
-            self._print_results()
-            return False
+            result.errors.append(f"读取文件错误: {e}")
+            result.cacheable = False
+            return result
         
         # 2. 检查根元素
         if root.tag not in ["SongList", "DanceList"]:
-            self.errors.append(f"根元素应为 'SongList' 或 'DanceList'，当前为 '{root.tag}'")
+            result.errors.append(f"根元素应为 'SongList' 或 'DanceList'，当前为 '{root.tag}'")
         
         # 3. 检查每个 song/dance 元素
         songs = root.findall("song") + root.findall("dance")
         
         if not songs:
-            self.warnings.append("未找到 song 或 dance 元素")
+            result.warnings.append("未找到 song 或 dance 元素")
         else:
-            print(f"✓ 找到 {len(songs)} 个 song/dance 元素")
+            result.log(f"✓ 找到 {len(songs)} 个 song/dance 元素")
         
         for idx, song in enumerate(songs, 1):
             label = song.get("label", f"未命名-{idx}")
-            print(f"\n检查 [{label}]:")
-            self._check_song_element(song, label)
+            result.log(f"\n检查 [{label}]:")
+            self._check_song_element(song, label, result)
         
-        # 输出结果
-        self._print_results()
+        return result
+    
+    def _check_xml_file_streaming(self, xml_path: Path) -> CheckResult:
+        """边解析边检查: 每个 song/dance 元素解析完就检查并释放，内存占用与文件大小无关
+        
+        遇到格式错误时停止，报告错误的行号和列号，之前已检查的元素的错误同样会报告。
+        元素按在文件中出现的顺序检查（整体解析时先检查全部 song 再检查 dance）。
+        报告中不逐项列出通过检查的元素，只列出错误和汇总。
+        """
+        result = CheckResult(Path(xml_path), quiet=True)
+        root = None
+        depth = 0
+        count = 0
+        
+        try:
+            for event, elem in ET.iterparse(xml_path, events=("start", "end")):
+                if event == "start":
+                    depth += 1
+                    if root is None:
+                        root = elem
+                        if root.tag not in ["SongList", "DanceList"]:
+                            result.errors.append(f"根元素应为 'SongList' 或 'DanceList'，当前为 '{root.tag}'")
+                    continue
+                
+                depth -= 1
+                if depth != 1:
+                    continue
+                if elem.tag in ("song", "dance"):
+                    count += 1
+                    label = elem.get("label", f"未命名-{count}")
+                    result.log(f"\n检查 [{label}]:")
+                    self._check_song_element(elem, label, result)
+                # 根元素的子元素处理完即可丢弃
+                root.clear()
+        except ET.ParseError as e:
+            line, column = e.position
+            result.errors.append(f"XML 解析错误 (第 {line} 行, 第 {column} 列): {expat.ErrorString(e.code)}"
+                                 f"，之前的 {count} 个 song/dance 元素已检查")
+            return result
+        except Exception as e:
+            result.errors.append(f"读取文件错误: {e}")
+            result.cacheable = False
+            return result
         
-        return len(self.errors) == 0
+        # 与整体解析时的输出顺序保持一致
+        result.lines.append("✓ XML 格式正确")
+        if count:
+            result.lines.append(f"✓ 检查了 {count} 个 song/dance 元素")
+        else:
+            result.warnings.append("未找到 song 或 dance 元素")
+        return result
     
-    def _check_song_element(self, song_elem: ET.Element, label: str):
+    def _check_song_element(self, song_elem: ET.Element, label: str, result: CheckResult):
         """检查 song 元素及其引用的文件"""
         # 获取 folder 路径
         folder_elem = song_elem.find("folder")
         if folder_elem is None or not folder_elem.text:
-            self.errors.append(f"  [{label}] 缺少 folder 元素或值为空")
+            result.errors.append(f"  [{label}] 缺少 folder 元素或值为空")
             return
         
         folder_path = self.song_folder / folder_elem.text
         
         # 如果不检查文件，只验证 folder 元素存在即可
         if not self.check_files:
-            print(f"  ✓ folder: {folder_elem.text}")
+            result.log(f"  ✓ folder: {folder_elem.text}")
             return
         
         # 需要检查的文件元素列表
@@ -117,20 +485,20 @@ class XMLChecker:
         for elem_name in file_elements:
             elem = song_elem.find(elem_name)
             if elem is not None and elem.text:
-                self._check_file_exists(folder_path, elem.text, elem_name, label, checked_files)
+                self._check_file_exists(folder_path, elem.text, elem_name, label, checked_files, result)
         
         # 检查 maid 元素
         for maid_idx, maid in enumerate(song_elem.findall("maid")):
             slot_no = maid.get("slotNo", str(maid_idx))
-            self._check_maid_element(maid, folder_path, label, slot_no, checked_files)
+            self._check_maid_element(maid, folder_path, label, slot_no, checked_files, result)
         
         # 检查 man 元素
         for man_idx, man in enumerate(song_elem.findall("man")):
             slot_no = man.get("slotNo", str(man_idx))
-            self._check_man_element(man, folder_path, label, slot_no, checked_files)
+            self._check_man_element(man, folder_path, label, slot_no, checked_files, result)
     
     def _check_maid_element(self, maid_elem: ET.Element, folder_path: Path, 
-                           label: str, slot_no: str, checked_files: Set[str]):
+                           label: str, slot_no: str, checked_files: Set[str], result: CheckResult):
         """检查 maid 元素中引用的文件"""
         maid_file_elements = [
             "customAnimation", "morph", "wneMorph", "wneLip", "face", 
@@ -143,10 +511,10 @@ class XMLChecker:
             if elem is not None and elem.text:
                 self._check_file_exists(folder_path, elem.text, 
                                       f"maid[{slot_no}]/{elem_name}", 
-                                      label, checked_files)
+                                      label, checked_files, result)
     
     def _check_man_element(self, man_elem: ET.Element, folder_path: Path,
-                          label: str, slot_no: str, checked_files: Set[str]):
+                          label: str, slot_no: str, checked_files: Set[str], result: CheckResult):
         """检查 man 元素中引用的文件"""
         man_file_elements = ["pose", "move", "bindBone", "chinkoCtrl"]
         
@@ -155,10 +523,10 @@ class XMLChecker:
             if elem is not None and elem.text:
                 self._check_file_exists(folder_path, elem.text,
                                       f"man[{slot_no}]/{elem_name}",
-                                      label, checked_files)
+                                      label, checked_files, result)
     
     def _check_file_exists(self, base_path: Path, filename: str, 
-                          elem_name: str, label: str, checked_files: Set[str]):
+                          elem_name: str, label: str, checked_files: Set[str], result: CheckResult):
         """检查文件是否存在"""
         if not filename:
             return
@@ -171,30 +539,20 @@ class XMLChecker:
             return
         checked_files.add(file_key)
         
-        if not file_path.exists():
-            self.errors.append(f"  [{label}] {elem_name}: 文件不存在 - {file_path}")
+        if self.cache is not None:
+            # 记下查找结果及其依据的文件夹，下次检查时判断能否使用缓存
+            dirs = []
+            exists, suggestion = self.dir_cache.find(file_path, self.song_folder, dirs)
+            result.references.append((file_key, exists, suggestion, dirs))
         else:
-            print(f"  ✓ {elem_name}: {filename}")
-    
-    def _print_results(self):
-        """打印检查结果"""
-        print("\n" + "="*60)
-        
-        if self.warnings:
-            print("⚠️  警告:")
-            for warning in self.warnings:
-                print(f"  {warning}")
-            print()
-        
-        if self.errors:
-            print("❌ 错误:")
-            for error in self.errors:
-                print(f"  {error}")
-            print("\n检查结果: 失败")
+            exists, suggestion = self.dir_cache.find(file_path, self.song_folder)
+        if not exists:
+            message = f"  [{label}] {elem_name}: 文件不存在 - {file_path}"
+            if suggestion:
+                message += f"（是否为 {suggestion}?）"
+            result.errors.append(message)
         else:
-            print("✅ 检查结果: 通过")
-        
-        print("="*60)
+            result.log(f"  ✓ {elem_name}: {filename}")
 
 
 def main():
@@ -213,12 +571,32 @@ def main():
   
   # 或使用短选项
   python xml_checker.py ./config -c
+  
+  # 同时检查 8 个文件（适合网络盘）
+  python xml_checker.py ./config -c --jobs 8
+  
+  # 检查引用的文件时不区分大小写（与游戏所在的 Windows 相同）
+  python xml_checker.py ./config -c --ignore-case
+  
+  # 不使用上次的检查结果，全部重新检查
+  python xml_checker.py ./config -c --no-cache
+  
+  # 逐个元素边解析边检查（适合非常大的 XML）
+  python xml_checker.py ./config -c --stream
         '''
     )
     
     parser.add_argument('folder', help='包含 XML 文件的文件夹路径')
     parser.add_argument('-c', '--check-files', action='store_true',
                        help='检查引用的文件是否存在（默认不检查）')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                       help='同时检查的文件数（默认 CPU 核数），输出顺序不受影响')
+    parser.add_argument('-i', '--ignore-case', action='store_true',
+                       help='检查引用的文件时不区分大小写（Windows 下总是不区分）')
+    parser.add_argument('--no-cache', action='store_true',
+                       help='不使用缓存，全部重新检查（默认跳过 XML 及引用文件的查找结果都没有变化的文件）')
+    parser.add_argument('--stream', action='store_true',
+                       help='边解析边检查，内存占用不随文件大小增长（适合非常大的 XML）')
     
     args = parser.parse_args()
     
@@ -233,7 +611,8 @@ def main():
     print(f"检查模式: {'验证 XML 格式 + 文件存在' if args.check_files else '仅验证 XML 格式'}")
     print()
     
-    checker = XMLChecker(args.folder, check_files=args.check_files)
+    checker = XMLChecker(args.folder, check_files=args.check_files, jobs=args.jobs, stream=args.stream,
+                         ignore_case=args.ignore_case, cache=None if args.no_cache else ResultCache.load())
     success = checker.check_all_xml_files()
     
     sys.exit(0 if success else 1)
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# 内置 .mate/.menu 编解码器与 MeidoSerialization 输出的对照测试
+#
+# tests/fixtures 中每个 MOD 文件旁边放着 MeidoSerialization 对它 convert2json 的结果（文件名加 .json），
+# 内置转换必须逐字节得到同样的 JSON，并能把这份 JSON 逐字节转回原文件。
+# 设置环境变量 MEIDO_SERIALIZATION 为 MeidoSerialization 程序路径时，还会用它重新生成 JSON 检查参考文件本身。
+
+import os
+import glob
+import shutil
+import subprocess
+import importlib.util
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, "tests", "fixtures")
+TOOL_PATH = os.path.join(ROOT, "Script", "COM3D2文件关键词替换GUI工具.py")
+
+
+def _load_tool():
+    """按文件路径加载主程序（文件名不是合法的模块名，不能直接 import）"""
+    spec = importlib.util.spec_from_file_location("com3d2_tool", TOOL_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+tool = _load_tool()
+
+FIXTURE_FILES = sorted(path for path in glob.glob(os.path.join(FIXTURES, "*"))
+                       if tool.NativeCodec.supports(path) and os.path.isfile(f"{path}.json"))
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _file_type(path):
+    return os.path.splitext(path)[1].lstrip('.').lower()
+
+
+def test_fixtures_cover_all_native_types():
+    assert {_file_type(path) for path in FIXTURE_FILES} == set(tool.NativeCodec.FILE_TYPES)
+
+
+@pytest.mark.parametrize("path", FIXTURE_FILES, ids=os.path.basename)
+def test_decode_matches_reference_json(path):
+    expected = _read(f"{path}.json")
+    assert tool.NativeCodec.to_json(_file_type(path), _read(path)).encode('utf-8') == expected
+
+
+@pytest.mark.parametrize("path", FIXTURE_FILES, ids=os.path.basename)
+def test_encode_reference_json_matches_binary(path):
+    text = _read(f"{path}.json").decode('utf-8')
+    assert tool.NativeCodec.from_json(_file_type(path), text) == _read(path)
+
+
+@pytest.mark.skipif(not os.environ.get("MEIDO_SERIALIZATION"), reason="未设置 MEIDO_SERIALIZATION")
+@pytest.mark.parametrize("path", FIXTURE_FILES, ids=os.path.basename)
+def test_reference_json_matches_meido_serialization(path, tmp_path):
+    staged = tmp_path / os.path.basename(path)
+    shutil.copyfile(path, staged)
+    subprocess.run([os.environ["MEIDO_SERIALIZATION"], "convert2json", str(staged)], check=True,
+                   stdout=subprocess.DEVNULL)
+    assert _read(f"{staged}.json") == _read(f"{path}.json")